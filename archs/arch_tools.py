@@ -1,6 +1,721 @@
-import networkx as nx
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 from networkx import Graph
+from stim import Circuit, CircuitInstruction, CircuitRepeatBlock, gate_data, target_rec
+
+from archs.qubit_archs import ArchitectureGraph
+
+__all__ = [
+    "distance_matrix",
+    "interaction_weights",
+    "placement_cost",
+    "place_qubits",
+    "route_circuit",
+    "compile_to_architecture",
+]
+
+# The initial and final temperatures of the annealing, in hops
+_TEMPERATURES = (4.0, 0.01)
+
+# Annotations are moved to the end of their round, with their measurement
+# record targets shifted accordingly
+_ANNOTATIONS = [
+    "DETECTOR",
+    "OBSERVABLE_INCLUDE",
+    "QUBIT_COORDS",
+    "SHIFT_COORDS",
+]
+
+
+def distance_matrix(graph, dtype=np.int16) -> np.ndarray:
+    r"""
+    The all-pairs distances of an architecture graph, see
+    ArchitectureGraph.distances. The nodes of a networkx Graph must be
+    labeled 0 to n - 1, as in the graphs of rotated_qubit_architecture and
+    planar_qubit_architecture, and the graph must be connected.
+
+    :param graph: an ArchitectureGraph or a networkx Graph
+    :param dtype: the integer type of the distances
+
+    :return: an array of shape (n, n)
+    """
+
+    return _architecture(graph).distances.astype(dtype, copy=False)
+
+
+def interaction_weights(circuit: Circuit) -> dict[tuple[int], float]:
+    r"""
+    The number of two-qubit gates between each pair of qubits of a circuit,
+    gates in REPEAT blocks counting once per repetition.
+
+    :param circuit: a stim Circuit
+
+    :return: a dictionary mapping pairs (a, b) with a < b to numbers of gates
+    """
+
+    weights = dict()
+    _add_interactions(circuit, weights, 1)
+
+    return weights
+
+
+def placement_cost(
+    weights: dict[tuple[int], float], placement: np.ndarray, distances: np.ndarray
+) -> float:
+    r"""
+    The routed distance of a placement: the sum over the pairs of interacting
+    qubits of their weight times the number of extra hops between their
+    physical qubits, which is zero when they are neighbours.
+
+    :param weights: a dictionary of interaction_weights
+    :param placement: an array mapping qubits to physical qubits
+    :param distances: the distance_matrix of the architecture
+
+    :return: the cost
+    """
+
+    if not len(weights):
+        return 0.0
+
+    pairs = np.array(list(weights.keys()), dtype=np.int64)
+    values = np.array(list(weights.values()), dtype=float)
+    hops = distances[placement[pairs[:, 0]], placement[pairs[:, 1]]] - 1
+
+    return float(np.dot(values, hops))
+
+
+def place_qubits(
+    circuit: Circuit,
+    graph: ArchitectureGraph | Graph,
+    distances: np.ndarray = None,
+    restarts: int = 4,
+    steps: int = None,
+    workers: int = None,
+    seed: int = None,
+) -> np.ndarray:
+    r"""
+    Places the qubits of a circuit on the physical qubits of an architecture
+    graph, minimizing the placement_cost of the interactions of the circuit.
+    Each restart places the qubits greedily, in breadth-first order of the
+    interactions from a random qubit, each qubit taking the free physical
+    qubit closest to its placed partners, and then anneals the placement by
+    moving qubits next to the physical qubit of one of their partners, or
+    onto a neighbour of their own physical qubit, swapping with the qubit
+    there if it is occupied. The best placement of the restarts is kept.
+
+    If the circuit has QUBIT_COORDS and the architecture has coordinates, the
+    first restart starts instead from the coordinates of the qubits, shifted
+    onto those of the architecture so as to match as many qubits as
+    possible, the other qubits being placed greedily. A circuit laid out on
+    the architecture, such as a surface code on the rotated grid, then keeps
+    its native placement.
+
+    The restarts run across a pool of processes, each seeded independently
+    from seed and the index of the restart, so the result does not depend on
+    the number of workers.
+
+    :param circuit: a stim Circuit
+    :param graph: an ArchitectureGraph, or a networkx Graph with nodes
+        labeled 0 to n - 1
+    :param distances: the distance_matrix of the graph, computed if None
+    :param restarts: the number of restarts
+    :param steps: the number of annealing steps of each restart, by default
+        a thousand per qubit
+    :param workers: the number of worker processes, defaults to the number of
+        cores. With workers=1 the restarts are run in this process.
+    :param seed: an optional seed
+
+    :return: an array mapping each qubit of the circuit to its physical qubit,
+        with -1 for the labels not acted on by the circuit
+    """
+
+    architecture = _architecture(graph)
+    distances = architecture.distances if distances is None else distances
+    neighbours = _neighbour_lists(architecture)
+
+    qubits = _used_qubits(circuit)
+    if len(qubits) > distances.shape[0]:
+        raise ValueError("the circuit has more qubits than the architecture")
+
+    weights = interaction_weights(circuit)
+
+    steps = 1000 * len(qubits) if steps is None else steps
+    workers = os.cpu_count() if workers is None else workers
+    seeds = np.random.SeedSequence(seed).spawn(restarts)
+
+    initial = _coordinate_placement(circuit, qubits, architecture)
+    args = [
+        (qubits, weights, steps, seeds[ii], initial if ii == 0 else None)
+        for ii in range(restarts)
+    ]
+
+    if workers == 1 or restarts == 1:
+        _init_worker(distances, neighbours)
+        results = [_anneal(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, restarts),
+            initializer=_init_worker,
+            initargs=(distances, neighbours),
+        ) as pool:
+            results = list(pool.map(_anneal, *zip(*args)))
+
+    placement = -np.ones(circuit.num_qubits, dtype=np.int64)
+    placement[qubits] = min(results, key=lambda result: result[0])[1]
+
+    return placement
+
+
+def route_circuit(
+    circuit: Circuit,
+    graph: ArchitectureGraph | Graph,
+    placement: np.ndarray,
+    distances: np.ndarray = None,
+) -> tuple[Circuit, dict]:
+    r"""
+    Routes a noiseless, scheduled circuit on an architecture graph. Each qubit
+    is relabeled by its physical qubit, and each two-qubit gate on physical
+    qubits that are not neighbours is made local: the first qubit is swapped
+    along a shortest path towards the second, the gate is applied and the
+    swaps are undone, so the placement is the same after every round. A CX
+    between qubits at distance two, reached by the swaps or from the start,
+    is applied instead as a bridge of four CXs through the qubit in between,
+    whose state is left unchanged.
+
+    The operations of each round, between two TICKs, are rescheduled as soon
+    as their qubits are free, keeping the order of the operations on each
+    qubit and of the measurements, in as many rounds as needed. Annotations
+    are moved to the end of their round with their measurement records
+    shifted, so that detectors and observables are unchanged. If the
+    architecture has coordinates, the QUBIT_COORDS of the circuit are
+    replaced by the coordinates of the physical qubits of the routed circuit,
+    and otherwise their targets are mapped to physical qubits. Noise should
+    be added to the routed circuit, with a NoiseModel.
+
+    :param circuit: a noiseless stim Circuit with rounds separated by TICKs
+    :param graph: an ArchitectureGraph, or a networkx Graph with nodes
+        labeled 0 to n - 1
+    :param placement: an array mapping qubits to physical qubits, see
+        place_qubits
+    :param distances: the distance_matrix of the graph, computed if None
+
+    :return: a tuple (routed, report), the report being a dictionary with
+        the depth (number of TICKs) of the circuit and of the routed circuit,
+        the added depth, the numbers of SWAPs and bridges inserted and the
+        numbers of two-qubit gates of the circuit and of the routed circuit,
+        counting the SWAPs as three CXs
+    """
+
+    architecture = _architecture(graph)
+    distances = architecture.distances if distances is None else distances
+    neighbours = _neighbour_lists(architecture)
+
+    report = {"swaps": 0, "bridges": 0}
+    if architecture.coords is not None:
+        circuit = _without_qubit_coords(circuit)
+    routed = _route_block(circuit, placement, distances, neighbours, report, 1)
+    if architecture.coords is not None:
+        coords = Circuit()
+        for q in _used_qubits(routed):
+            coords.append("QUBIT_COORDS", [int(q)], architecture.coords[q])
+        routed = coords + routed
+
+    report["depth"] = circuit.num_ticks
+    report["routed_depth"] = routed.num_ticks
+    report["added_depth"] = routed.num_ticks - circuit.num_ticks
+    report["two_qubit_gates"] = _two_qubit_gate_count(circuit)
+    report["routed_two_qubit_gates"] = _two_qubit_gate_count(routed)
+
+    return routed, report
+
+
+def compile_to_architecture(
+    circuit: Circuit,
+    graph: ArchitectureGraph | Graph,
+    restarts: int = 4,
+    steps: int = None,
+    workers: int = None,
+    seed: int = None,
+) -> tuple[Circuit, np.ndarray, dict]:
+    r"""
+    Places the qubits of a noiseless, scheduled circuit on an architecture
+    graph with place_qubits and routes it with route_circuit, computing the
+    distance matrix of the graph once.
+
+    :param circuit: a noiseless stim Circuit with rounds separated by TICKs,
+        such as a memory_experiment
+    :param graph: an ArchitectureGraph, or a networkx Graph with nodes
+        labeled 0 to n - 1
+    :param restarts: the number of annealing restarts
+    :param steps: the number of annealing steps of each restart
+    :param workers: the number of worker processes
+    :param seed: an optional seed
+
+    :return: a tuple (routed, placement, report), see route_circuit
+    """
+
+    architecture = _architecture(graph)
+    distances = architecture.distances
+
+    placement = place_qubits(
+        circuit, architecture, distances, restarts, steps, workers=workers, seed=seed
+    )
+    routed, report = route_circuit(circuit, architecture, placement, distances)
+    report["placement_cost"] = placement_cost(
+        interaction_weights(circuit), placement, distances
+    )
+
+    return routed, placement, report
+
+
+def _architecture(graph) -> ArchitectureGraph:
+    if isinstance(graph, ArchitectureGraph):
+        return graph
+    return ArchitectureGraph.from_networkx(graph)
+
+
+def _neighbour_lists(architecture: ArchitectureGraph) -> list[np.ndarray]:
+    return [architecture.neighbours(q) for q in range(architecture.num_qubits)]
+
+
+def _used_qubits(circuit: Circuit) -> np.ndarray:
+    used = set()
+    for op in circuit.flattened():
+        used.update(t.value for t in op.targets_copy() if t.is_qubit_target)
+    return np.array(sorted(used), dtype=np.int64)
+
+
+def _without_qubit_coords(circuit: Circuit) -> Circuit:
+    stripped = Circuit()
+    for op in circuit:
+        if isinstance(op, CircuitRepeatBlock):
+            body = _without_qubit_coords(op.body_copy())
+            stripped.append(CircuitRepeatBlock(op.repeat_count, body))
+        elif op.name != "QUBIT_COORDS":
+            stripped.append(op)
+    return stripped
+
+
+def _add_interactions(circuit: Circuit, weights: dict, multiplier: int) -> None:
+
+    for op in circuit:
+        if isinstance(op, CircuitRepeatBlock):
+            _add_interactions(op.body_copy(), weights, multiplier * op.repeat_count)
+            continue
+
+        if not gate_data(op.name).is_two_qubit_gate:
+            continue
+
+        targets = op.targets_copy()
+        for ii in range(0, len(targets), 2):
+            if targets[ii].is_qubit_target and targets[ii + 1].is_qubit_target:
+                a, b = targets[ii].value, targets[ii + 1].value
+                pair = (min(a, b), max(a, b))
+                weights[pair] = weights.get(pair, 0) + multiplier
+
+
+# The distances and neighbour lists of the architecture, set in each worker
+# process so that they are sent once rather than with every restart
+_ARCHITECTURE = dict()
+
+
+def _init_worker(distances: np.ndarray, neighbours: list[np.ndarray]) -> None:
+    _ARCHITECTURE["distances"] = distances
+    _ARCHITECTURE["neighbours"] = neighbours
+
+
+def _coordinate_placement(
+    circuit: Circuit, qubits: np.ndarray, architecture: ArchitectureGraph
+) -> np.ndarray:
+    # The physical qubits at the QUBIT_COORDS of the qubits, shifted by the
+    # integer translation matching the most qubits, with -1 for the qubits
+    # without a match, or None if there are no coordinates to match
+
+    coords = circuit.get_final_qubit_coordinates()
+    if architecture.coords is None or not len(coords):
+        return None
+
+    known = [ii for ii, q in enumerate(qubits) if len(coords.get(int(q), [])) >= 2]
+    points = np.array([coords[int(qubits[ii])][:2] for ii in known])
+    if not len(known) or not np.allclose(points, np.round(points)):
+        return None
+    points = np.round(points).astype(np.int64)
+
+    arch = architecture.coords
+    low, high = arch.min(axis=0), arch.max(axis=0)
+    grid = -np.ones(high - low + 1, dtype=np.int64)
+    grid[tuple((arch - low).T)] = np.arange(len(arch))
+
+    best, best_hits = None, 0
+    start = low - points.min(axis=0)
+    stop = high - points.max(axis=0)
+    for dx in range(start[0], max(stop[0], start[0]) + 1):
+        for dy in range(start[1], max(stop[1], start[1]) + 1):
+            shifted = points + [dx, dy] - low
+            inside = np.all((shifted >= 0) & (shifted < grid.shape), axis=1)
+            found = -np.ones(len(points), dtype=np.int64)
+            found[inside] = grid[tuple(shifted[inside].T)]
+            hits = np.count_nonzero(found >= 0)
+            if hits > best_hits:
+                best, best_hits = found, hits
+
+    if best is None:
+        return None
+
+    initial = -np.ones(len(qubits), dtype=np.int64)
+    # Qubits sharing coordinates keep the first match
+    taken = set()
+    for ii, phys in zip(known, best):
+        if phys >= 0 and phys not in taken:
+            initial[ii] = phys
+            taken.add(phys)
+
+    return initial
+
+
+def _anneal(
+    qubits: np.ndarray,
+    weights: dict,
+    steps: int,
+    seed: np.random.SeedSequence,
+    initial: np.ndarray = None,
+) -> tuple[float, np.ndarray]:
+    # One restart of place_qubits, on qubits relabeled 0 to len(qubits) - 1,
+    # starting from the physical qubits of initial where they are not -1
+
+    distances = _ARCHITECTURE["distances"]
+    neighbours = _ARCHITECTURE["neighbours"]
+    rng = np.random.default_rng(seed)
+
+    index = {q: ii for ii, q in enumerate(qubits)}
+    n = len(qubits)
+
+    partners = [dict() for _ in range(n)]
+    for (a, b), weight in weights.items():
+        partners[index[a]][index[b]] = weight
+        partners[index[b]][index[a]] = weight
+
+    # Weights normalized to a mean of one, so that the temperatures are in
+    # units of hops
+    mean = np.mean(list(weights.values())) if len(weights) else 1.0
+    partner_arrays = [
+        (
+            np.array(list(p.keys()), dtype=np.int64),
+            np.array(list(p.values()), dtype=float) / mean,
+        )
+        for p in partners
+    ]
+
+    pos = _greedy_placement(partner_arrays, distances, rng, initial)
+    occupant = -np.ones(distances.shape[0], dtype=np.int64)
+    occupant[pos] = np.arange(n)
+
+    def move_cost(a, target, other):
+        # The change of the cost of a moving to target, ignoring the pair of
+        # a with other, whose distance is unchanged by swapping them
+        nbrs, values = partner_arrays[a]
+        mask = nbrs != other
+        nbr_pos = pos[nbrs[mask]]
+        return np.dot(
+            values[mask], distances[target, nbr_pos] - distances[pos[a], nbr_pos]
+        )
+
+    cost = _cost(partner_arrays, pos, distances)
+    best_cost, best_pos = cost, pos.copy()
+
+    movable = np.array([ii for ii in range(n) if len(partner_arrays[ii][0])])
+    temperatures = np.geomspace(_TEMPERATURES[0], _TEMPERATURES[1], max(steps, 1))
+
+    for step in range(steps if len(movable) else 0):
+        a = movable[rng.integers(len(movable))]
+        if rng.random() < 0.5:
+            # Next to a partner
+            nbrs = partner_arrays[a][0]
+            around = neighbours[pos[nbrs[rng.integers(len(nbrs))]]]
+        else:
+            # Swapped with a neighbour, or moved to a free one
+            around = neighbours[pos[a]]
+        target = around[rng.integers(len(around))]
+        if target == pos[a]:
+            continue
+
+        other = occupant[target]
+        delta = move_cost(a, target, other)
+        if other >= 0:
+            delta += move_cost(other, pos[a], a)
+
+        if delta > 0 and rng.random() >= np.exp(-delta / temperatures[step]):
+            continue
+
+        source = pos[a]
+        pos[a] = target
+        occupant[target] = a
+        occupant[source] = other
+        if other >= 0:
+            pos[other] = source
+
+        cost += delta
+        if cost < best_cost - 1e-9:
+            best_cost, best_pos = cost, pos.copy()
+
+    return best_cost, best_pos
+
+
+def _greedy_placement(
+    partner_arrays: list,
+    distances: np.ndarray,
+    rng: np.random.Generator,
+    initial: np.ndarray = None,
+) -> np.ndarray:
+    # Places the qubits in breadth-first order of their interactions from a
+    # random qubit, each on a free physical qubit closest to its placed
+    # partners, ties being broken at random. The qubits placed in initial
+    # keep their physical qubits
+
+    n = len(partner_arrays)
+    nphys = distances.shape[0]
+
+    pos = -np.ones(n, dtype=np.int64) if initial is None else initial.copy()
+    free = np.ones(nphys, dtype=bool)
+    free[pos[pos >= 0]] = False
+
+    center = int(np.argmin(distances.max(axis=1)))
+    order = []
+    seen = np.zeros(n, dtype=bool)
+    for root in rng.permutation(n):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = [root]
+        while len(queue):
+            a = queue.pop(0)
+            order.append(a)
+            for b in rng.permutation(partner_arrays[a][0]):
+                if not seen[b]:
+                    seen[b] = True
+                    queue.append(b)
+
+    for a in order:
+        if pos[a] >= 0:
+            continue
+
+        nbrs, values = partner_arrays[a]
+        placed = pos[nbrs] >= 0
+        if placed.any():
+            score = values[placed] @ distances[pos[nbrs[placed]]].astype(float)
+        else:
+            score = distances[center].astype(float)
+
+        score[~free] = np.inf
+        choices = np.flatnonzero(score == score.min())
+        pos[a] = choices[rng.integers(len(choices))]
+        free[pos[a]] = False
+
+    return pos
+
+
+def _cost(partner_arrays: list, pos: np.ndarray, distances: np.ndarray) -> float:
+    total = 0.0
+    for a, (nbrs, values) in enumerate(partner_arrays):
+        total += np.dot(values, distances[pos[a], pos[nbrs]] - 1)
+    return total / 2
+
+
+def _route_block(
+    circuit: Circuit,
+    placement: np.ndarray,
+    distances: np.ndarray,
+    neighbours: list,
+    report: dict,
+    multiplier: int,
+) -> Circuit:
+    # Routes the rounds of a circuit or of the body of a REPEAT block
+
+    routed = Circuit()
+    layer = []
+
+    for op in circuit:
+        if isinstance(op, CircuitRepeatBlock):
+            _route_layer(
+                routed, layer, placement, distances, neighbours, report, multiplier
+            )
+            layer = []
+            body = _route_block(
+                op.body_copy(),
+                placement,
+                distances,
+                neighbours,
+                report,
+                multiplier * op.repeat_count,
+            )
+            routed.append(CircuitRepeatBlock(op.repeat_count, body))
+            continue
+
+        if op.name == "TICK":
+            _route_layer(
+                routed, layer, placement, distances, neighbours, report, multiplier
+            )
+            layer = []
+            routed.append("TICK")
+            continue
+
+        layer.append(op)
+
+    _route_layer(routed, layer, placement, distances, neighbours, report, multiplier)
+
+    return routed
+
+
+def _route_layer(
+    routed: Circuit,
+    layer: list[CircuitInstruction],
+    placement: np.ndarray,
+    distances: np.ndarray,
+    neighbours: list,
+    report: dict,
+    multiplier: int,
+) -> None:
+    # Expands the operations of a round into local operations on physical
+    # qubits and schedules each as soon as its qubits are free
+
+    if not len(layer):
+        return
+
+    steps = []
+    annotations = []
+    measurements = 0
+
+    for op in layer:
+        gate = gate_data(op.name)
+        targets = op.targets_copy()
+        args = op.gate_args_copy()
+
+        if op.name in _ANNOTATIONS:
+            annotations.append((op, measurements))
+            continue
+
+        if gate.is_two_qubit_gate:
+            for ii in range(0, len(targets), 2):
+                if not (
+                    targets[ii].is_qubit_target and targets[ii + 1].is_qubit_target
+                ):
+                    raise ValueError("classically controlled gates are not supported")
+
+                a = int(placement[targets[ii].value])
+                b = int(placement[targets[ii + 1].value])
+                steps += _local_steps(
+                    op, a, b, args, distances, neighbours, report, multiplier
+                )
+            continue
+
+        for t in targets:
+            if not t.is_qubit_target:
+                raise ValueError("instruction " + op.name + " is not supported")
+
+            qubit = int(placement[t.value])
+            steps.append(
+                (
+                    CircuitInstruction(op.name, [qubit], args, tag=op.tag),
+                    (qubit,),
+                    gate.produces_measurements,
+                )
+            )
+            measurements += gate.produces_measurements
+
+    # As soon as possible, measurements staying in order
+    busy = dict()
+    last_measurement = 0
+    moments = []
+    for instruction, qubits, measures in steps:
+        time = max([busy.get(q, 0) for q in qubits])
+        if measures:
+            time = max(time, last_measurement)
+            last_measurement = time
+
+        for q in qubits:
+            busy[q] = time + 1
+
+        while len(moments) <= time:
+            moments.append([])
+        moments[time].append(instruction)
+
+    for ii, moment in enumerate(moments):
+        if ii:
+            routed.append("TICK")
+        for instruction in moment:
+            routed.append(instruction)
+
+    for op, before in annotations:
+        after = measurements - before
+        targets = [
+            target_rec(t.value - after) if t.is_measurement_record_target else t
+            for t in op.targets_copy()
+        ]
+        if op.name == "QUBIT_COORDS":
+            targets = [int(placement[t.value]) for t in targets]
+        routed.append(CircuitInstruction(op.name, targets, op.gate_args_copy()))
+
+
+def _local_steps(
+    op: CircuitInstruction,
+    a: int,
+    b: int,
+    args: list,
+    distances: np.ndarray,
+    neighbours: list,
+    report: dict,
+    multiplier: int,
+) -> list:
+    # The local operations applying the two-qubit gate of op to the physical
+    # qubits a and b, with SWAPs moving a towards b and back
+
+    bridge = gate_data(op.name).name == "CX" and distances[a, b] >= 2
+    stop = 2 if bridge else 1
+
+    if distances[a, b] > 1 and not gate_data(op.name).is_unitary:
+        raise ValueError("instruction " + op.name + " cannot be routed")
+
+    path = [a]
+    while distances[path[-1], b] > stop:
+        around = neighbours[path[-1]]
+        path.append(int(around[np.argmin(distances[around, b])]))
+
+    swaps = [
+        (CircuitInstruction("SWAP", [p, q]), (p, q), False)
+        for p, q in zip(path[:-1], path[1:])
+    ]
+
+    c = path[-1]
+    if bridge:
+        around = neighbours[c]
+        middle = int(around[np.argmin(distances[around, b])])
+        gates = [
+            (CircuitInstruction("CX", pair), tuple(pair), False)
+            for pair in [[c, middle], [middle, b], [c, middle], [middle, b]]
+        ]
+        report["bridges"] += multiplier
+    else:
+        gates = [(CircuitInstruction(op.name, [c, b], args, tag=op.tag), (c, b), False)]
+
+    report["swaps"] += 2 * len(swaps) * multiplier
+
+    return swaps + gates + swaps[::-1]
+
+
+def _two_qubit_gate_count(circuit: Circuit) -> int:
+    # SWAPs count as three CXs
+
+    count = 0
+    for op in circuit:
+        if isinstance(op, CircuitRepeatBlock):
+            count += op.repeat_count * _two_qubit_gate_count(op.body_copy())
+            continue
+
+        gate = gate_data(op.name)
+        if gate.is_two_qubit_gate and gate.is_unitary:
+            pairs = len(op.targets_copy()) // 2
+            count += 3 * pairs if gate.name == "SWAP" else pairs
 
-"""
-To be filled with tools relevant to qubit architecture classes.
-"""
+    return count
@@ -1,55 +1,419 @@
+import csv
+import json
 import networkx as nx
+import numpy as np
 from networkx import Graph
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
 
 __all__ = [
+    "ArchitectureGraph",
     "rotated_qubit_architecture",
     "planar_qubit_architecture",
     "planar_nbhd",
     "rotated_nbhd",
 ]
 
+# Rows of the distance matrix of an irregular graph computed at once, to bound
+# the float64 buffer of shortest_path
+_DISTANCE_CHUNK = 256
 
-def rotated_qubit_architecture(L1: int, L2: int) -> Graph:
-    r"""
-    Function producing a newtorkx Graph representing the connectivity
-    of a rotated planar architecture.
+# The columns of a CSV calibration snapshot
+_CSV_COLUMNS = ["qubit_a", "qubit_b", "rate"]
 
-    :param L1: An integer
-    :param L2: An integer
 
-    :return:
-    """
+class ArchitectureGraph:
 
-    qubit_architecture = Graph()
+    def __init__(
+        self,
+        num_qubits: int,
+        edges: np.ndarray,
+        coords: np.ndarray = None,
+        lattice: str = None,
+    ) -> None:
+        r"""
+        The connectivity of a qubit architecture, with the qubits labeled 0 to
+        num_qubits - 1, their coordinates in an array and the adjacency in
+        compressed sparse row form, so that the neighbours of a qubit are a
+        slice of an array. Distances are in closed form on the lattices of
+        the planar and rotated constructors, and otherwise the matrix of all
+        the distances is computed by breadth-first search on first use and
+        then looked up.
 
-    qubit_coords = set()
+        Properties of an ArchitectureGraph object:
 
-    for ii in range(2 * L1 - 1):
-        for jj in range(2 * L2 - 1):
-            if ii % 2 == jj % 2:
-                qubit_coords.add((ii, jj))
+        :property num_qubits: The number of qubits.
 
-    q2i = {
-        q: ii for ii, q in enumerate(sorted(qubit_coords, key=lambda v: (v[0], v[1])))
-    }
-    i2q = {v: k for k, v in q2i.items()}
+        :property edges: An array of shape (number of edges, 2) with a < b in
+            each edge (a, b).
 
-    qubit_architecture.add_nodes_from(q2i.values())
+        :property coords: An integer array of shape (num_qubits, 2) with the
+            coordinates of the qubits, or None.
 
-    nx.set_node_attributes(qubit_architecture, i2q, "coords")
+        :property lattice: "planar", "rotated", or None for other graphs.
 
-    for qac in qubit_coords:
-        for qbc in rotated_nbhd(qac[0], qac[1]):
-            if qbc in qubit_coords:
-                qubit_architecture.add_edge(q2i[qac], q2i[qbc])
+        :property indptr: The row pointers of the adjacency.
 
-    return qubit_architecture
+        :property indices: The neighbours of qubit q are
+            indices[indptr[q] : indptr[q + 1]].
 
+        :property qubit_rates: An array with the error rate of each qubit, NaN
+            where it is not set.
 
-def planar_qubit_architecture(L1: int, L2: int) -> Graph:
+        :property coupler_rates: An array with the error rate of the two-qubit
+            gates on each edge, in the order of edges, NaN where it is not set.
+        """
+
+        self.num_qubits = num_qubits
+        self.coords = None if coords is None else np.asarray(coords, dtype=np.int64)
+        self.lattice = lattice
+
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        self.edges = np.sort(edges, axis=1)
+
+        rows = np.concatenate([edges[:, 0], edges[:, 1]])
+        cols = np.concatenate([edges[:, 1], edges[:, 0]])
+        adjacency = csr_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rows, cols)),
+            shape=(num_qubits, num_qubits),
+        )
+        adjacency.sort_indices()
+
+        self.indptr = adjacency.indptr
+        self.indices = adjacency.indices
+
+        # Sorted keys a * num_qubits + b of the edges, in both directions, and
+        # the index of each in edges
+        keys = np.concatenate(
+            [
+                self.edges[:, 0] * num_qubits + self.edges[:, 1],
+                self.edges[:, 1] * num_qubits + self.edges[:, 0],
+            ]
+        )
+        order = np.argsort(keys)
+        self._edge_keys = keys[order]
+        self._edge_ids = np.tile(np.arange(len(self.edges)), 2)[order]
+
+        self.qubit_rates = np.full(num_qubits, np.nan)
+        self.coupler_rates = np.full(len(self.edges), np.nan)
+
+        self._distances = None
+
+    @classmethod
+    def planar(cls, L1: int, L2: int) -> "ArchitectureGraph":
+        r"""
+        The square grid of planar_qubit_architecture, with the qubit at
+        coordinates (ii, jj) labeled ii * L2 + jj.
+
+        :param L1: An integer
+        :param L2: An integer
+
+        :return: an ArchitectureGraph
+        """
+
+        labels = np.arange(L1 * L2).reshape(L1, L2)
+        coords = np.argwhere(np.ones((L1, L2), dtype=bool))
+
+        edges = np.concatenate(
+            [
+                np.stack([labels[:, :-1].ravel(), labels[:, 1:].ravel()], axis=1),
+                np.stack([labels[:-1, :].ravel(), labels[1:, :].ravel()], axis=1),
+            ]
+        )
+
+        return cls(L1 * L2, edges, coords, "planar")
+
+    @classmethod
+    def rotated(cls, L1: int, L2: int) -> "ArchitectureGraph":
+        r"""
+        The diagonal grid of rotated_qubit_architecture, of the coordinates
+        (ii, jj) with ii and jj of the same parity, labeled in lexicographic
+        order of their coordinates.
+
+        :param L1: An integer
+        :param L2: An integer
+
+        :return: an ArchitectureGraph
+        """
+
+        rows, cols = 2 * L1 - 1, 2 * L2 - 1
+        grid = np.add.outer(np.arange(rows), np.arange(cols)) % 2 == 0
+        coords = np.argwhere(grid)
+
+        labels = -np.ones((rows, cols), dtype=np.int64)
+        labels[grid] = np.arange(len(coords))
+
+        edges = []
+        for shift in [1, -1]:
+            src = labels[:-1, max(0, -shift) : cols - max(0, shift)]
+            dst = labels[1:, max(0, shift) : cols - max(0, -shift)]
+            keep = (src >= 0) & (dst >= 0)
+            edges.append(np.stack([src[keep], dst[keep]], axis=1))
+
+        # With a single row or column the diagonal grid is not connected and
+        # its distances are not in closed form
+        lattice = "rotated" if min(rows, cols) > 1 else None
+
+        return cls(len(coords), np.concatenate(edges), coords, lattice)
+
+    @classmethod
+    def from_networkx(cls, graph: Graph) -> "ArchitectureGraph":
+        r"""
+        The ArchitectureGraph of a networkx Graph with nodes labeled 0 to
+        n - 1, with the "coords" attributes of the nodes as coordinates if
+        every node has them.
+
+        :param graph: a networkx Graph
+
+        :return: an ArchitectureGraph
+        """
+
+        n = graph.number_of_nodes()
+        if set(graph.nodes) != set(range(n)):
+            raise ValueError("the nodes of the architecture must be labeled 0 to n - 1")
+
+        coords = nx.get_node_attributes(graph, "coords")
+        coords = [coords[q] for q in range(n)] if len(coords) == n else None
+
+        architecture = cls(n, list(graph.edges), coords)
+
+        qubit_rates = nx.get_node_attributes(graph, "perr")
+        coupler_rates = nx.get_edge_attributes(graph, "perr")
+        architecture.set_rates(
+            qubit_rates, [(a, b, rate) for (a, b), rate in coupler_rates.items()]
+        )
+
+        return architecture
+
+    def to_networkx(self) -> Graph:
+        r"""
+        The networkx Graph of the architecture, with the coordinates of the
+        qubits as their "coords" attributes.
+
+        :return: a networkx Graph
+        """
+
+        graph = Graph()
+        graph.add_nodes_from(range(self.num_qubits))
+
+        if self.coords is not None:
+            nx.set_node_attributes(
+                graph,
+                {q: tuple(int(c) for c in xy) for q, xy in enumerate(self.coords)},
+                "coords",
+            )
+
+        graph.add_edges_from(self.edges.tolist())
+
+        for q in np.flatnonzero(~np.isnan(self.qubit_rates)):
+            graph.nodes[int(q)]["perr"] = float(self.qubit_rates[q])
+        for ii in np.flatnonzero(~np.isnan(self.coupler_rates)):
+            a, b = self.edges[ii]
+            graph.edges[int(a), int(b)]["perr"] = float(self.coupler_rates[ii])
+
+        return graph
+
+    def coupler_index(self, a, b) -> np.ndarray:
+        r"""
+        The index in edges of the edges between qubits.
+
+        :param a: a qubit label or an array of labels
+        :param b: a qubit label or an array of labels, broadcast with a
+
+        :return: the indices, -1 where the qubits are not neighbours
+        """
+
+        keys = np.asarray(a) * self.num_qubits + np.asarray(b)
+        if not len(self._edge_keys):
+            return np.full(keys.shape, -1)
+
+        pos = np.minimum(
+            np.searchsorted(self._edge_keys, keys), len(self._edge_keys) - 1
+        )
+
+        return np.where(self._edge_keys[pos] == keys, self._edge_ids[pos], -1)
+
+    def set_rates(
+        self, qubit_rates: dict[int, float] = None, coupler_rates: list = None
+    ) -> "ArchitectureGraph":
+        r"""
+        Sets the error rates of some qubits and couplers.
+
+        :param qubit_rates: a dictionary mapping qubits to error rates
+        :param coupler_rates: a list of triples (a, b, rate) for the couplers
+            between the neighbours a and b
+
+        :return: the ArchitectureGraph
+        """
+
+        if qubit_rates is not None and len(qubit_rates):
+            qubits = np.array(list(qubit_rates.keys()), dtype=np.int64)
+            self.qubit_rates[qubits] = list(qubit_rates.values())
+
+        if coupler_rates is not None and len(coupler_rates):
+            triples = np.array(coupler_rates, dtype=float).reshape(-1, 3)
+            index = self.coupler_index(
+                triples[:, 0].astype(np.int64), triples[:, 1].astype(np.int64)
+            )
+            if (index < 0).any():
+                raise ValueError("a coupler with an error rate is not an edge")
+            self.coupler_rates[index] = triples[:, 2]
+
+        return self
+
+    def load_rates(self, filename: str) -> "ArchitectureGraph":
+        r"""
+        Sets the error rates of a calibration snapshot, from a CSV or JSON
+        file. A CSV file has a header with the columns qubit_a, qubit_b and
+        rate, each row being the rate of the qubit qubit_a if qubit_b is empty
+        and of the coupler between them otherwise. A JSON file holds an
+        object with the optional entries "qubits", an object mapping qubits to
+        rates, and "couplers", a list of triples [a, b, rate].
+
+        :param filename: the name of a .csv or .json file
+
+        :return: the ArchitectureGraph
+        """
+
+        qubit_rates, coupler_rates = dict(), []
+
+        if filename.endswith(".json"):
+            with open(filename) as file:
+                snapshot = json.load(file)
+            qubit_rates = {
+                int(q): rate for q, rate in snapshot.get("qubits", {}).items()
+            }
+            coupler_rates = [tuple(triple) for triple in snapshot.get("couplers", [])]
+
+        elif filename.endswith(".csv"):
+            with open(filename, newline="") as file:
+                reader = csv.DictReader(file)
+                missing = set(_CSV_COLUMNS) - set(reader.fieldnames or [])
+                if missing:
+                    raise ValueError(
+                        "a CSV calibration snapshot needs the columns "
+                        + ", ".join(_CSV_COLUMNS)
+                        + ", missing "
+                        + ", ".join(sorted(missing))
+                    )
+
+                for row in reader:
+                    a, b = row["qubit_a"].strip(), (row["qubit_b"] or "").strip()
+                    if b:
+                        coupler_rates.append((int(a), int(b), float(row["rate"])))
+                    else:
+                        qubit_rates[int(a)] = float(row["rate"])
+
+        else:
+            raise ValueError("calibration snapshots are .csv or .json files")
+
+        return self.set_rates(qubit_rates, coupler_rates)
+
+    def save_rates(self, filename: str) -> None:
+        r"""
+        Writes the error rates that are set to a calibration snapshot, a CSV or
+        JSON file in the format read by load_rates.
+
+        :param filename: the name of a .csv or .json file
+        """
+
+        qubits = np.flatnonzero(~np.isnan(self.qubit_rates))
+        couplers = np.flatnonzero(~np.isnan(self.coupler_rates))
+
+        qubit_rates = {int(q): float(self.qubit_rates[q]) for q in qubits}
+        coupler_rates = [
+            [int(a), int(b), float(rate)]
+            for (a, b), rate in zip(self.edges[couplers], self.coupler_rates[couplers])
+        ]
+
+        if filename.endswith(".json"):
+            with open(filename, "w") as file:
+                json.dump({"qubits": qubit_rates, "couplers": coupler_rates}, file)
+
+        elif filename.endswith(".csv"):
+            with open(filename, "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(_CSV_COLUMNS)
+                for q, rate in qubit_rates.items():
+                    writer.writerow([q, "", rate])
+                writer.writerows(coupler_rates)
+
+        else:
+            raise ValueError("calibration snapshots are .csv or .json files")
+
+    def neighbours(self, qubit: int) -> np.ndarray:
+        r"""
+        The neighbours of a qubit.
+
+        :param qubit: a qubit label
+
+        :return: a sorted array of qubit labels
+        """
+
+        return self.indices[self.indptr[qubit] : self.indptr[qubit + 1]]
+
+    def distance(self, a, b) -> np.ndarray:
+        r"""
+        The number of edges of the shortest paths between qubits, without
+        computing the matrix of all the distances on the lattices.
+
+        :param a: a qubit label or an array of labels
+        :param b: a qubit label or an array of labels, broadcast with a
+
+        :return: the distances
+        """
+
+        if self.lattice is None:
+            return self.distances[a, b]
+
+        delta = np.abs(self.coords[a] - self.coords[b])
+        if self.lattice == "planar":
+            return delta.sum(axis=-1)
+
+        return delta.max(axis=-1)
+
+    @property
+    def distances(self) -> np.ndarray:
+        r"""
+        The int16 matrix of the distances between all pairs of qubits,
+        computed on first use.
+        """
+
+        if self._distances is None:
+            self._distances = self._distance_matrix()
+
+        return self._distances
+
+    def _distance_matrix(self) -> np.ndarray:
+
+        n = self.num_qubits
+
+        if self.lattice is not None:
+            distances = np.zeros((n, n), dtype=np.int16)
+            for start in range(0, n, _DISTANCE_CHUNK):
+                rows = np.arange(start, min(start + _DISTANCE_CHUNK, n))
+                distances[rows] = self.distance(rows[:, None], np.arange(n)[None, :])
+            return distances
+
+        adjacency = csr_matrix(
+            (np.ones(len(self.indices)), self.indices, self.indptr), shape=(n, n)
+        )
+
+        distances = np.zeros((n, n), dtype=np.int16)
+        for start in range(0, n, _DISTANCE_CHUNK):
+            rows = np.arange(start, min(start + _DISTANCE_CHUNK, n))
+            chunk = shortest_path(adjacency, unweighted=True, indices=rows)
+            if np.isinf(chunk).any():
+                raise ValueError("the architecture graph is not connected")
+            distances[rows] = chunk
+
+        return distances
+
+
+def rotated_qubit_architecture(L1: int, L2: int) -> Graph:
     r"""
     Function producing a newtorkx Graph representing the connectivity
-    of a rotated planar qubit architecture.
+    of a rotated planar architecture, see ArchitectureGraph.rotated.
 
     :param L1: An integer
     :param L2: An integer
@@ -57,24 +421,21 @@ def planar_qubit_architecture(L1: int, L2: int) -> Graph:
     :return:
     """
 
-    qubit_architecture = Graph()
+    return ArchitectureGraph.rotated(L1, L2).to_networkx()
 
-    qubit_coords = set([(ii, jj) for ii in range(L1) for jj in range(L2)])
-    q2i = {
-        q: ii for ii, q in enumerate(sorted(qubit_coords, key=lambda v: (v[0], v[1])))
-    }
-    i2q = {v: k for k, v in q2i.items()}
 
-    qubit_architecture.add_nodes_from(q2i.values())
+def planar_qubit_architecture(L1: int, L2: int) -> Graph:
+    r"""
+    Function producing a newtorkx Graph representing the connectivity
+    of a rotated planar qubit architecture, see ArchitectureGraph.planar.
 
-    nx.set_node_attributes(qubit_architecture, i2q, "coords")
+    :param L1: An integer
+    :param L2: An integer
 
-    for qac in qubit_coords:
-        for qbc in planar_nbhd(qac[0], qac[1]):
-            if qbc in qubit_coords:
-                qubit_architecture.add_edge(q2i[qac], q2i[qbc])
+    :return:
+    """
 
-    return qubit_architecture
+    return ArchitectureGraph.planar(L1, L2).to_networkx()
 
 
 def planar_nbhd(xcoord: int, ycoord: int) -> list[tuple[int, int]]:
@@ -1,4 +1,16 @@
 from .circuit_tools import *
+from .noise_models import *
+from .noise_sweeps import *
+from .memory_circuits import *
+from .results_store import *
+from .monte_carlo import *
+from .gate_sequences import *
 from .qulacs_circuits import *
+from .moment_circuits import *
 from .stim_circuits import *
+from .stabilizer_sequences import *
 from .steane_injection import *
+from .injection_runs import *
+from .subset_sampling import *
+from .tiled_circuits import *
+from .code_capacity import *
@@ -1,9 +1,23 @@
+import heapq
+import math
+import warnings
+import numpy as np
+from itertools import permutations
+from stim import DetectorErrorModel
 from datetime import datetime
 
 __all__ = [
     "file_tagger",
     "repetition_encoding_schedule",
     "repetition_measurement_schedule",
+    "steane_encoding_schedule",
+    "steane_decoding_schedule",
+    "steane_plus_schedule",
+    "steane_zero_schedule",
+    "edge_coloring",
+    "syndrome_schedule",
+    "validate_syndrome_schedule",
+    "FlagSchedule",
 ]
 
 
@@ -23,14 +37,19 @@ def file_tagger(filename: str) -> str:
     return filename
 
 
-def repetition_encoding_schedule(block: list[int]) -> list[list[tuple[int]]]:
+def repetition_encoding_schedule(
+    block: list[int], flag: int = None
+) -> list[list[tuple[int]]]:
     r"""
     Method for producing a scheduling of CNOT gates
     in the encoding circuit as a sequence of lists
     of tuples representing the rounds of the
-    schedule.
+    schedule. With a flag qubit, the flag is coupled to
+    the middle and the last qubit of the block so that
+    it detects the faults spreading to half the block.
 
     :param block:
+    :param flag: the label of an optional flag qubit
 
     :return:
     """
@@ -52,6 +71,14 @@ def repetition_encoding_schedule(block: list[int]) -> list[list[tuple[int]]]:
     if n % 2:
         schedule.append([(second_half[-2], second_half[-1])])
 
+    if flag is not None:
+        if n % 2:
+            schedule[-1].append((block[mark - 1], flag))
+        else:
+            schedule.append([(block[mark - 1], flag)])
+
+        schedule.append([(block[-1], flag)])
+
     return schedule
 
 
@@ -89,3 +116,771 @@ def repetition_measurement_schedule(block: list[int]) -> list[list[tuple[int]]]:
     schedule.append(finalround)
 
     return schedule
+
+
+# The CNOT rounds of the Steane code circuits, on the positions 0 to 6 of a
+# block and 7 for the flag qubit, following FIG. 3 for the encoder and
+# Paetznick and Reichardt arXiv:1106.2190 for the state preparations
+_STEANE_ENCODING = [
+    [(0, 6), (3, 4)],
+    [(0, 5), (1, 4), (3, 6)],
+    [(1, 0), (2, 4), (3, 5)],
+    [(2, 0), (1, 5)],
+    [(2, 6)],
+]
+
+_STEANE_DECODING = [
+    [(1, 5), (2, 6)],
+    [(2, 0), (3, 5)],
+    [(1, 0), (2, 4), (3, 6)],
+    [(1, 4), (0, 5)],
+    [(0, 6), (3, 4)],
+]
+
+_STEANE_PLUS = [
+    [(0, 1), (5, 3), (6, 2)],
+    [(4, 1), (0, 2), (6, 3)],
+    [(5, 1), (4, 6)],
+]
+
+_STEANE_PLUS_FLAG = [[(7, 0)], [(7, 5)], [(7, 6)]]
+
+_STEANE_ZERO = [
+    [(1, 0), (3, 5), (2, 6)],
+    [(4, 1), (2, 0), (3, 6)],
+    [(1, 5), (6, 4)],
+]
+
+_STEANE_ZERO_FLAG = [[(0, 7)], [(5, 7)], [(6, 7)]]
+
+
+def _label_schedule(schedule: list, labels: list[int]) -> list[list[tuple[int]]]:
+    return [[(labels[a], labels[b]) for a, b in round] for round in schedule]
+
+
+def steane_encoding_schedule(block: list[int]) -> list[list[tuple[int]]]:
+    r"""
+    Method for producing the scheduling of CNOT gates
+    in the Steane encoding circuit, which encodes the
+    state of block[0] once block[1:4] are in |+> and
+    block[4:] in |0>.
+
+    :param block: list of the seven qubits of the block
+
+    :return:
+    """
+
+    assert len(block) == 7
+
+    return _label_schedule(_STEANE_ENCODING, block)
+
+
+def steane_decoding_schedule(block: list[int]) -> list[list[tuple[int]]]:
+    r"""
+    Method for producing the scheduling of CNOT gates
+    in the Steane decoding circuit, the inverse of the
+    encoding circuit up to the Hadamard gates on block[1:4].
+
+    :param block: list of the seven qubits of the block
+
+    :return:
+    """
+
+    assert len(block) == 7
+
+    return _label_schedule(_STEANE_DECODING, block)
+
+
+def steane_plus_schedule(block: list[int], flag: int = None) -> list[list[tuple[int]]]:
+    r"""
+    Method for producing the scheduling of CNOT gates
+    preparing the logical |+> state of the Steane code
+    once block[0] and block[4:] are in |+> and block[1:4]
+    in |0>. With a flag qubit in |+>, three more rounds
+    couple it to block[0], block[5] and block[6] to verify
+    the preparation.
+
+    :param block: list of the seven qubits of the block
+    :param flag: the label of an optional flag qubit
+
+    :return:
+    """
+
+    assert len(block) == 7
+
+    if flag is None:
+        return _label_schedule(_STEANE_PLUS, block)
+
+    return _label_schedule(_STEANE_PLUS + _STEANE_PLUS_FLAG, list(block) + [flag])
+
+
+def steane_zero_schedule(block: list[int], flag: int = None) -> list[list[tuple[int]]]:
+    r"""
+    Method for producing the scheduling of CNOT gates
+    preparing the logical |0> state of the Steane code
+    once block[0] and block[4:] are in |0> and block[1:4]
+    in |+>. With a flag qubit in |0>, three more rounds
+    couple block[0], block[5] and block[6] to it to verify
+    the preparation.
+
+    :param block: list of the seven qubits of the block
+    :param flag: the label of an optional flag qubit
+
+    :return:
+    """
+
+    assert len(block) == 7
+
+    if flag is None:
+        return _label_schedule(_STEANE_ZERO, block)
+
+    return _label_schedule(_STEANE_ZERO + _STEANE_ZERO_FLAG, list(block) + [flag])
+
+
+def edge_coloring(edges: list[tuple[int]]) -> list[int]:
+    r"""
+    Colors the edges of a bipartite graph so that the edges at each node have
+    distinct colors, using as many colors as the largest degree, which is the
+    fewest possible (Konig's theorem). Each edge takes a color free at both of
+    its ends, after swapping the two colors along an alternating path if
+    needed.
+
+    :param edges: a list of pairs (u, v) with u and v in the two parts of the
+        graph, labeled so that no label is used in both parts
+
+    :return: a list with the color of each edge, from 0 to the largest degree - 1
+    """
+
+    degree = dict()
+    for u, v in edges:
+        degree[u] = degree.get(u, 0) + 1
+        degree[v] = degree.get(v, 0) + 1
+
+    ncolors = max(degree.values()) if len(degree) else 0
+
+    # at[node][color] is the node at the other end of the edge of that color
+    at = {node: dict() for node in degree}
+
+    def free(node):
+        for color in range(ncolors):
+            if color not in at[node]:
+                return color
+
+    for u, v in edges:
+        a = free(u)
+        b = free(v)
+
+        if a not in at[v]:
+            b = a
+        else:
+            # Swap a and b along the path from v alternating between them,
+            # which cannot reach u in a bipartite graph, so that a is free at v
+            path = [v]
+            color = a
+            while color in at[path[-1]]:
+                path.append(at[path[-1]][color])
+                color = b if color == a else a
+
+            for ii in range(len(path) - 1):
+                color = a if ii % 2 == 0 else b
+                del at[path[ii]][color]
+                del at[path[ii + 1]][color]
+            for ii in range(len(path) - 1):
+                color = b if ii % 2 == 0 else a
+                at[path[ii]][color] = path[ii + 1]
+                at[path[ii + 1]][color] = path[ii]
+
+            b = a
+
+        at[u][b] = v
+        at[v][b] = u
+
+    return [_edge_color(at, u, v) for u, v in edges]
+
+
+def syndrome_schedule(
+    code,
+    ancillas: dict[bool, list[int]] = None,
+    interleave=True,
+    tries: int = 200,
+    seed: int = 0,
+) -> list[list[tuple[int]]]:
+    r"""
+    Schedules the CNOTs measuring every check of a cssCode with one ancilla
+    per check, as rounds of CNOTs on distinct qubits. Z-checks are measured
+    with CNOTs (data, ancilla) and X-checks with CNOTs (ancilla, data).
+
+    With interleave, the X- and Z-checks are measured together in as many
+    rounds as the largest number of CNOTs on a qubit, the fewest possible.
+    The X- and Z-checks sharing qubits are then only measured correctly if
+    on an even number of their shared qubits the X-check acts first. Candidate
+    schedules start from the CNOTs of each check in the order of its qubit
+    labels, which follows the geometry of lattice codes, with the orders of
+    the Z-checks permuted, and from an edge coloring of the Tanner graph of all
+    the checks, see edge_coloring. The candidates closest to correct are
+    repaired by rescheduling, one check at a time, the checks that share a
+    round on a qubit or do not commute.
+
+    Among the correct schedules, the one whose hook errors lower the distance
+    the least is kept: a fault on the ancilla of a check after its j-th CNOT
+    spreads to the qubits of its later CNOTs, and the distance with these
+    hooks is that of the graphlike errors of the code with a single-qubit
+    error on each qubit and an error for each hook. If no interleaved schedule
+    is correct, or one measuring the Z-checks in the rounds of an edge
+    coloring of their Tanner graph and then the X-checks in those of theirs
+    loses less distance, the latter is used, with the rounds of each type
+    ordered to lose the least distance. A warning is issued when the schedule
+    has more rounds than the largest number of CNOTs on a qubit.
+
+    :param code: a cssCode
+    :param ancillas: a dictionary mapping True (False) to the ancilla of each
+        Z-check (X-check), by default labeled after the data qubits, first for
+        the Z-checks and then for the X-checks, as in memory_experiment
+    :param interleave: A boolean indicating if X- and Z-checks may share rounds
+    :param tries: the number of orders of the rounds tried
+    :param seed: the seed of the orders tried
+
+    :return: a list of rounds, each a list of pairs (control, target)
+    """
+
+    if ancillas is None:
+        offset = max(code.qubits) + 1
+        nz = len(code.check_dict[True])
+        ancillas = {
+            True: [offset + label for label in range(nz)],
+            False: [
+                offset + nz + label for label in range(len(code.check_dict[False]))
+            ],
+        }
+
+    edges = {
+        sector: [
+            (q, ancillas[sector][label])
+            for label, check in code.check_dict[sector].items()
+            for q in sorted(check)
+        ]
+        for sector in [True, False]
+    }
+
+    degree = dict()
+    for q, anc in edges[True] + edges[False]:
+        degree[q] = degree.get(q, 0) + 1
+        degree[anc] = degree.get(anc, 0) + 1
+    depth = max(degree.values()) if len(degree) else 0
+
+    rng = np.random.default_rng(seed)
+    bound = _hook_distances(code, edges, None)
+
+    best, best_distances = None, None
+    if interleave:
+        for times in _interleaved_times(code, edges, depth, tries, rng):
+            distances = _hook_distances(code, edges, times)
+            if best is None or _better(distances, best_distances):
+                best, best_distances = times, distances
+            if best_distances == bound:
+                break
+
+    if best_distances != bound:
+        times, distances = _split_times(code, edges, tries, rng)
+        if best is None or _better(distances, best_distances):
+            best, best_distances = times, distances
+
+    schedule = [[] for _ in range(max(best) + 1)]
+    for ii, (q, anc) in enumerate(edges[True] + edges[False]):
+        schedule[best[ii]].append((q, anc) if ii < len(edges[True]) else (anc, q))
+    schedule = [round for round in schedule if len(round)]
+
+    if len(schedule) > depth:
+        warnings.warn(
+            f"the syndrome schedule has {len(schedule)} rounds, more than the "
+            f"{depth} CNOTs on the busiest qubit"
+        )
+
+    return schedule
+
+
+def validate_syndrome_schedule(
+    code, schedule: list[list[tuple[int]]], ancillas: dict[bool, list[int]]
+) -> None:
+    r"""
+    Checks that a schedule measures every check of a cssCode correctly: every
+    CNOT of each check appears once, no qubit is in two CNOTs of a round, and
+    each pair of X- and Z-checks sharing qubits has an even number of shared
+    qubits on which the X-check acts first.
+
+    :param code: a cssCode
+    :param schedule: a list of rounds, each a list of pairs (control, target)
+    :param ancillas: a dictionary mapping True (False) to the ancilla of each
+        Z-check (X-check)
+
+    :raises ValueError: if the schedule is not correct
+    """
+
+    when = dict()
+    for rnd, round in enumerate(schedule):
+        busy = set()
+        for pair in round:
+            if not busy.isdisjoint(pair):
+                raise ValueError("round " + str(rnd) + " acts twice on a qubit")
+            if tuple(pair) in when:
+                raise ValueError("a CNOT is scheduled twice")
+            busy.update(pair)
+            when[tuple(pair)] = rnd
+
+    for sector in [True, False]:
+        for label, check in code.check_dict[sector].items():
+            anc = ancillas[sector][label]
+            for q in check:
+                if ((q, anc) if sector else (anc, q)) not in when:
+                    raise ValueError("a CNOT of a check is not scheduled")
+
+    expected = sum(
+        len(check) for sector in [True, False] for check in code.code[sector]
+    )
+    if len(when) != expected:
+        raise ValueError("the schedule has CNOTs that are not in a check")
+
+    for zlabel, zcheck in code.check_dict[True].items():
+        zanc = ancillas[True][zlabel]
+        for xlabel in set().union(*[code.qubit_dict[q][False] for q in zcheck]):
+            xanc = ancillas[False][xlabel]
+            shared = zcheck & code.check_dict[False][xlabel]
+            xfirst = sum(when[(xanc, q)] < when[(q, zanc)] for q in shared)
+            if xfirst % 2:
+                raise ValueError("the X- and Z-checks sharing qubits do not commute")
+
+
+class FlagSchedule:
+
+    def __init__(
+        self,
+        code,
+        schedule: list[list[tuple[int]]],
+        ancillas: dict[bool, list[int]],
+        flag_offset: int,
+        hook_weight: int = 2,
+    ) -> None:
+        r"""
+        Flag gadgets added to a schedule measuring the checks of a cssCode, so
+        that every hook error of weight at least hook_weight is flagged. A
+        fault on the ancilla of a check of weight w after its j-th CNOT spreads
+        to the qubits of its later CNOTs, which up to the check is an error of
+        weight min(j, w - j). A single flag catches all of the hooks of a check
+        when its two CNOTs with the ancilla enclose the CNOTs j with
+        hook_weight <= j <= w - hook_weight + 1, the flag closing after the
+        first CNOT past the hooks since a fault at its own closing CNOT is not
+        caught. Only the checks with such hooks are flagged, with one flag
+        each, and the CNOTs of the flag are
+        placed as close together as possible, inserting rounds only where two
+        CNOTs of the check are in consecutive rounds.
+
+        The flag of a Z-check is prepared in the X basis and acts as the
+        control of CNOTs (flag, ancilla), and that of an X-check is prepared in
+        the Z basis and acts as the target of CNOTs (ancilla, flag). The flag
+        is measured in the basis it was prepared in, with a zero outcome
+        unless a fault occurred between its CNOTs. A flag is prepared in the
+        round before its first CNOT and measured in the round after its last,
+        and the flag qubits are reused by the checks whose flags are not in use
+        at the same time, so that there are as few flag qubits as flags in use
+        at once. The preparations before the first round and the measurements
+        after the last are those of the ancillas, between two syndrome rounds.
+
+        Properties of a FlagSchedule object:
+
+        :property base: The schedule without flags.
+
+        :property rounds: The schedule with the CNOTs of the flags, a list of
+            rounds, each a list of pairs (control, target).
+
+        :property flags: A dictionary mapping the pairs (sector, label) of the
+            flagged checks to their flag qubit.
+
+        :property windows: A dictionary mapping the flagged checks to the rounds
+            of the two CNOTs of their flag.
+
+        :property resets: A list with, for each round, the flagged checks whose
+            flag is prepared during the round. The last entry, at index
+            len(rounds), holds the flags prepared with the ancillas.
+
+        :property measurements: A list with, for each round, the flagged checks
+            whose flag is measured during the round. The last entry holds the
+            flags measured with the ancillas.
+
+        :property flag_qubits: The sorted list of flag qubits.
+        """
+
+        self.base = schedule
+
+        when = dict()
+        for rnd, round in enumerate(schedule):
+            for pair in round:
+                when[tuple(pair)] = rnd
+
+        # Times 2r are the rounds of the schedule and 2r + 1 inserted rounds
+        windows = dict()
+        for sector in [True, False]:
+            for label, check in code.check_dict[sector].items():
+                anc = ancillas[sector][label]
+                times = sorted(when[(q, anc) if sector else (anc, q)] for q in check)
+
+                first = hook_weight - 1
+                last = len(times) - hook_weight - 1
+                if first > last:
+                    continue
+
+                # With hook_weight 1 the flag encloses the first CNOT, and its
+                # own first CNOT is before the first round if there is no round
+                # free before it
+                before = times[first - 1] if first > 0 else -1
+                # The flag is closed after the CNOT following the hooks, so
+                # that a fault at its own CNOT spreads to fewer qubits than
+                # hook_weight, in the last round or an inserted round if the
+                # ancilla has no later CNOT
+                after = times[last + 2] if last + 2 < len(times) else len(schedule)
+                windows[(sector, label)] = (
+                    _flag_time(before, times[first]),
+                    _flag_time(times[last + 1], after),
+                )
+
+        times = sorted(
+            set(2 * rnd for rnd in range(len(schedule))).union(
+                *[set(window) for window in windows.values()]
+            )
+        )
+        layer = {time: ii for ii, time in enumerate(times)}
+
+        self.windows = {
+            key: (layer[start], layer[stop]) for key, (start, stop) in windows.items()
+        }
+
+        self.flags = self._assign(self.windows, flag_offset)
+        self.flag_qubits = sorted(set(self.flags.values()))
+
+        self.rounds = [[] for _ in times]
+        for rnd, round in enumerate(schedule):
+            self.rounds[layer[2 * rnd]] += [tuple(pair) for pair in round]
+
+        self.resets = [[] for _ in range(len(times) + 1)]
+        self.measurements = [[] for _ in range(len(times) + 1)]
+
+        for (sector, label), (start, stop) in self.windows.items():
+            anc = ancillas[sector][label]
+            flag = self.flags[(sector, label)]
+            pair = (flag, anc) if sector else (anc, flag)
+            self.rounds[start].append(pair)
+            self.rounds[stop].append(pair)
+            # A flag whose first CNOT is in the first round is prepared with
+            # the ancillas, in the last entry
+            self.resets[start - 1].append((sector, label))
+            self.measurements[stop + 1].append((sector, label))
+
+    @staticmethod
+    def _assign(windows: dict, flag_offset: int) -> dict:
+        # Flag qubits for the windows, each flag being in use from the round
+        # before its first CNOT to the round after its last, reusing the first
+        # qubit freed by a measurement no later than the preparation
+
+        free, flags = [], dict()
+        nflags = 0
+        for key, (start, stop) in sorted(windows.items(), key=lambda kv: kv[1]):
+            if len(free) and free[0][0] <= start - 1:
+                _, flag = heapq.heappop(free)
+            else:
+                flag = flag_offset + nflags
+                nflags += 1
+
+            flags[key] = flag
+            heapq.heappush(free, (stop + 1, flag))
+
+        return flags
+
+
+def _flag_time(before: int, after: int) -> int:
+    # The time of a flag CNOT between the rounds of two CNOTs of a check, the
+    # last round in between if there is one, and an inserted round otherwise
+
+    if after - before >= 2:
+        return 2 * (after - 1)
+
+    return 2 * before + 1
+
+
+def _edge_color(at: dict, u: int, v: int) -> int:
+    for color, node in at[u].items():
+        if node == v:
+            return color
+
+
+def _better(distances: tuple, other: tuple) -> bool:
+    # Hook distances compared by their smallest value and then their sum
+    return (min(distances), sum(distances)) > (min(other), sum(other))
+
+
+def _hook_distances(code, edges: dict, times: list) -> tuple:
+    # The distances of the Z and X errors with the hooks of the Z-checks and
+    # X-checks at the times of the edges, or without hooks if times is None
+
+    nz = len(edges[True])
+    return (
+        _hook_distance(code, edges, True, None if times is None else times[:nz]),
+        _hook_distance(code, edges, False, None if times is None else times[nz:]),
+    )
+
+
+def _hook_distance(code, edges: dict, sector: bool, times: list) -> int:
+    # The smallest number of graphlike errors flipping a logical, with an error
+    # on each qubit and one for each hook of the checks of the sector at the
+    # times of their edges. Z-check hooks are Z errors, detected by the
+    # X-checks and flipping the X logicals, and X-check hooks X errors.
+
+    other = not sector
+    logicals = code.xlogicals if sector else code.zlogicals
+
+    errors = [[q] for q in sorted(code.qubits)]
+    if times is not None:
+        checks = dict()
+        for (q, anc), time in zip(edges[sector], times):
+            checks.setdefault(anc, []).append((time, q))
+        for cnots in checks.values():
+            qubits = [q for _, q in sorted(cnots)]
+            errors += [qubits[jj:] for jj in range(1, len(qubits) - 1)]
+
+    lines = []
+    for error in errors:
+        dets, obs = set(), set()
+        for q in error:
+            dets ^= code.qubit_dict[q][other]
+            obs ^= set(ll for ll, logical in enumerate(logicals) if q in logical)
+        if len(dets) or len(obs):
+            targets = ["D" + str(d) for d in sorted(dets)]
+            targets += ["L" + str(ll) for ll in sorted(obs)]
+            lines.append("error(0.1) " + " ".join(targets))
+
+    try:
+        dem = DetectorErrorModel("\n".join(lines))
+        return len(dem.shortest_graphlike_error(ignore_ungraphlike_errors=True))
+    except ValueError:
+        # No graphlike error flips a logical
+        return len(code.qubits)
+
+
+def _orders(n: int, tries: int, rng: np.random.Generator) -> list:
+    # Orders of n rounds to try: all of them if there are at most tries,
+    # otherwise the identity, its reverse and random ones
+
+    if math.factorial(n) <= tries:
+        return [np.array(order) for order in permutations(range(n))]
+
+    orders = [np.arange(n), np.arange(n)[::-1]]
+    return orders + [rng.permutation(n) for _ in range(max(tries - 2, 0))]
+
+
+def _split_times(code, edges: dict, tries: int, rng: np.random.Generator):
+    # The Z-checks in the rounds of an edge coloring of their Tanner graph and
+    # then the X-checks in those of theirs, with the rounds of each type in
+    # the order losing the least distance to hooks
+
+    times, distances = [], []
+    offset = 0
+    for sector in [True, False]:
+        colors = np.array(edge_coloring(edges[sector]), dtype=np.int64)
+        ncolors = int(colors.max()) + 1 if len(colors) else 0
+
+        best, best_distance = None, None
+        for order in _orders(ncolors, tries, rng):
+            sector_times = (offset + order[colors]).tolist()
+            distance = _hook_distance(code, edges, sector, sector_times)
+            if best is None or distance > best_distance:
+                best, best_distance = sector_times, distance
+
+        times += best
+        distances.append(best_distance)
+        offset += ncolors
+
+    return times, tuple(distances)
+
+
+def _interleaved_times(
+    code, edges: dict, depth: int, tries: int, rng: np.random.Generator
+):
+    # Correct interleaved schedules in depth rounds, as the time of each edge,
+    # repaired from the candidates that are closest to correct
+
+    tanner = _TannerGraph(edges)
+    if depth < max(len(cnots) for cnots in tanner.check_edges):
+        return
+
+    # The CNOTs of each check in the order of its qubit labels, with the Z-checks
+    # in permuted orders, and an edge coloring
+    ranks = tanner.ranks
+    is_z = np.arange(len(ranks)) < len(edges[True])
+    candidates = [
+        np.where(is_z, order[ranks], ranks) for order in _orders(depth, tries, rng)
+    ]
+    candidates.append(np.array(edge_coloring(edges[True] + edges[False])))
+
+    # The repairs are random, so the candidates within twice the fewest
+    # conflicts are repaired in turn several times
+    costs = np.array([tanner.cost(times) for times in candidates])
+    closest = np.flatnonzero(costs <= 2 * costs.min())
+    closest = closest[np.argsort(costs[closest], kind="stable")]
+
+    # On periodic codes, such as the toric code, the order of the qubit labels
+    # breaks at the boundary and repairs fail more often, so they go on up to
+    # _MAX_REPAIRS times until one succeeds
+    found = False
+    for attempt in range(_MAX_REPAIRS):
+        if found and attempt >= _REPAIRS:
+            return
+
+        times = candidates[closest[attempt % len(closest)]].tolist()
+        times = tanner.repair(times, depth, rng)
+        if times is not None:
+            found = True
+            yield times
+
+
+# The number of repairs of candidate interleaved schedules, and the largest
+# number while none of them has succeeded
+_REPAIRS = 8
+_MAX_REPAIRS = 32
+
+# The largest number of orders of the CNOTs of a check tried when repairing
+_MAX_OPTIONS = 720
+
+
+class _TannerGraph:
+
+    def __init__(self, edges: dict) -> None:
+        # The edges of all checks, Z-checks first, with the edges of each check,
+        # the edges on each qubit, and the pairs of an X- and a Z-check sharing
+        # qubits, each a list of pairs of edges (X-check edge, Z-check edge)
+
+        self.check_edges = []
+        self.qubit_edges = dict()
+        self.edge_check = []
+        self.ranks = []
+
+        check_index = dict()
+        for sector in [True, False]:
+            for q, anc in edges[sector]:
+                if anc not in check_index:
+                    check_index[anc] = len(self.check_edges)
+                    self.check_edges.append([])
+                ci = check_index[anc]
+
+                self.ranks.append(len(self.check_edges[ci]))
+                self.edge_check.append(ci)
+                self.check_edges[ci].append(len(self.edge_check) - 1)
+                self.qubit_edges.setdefault(q, []).append(len(self.edge_check) - 1)
+
+        self.ranks = np.array(self.ranks, dtype=np.int64)
+        self.edge_qubit = [q for sector in [True, False] for q, _ in edges[sector]]
+
+        nz = len(edges[True])
+        pairs = dict()
+        for on in self.qubit_edges.values():
+            for ze in on:
+                for xe in on:
+                    if ze < nz <= xe:
+                        key = (self.edge_check[ze], self.edge_check[xe])
+                        pairs.setdefault(key, []).append((xe, ze))
+
+        self.pairs = list(pairs.values())
+        self.check_pairs = [[] for _ in self.check_edges]
+        for ii, key in enumerate(pairs):
+            self.check_pairs[key[0]].append(ii)
+            self.check_pairs[key[1]].append(ii)
+
+    def cost(self, times) -> int:
+        # The number of edges sharing a round on a qubit and of pairs of checks
+        # that do not commute
+
+        clashes = 0
+        for on in self.qubit_edges.values():
+            rounds = [times[e] for e in on]
+            clashes += len(rounds) - len(set(rounds))
+
+        odd = sum(self._odd(times, pair) for pair in self.pairs)
+
+        return clashes + odd
+
+    def repair(self, times: list, depth: int, rng: np.random.Generator):
+        # Reschedules a random check among the smallest of those in conflict to
+        # the order of its CNOTs with the fewest conflicts, until there are
+        # none or after a number of steps proportional to the number of checks
+
+        options = dict()
+        conflicted = set(
+            ci for ci in range(len(self.check_edges)) if self._check_cost(times, ci)
+        )
+
+        for _ in range(2 * len(self.check_edges) + 100):
+            if not len(conflicted):
+                return times
+
+            # Checks with fewer CNOTs have more free rounds and fewer hooks
+            fewest = min(len(self.check_edges[cj]) for cj in conflicted)
+            pool = sorted(
+                cj for cj in conflicted if len(self.check_edges[cj]) == fewest
+            )
+            ci = pool[int(rng.integers(len(pool)))]
+            cnots = self.check_edges[ci]
+
+            if len(cnots) not in options:
+                options[len(cnots)] = None
+                if math.perm(depth, len(cnots)) <= _MAX_OPTIONS:
+                    options[len(cnots)] = list(permutations(range(depth), len(cnots)))
+
+            # Checks with too many orders try a random sample of them
+            choices = options[len(cnots)]
+            if choices is None:
+                choices = [
+                    tuple(rng.permutation(depth)[: len(cnots)].tolist())
+                    for _ in range(_MAX_OPTIONS)
+                ]
+
+            # Among the orders with the fewest conflicts, those moving the
+            # fewest CNOTs, so that the orders of correct checks are kept
+            current = [times[e] for e in cnots]
+            costs = []
+            for option in choices:
+                for e, time in zip(cnots, option):
+                    times[e] = time
+                moved = sum(a != b for a, b in zip(option, current))
+                costs.append(self._check_cost(times, ci) * (len(cnots) + 1) + moved)
+
+            costs = np.array(costs)
+            fewest = np.flatnonzero(costs == costs.min())
+            option = choices[int(fewest[rng.integers(len(fewest))])]
+            for e, time in zip(cnots, option):
+                times[e] = time
+
+            # Conflicts can only change for the checks next to this one
+            near = {ci}
+            for e in cnots:
+                near.update(
+                    self.edge_check[f] for f in self.qubit_edges[self.edge_qubit[e]]
+                )
+            conflicted -= near
+            conflicted.update(cj for cj in near if self._check_cost(times, cj))
+
+        return None
+
+    def _check_cost(self, times: list, ci: int) -> int:
+        # The conflicts of a check: its edges sharing a round with another edge
+        # on their qubit, and the pairs of checks it is in that do not commute
+
+        cost = 0
+        for e in self.check_edges[ci]:
+            for f in self.qubit_edges[self.edge_qubit[e]]:
+                cost += f != e and times[f] == times[e]
+
+        for ii in self.check_pairs[ci]:
+            cost += self._odd(times, self.pairs[ii])
+
+        return cost
+
+    @staticmethod
+    def _odd(times, pair: list) -> int:
+        return sum(times[xe] < times[ze] for xe, ze in pair) % 2
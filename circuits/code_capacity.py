@@ -0,0 +1,417 @@
+import numpy as np
+import pymatching
+from scipy.sparse import csr_matrix, eye, hstack, identity, kron
+
+from csscode.cssCode import cssCode
+from circuits.monte_carlo import SampleStats, chunk_seed
+from circuits.results_store import task_key
+
+__all__ = [
+    "CodeCapacitySampler",
+]
+
+# Error probabilities are clipped to this range when computing the weights of
+# the matching graphs, so that noiseless components keep finite weights
+_MIN_PERR = 1e-12
+_MAX_PERR = 0.5 - 1e-12
+
+
+class CodeCapacitySampler:
+
+    def __init__(
+        self,
+        code: cssCode,
+        perr,
+        p_meas: float = 0.0,
+        rounds: int = 1,
+        basis="Z",
+    ) -> None:
+        r"""
+        Samples code-capacity and phenomenological noise on a cssCode directly
+        from its parity check matrices, without building a stim Circuit. It is
+        the noise of memory_experiment with p_data and p_meas, generalized to
+        biased Pauli errors: each of the rounds applies i.i.d. Pauli errors to
+        the data qubits and measures the checks with outcomes flipped with
+        probability p_meas, and the data qubits are finally measured with
+        outcomes flipped with probability p_meas, which closes the checks
+        without measurement errors. With p_meas zero the rounds collapse into
+        the final measurement of the data qubits, with the probability of each
+        error accumulated over the rounds.
+
+        Errors are drawn bit-packed, with the 64 shots of each word sharing a
+        row for each qubit, and the syndromes are XORs of the rows selected by
+        the sparse check matrices, so each operation acts on 64 shots at once.
+        X errors are detected by the Z-checks and flip the Z logicals, and Z
+        errors by the X-checks, flipping the X logicals. Each sector is
+        decoded with pymatching on its check matrix, extended over the rounds
+        when there are measurement errors, with the errors that have the same
+        effect merged as in a detector error model, and a shot fails if any
+        predicted logical flip differs from the actual one.
+
+        Properties of a CodeCapacitySampler object:
+
+        :property code: The cssCode.
+
+        :property perr: A tuple (px, py, pz) of the probabilities of X, Y and Z
+            errors on each data qubit in each round.
+
+        :property p_meas: The probability of flipping each measurement outcome.
+
+        :property rounds: The number of rounds of syndrome extraction.
+
+        :property sectors: The sectors of the checks that are decoded, [True]
+            for the basis "Z", [False] for "X" and [True, False] for both.
+
+        :property check_matrices: A dictionary mapping the boolean False (True)
+            to the X (Z) parity check matrix, a scipy sparse matrix with a
+            column for each data qubit.
+
+        :property logical_matrices: A dictionary mapping the boolean False
+            (True) to the matrix of the X (Z) logicals, in the same format.
+
+        :property matchings: A dictionary mapping each of the sectors to the
+            pymatching Matching decoding it, which predicts logical flips.
+        """
+
+        assert rounds > 0
+        assert basis in ["Z", "X", None]
+
+        if np.isscalar(perr):
+            perr = [perr / 3] * 3
+
+        self.code = code
+        self.perr = tuple(float(p) for p in perr)
+        self.p_meas = p_meas
+        self.rounds = rounds
+        self.sectors = {"Z": [True], "X": [False], None: [True, False]}[basis]
+
+        assert len(self.perr) == 3 and sum(self.perr) <= 1
+
+        # Data qubits are the columns, in the order of their labels
+        self._data = np.array(sorted(code.qubits), dtype=np.int64)
+
+        self.check_matrices = dict()
+        self.logical_matrices = dict()
+        for sector in [False, True]:
+            checks = code.check_dict[sector]
+            self.check_matrices[sector] = self._matrix(
+                [checks[label] for label in sorted(checks)]
+            )
+            self.logical_matrices[sector] = self._matrix(
+                code.zlogicals if sector else code.xlogicals
+            )
+
+        self.matchings = {sector: self._matching(sector) for sector in self.sectors}
+
+    @property
+    def num_qubits(self) -> int:
+        return len(self._data)
+
+    def sample_errors(self, shots: int, rng: np.random.Generator) -> tuple[np.ndarray]:
+        r"""
+        Draws i.i.d. Pauli errors on the data qubits for a batch of shots.
+
+        :param shots: the number of shots
+        :param rng: a numpy Generator
+
+        :return: a tuple (xerr, zerr) of bit-packed uint64 arrays of shape
+            (number of data qubits, ceil(shots / 64)), where bit k of the word
+            w of row q is set if the shot 64 * w + k has an X (Z) component,
+            from an X or Y (Z or Y) error, on the data qubit q
+        """
+
+        xerr = _zero_bits(self.num_qubits, shots)
+        zerr = _zero_bits(self.num_qubits, shots)
+
+        rows, cols = _sample_positions(rng, self.num_qubits, shots, sum(self.perr))
+        if not len(rows):
+            return xerr, zerr
+
+        # Each error is X, Y or Z as its uniform value falls below the first,
+        # second or third threshold
+        thresholds = np.cumsum(self.perr) / sum(self.perr)
+        uniform = rng.random(len(rows))
+        xmask = uniform < thresholds[1]
+        zmask = uniform >= thresholds[0]
+
+        _set_bits(xerr, rows[xmask], cols[xmask])
+        _set_bits(zerr, rows[zmask], cols[zmask])
+
+        return xerr, zerr
+
+    def sample_detectors(self, shots: int, seed: int = None) -> tuple[np.ndarray]:
+        r"""
+        Samples the detection events and the logical flips of a batch of shots.
+        The detectors of each sector are those of its matching: the check c in
+        the round r is the detector r * (number of checks) + c, the round after
+        the last being the final measurement of the data qubits, which is the
+        only round without measurement errors. Detectors and logicals are
+        ordered by sector as in sectors.
+
+        :param shots: the number of shots
+        :param seed: an optional seed
+
+        :return: a tuple (dets, obs) of boolean arrays with shots rows
+        """
+
+        rng = np.random.default_rng(seed)
+
+        cumulative = {
+            sector: _zero_bits(self.num_qubits, shots) for sector in self.sectors
+        }
+        reported = {
+            sector: _zero_bits(self.check_matrices[sector].shape[0], shots)
+            for sector in self.sectors
+        }
+        events = {sector: [] for sector in self.sectors}
+
+        for rnd in range(self.rounds):
+            xerr, zerr = self.sample_errors(shots, rng)
+            for sector in self.sectors:
+                # The Z-checks see the X components of the errors
+                cumulative[sector] ^= xerr if sector else zerr
+                if not self.p_meas:
+                    continue
+
+                outcome = _parity(self.check_matrices[sector], cumulative[sector])
+                _flip_bits(rng, outcome, shots, self.p_meas)
+
+                events[sector].append(outcome ^ reported[sector])
+                reported[sector] = outcome
+
+        dets, obs = [], []
+        for sector in self.sectors:
+            final = cumulative[sector]
+            _flip_bits(rng, final, shots, self.p_meas)
+
+            outcome = _parity(self.check_matrices[sector], final)
+            events[sector].append(outcome ^ reported[sector])
+
+            dets += events[sector]
+            obs.append(_parity(self.logical_matrices[sector], final))
+
+        return _unpack_bits(np.concatenate(dets), shots), _unpack_bits(
+            np.concatenate(obs), shots
+        )
+
+    def sample_failures(self, shots: int, seed: int = None) -> np.ndarray:
+        r"""
+        Samples a batch of shots and decodes them.
+
+        :param shots: the number of shots
+        :param seed: an optional seed
+
+        :return: a boolean array with the shots that have a logical error
+        """
+
+        dets, obs = self.sample_detectors(shots, seed)
+
+        failures = np.zeros(shots, dtype=bool)
+        det_start, obs_start = 0, 0
+        for sector in self.sectors:
+            matching = self.matchings[sector]
+            ndets = matching.num_detectors
+            nobs = self.logical_matrices[sector].shape[0]
+
+            predictions = matching.decode_batch(dets[:, det_start : det_start + ndets])
+            failures |= np.any(
+                predictions != obs[:, obs_start : obs_start + nobs], axis=1
+            )
+
+            det_start += ndets
+            obs_start += nobs
+
+        return failures
+
+    def run(
+        self,
+        max_shots: int,
+        chunk_shots: int = 10000,
+        max_errors: int = None,
+        seed: int = None,
+    ) -> SampleStats:
+        r"""
+        Estimates the logical error rate, sampling chunks of shots until
+        max_shots shots or max_errors logical errors. Each chunk is seeded
+        as the chunks of run_tasks, from seed, the task key of the code, the
+        noise and the decoded sectors, and the index of the chunk.
+
+        :param max_shots: the largest number of shots to take
+        :param chunk_shots: the number of shots in each chunk
+        :param max_errors: an optional number of logical errors to stop at
+        :param seed: an optional seed for reproducible chunk seeds
+
+        :return: a SampleStats
+        """
+
+        entropy = np.random.SeedSequence(seed).entropy
+        key = task_key(
+            code=self.code,
+            noise={
+                "model": "code_capacity",
+                "perr": self.perr,
+                "p_meas": self.p_meas,
+                "rounds": self.rounds,
+            },
+            decoder={"decoder": "pymatching", "sectors": self.sectors},
+            seed_policy=seed,
+        )
+        stats = SampleStats()
+
+        chunk = 0
+        while stats.shots < max_shots:
+            if max_errors is not None and stats.errors >= max_errors:
+                break
+
+            shots = min(chunk_shots, max_shots - stats.shots)
+            failures = self.sample_failures(shots, chunk_seed(entropy, key, chunk))
+            stats.merge(shots, int(np.count_nonzero(failures)))
+            chunk += 1
+
+        return stats
+
+    def _matrix(self, supports: list[set[int]]) -> csr_matrix:
+        # The sparse matrix with a row for each support, over the data qubits
+
+        indptr = np.cumsum([0] + [len(support) for support in supports])
+        labels = np.array(
+            [q for support in supports for q in sorted(support)], dtype=np.int64
+        )
+        indices = np.searchsorted(self._data, labels)
+
+        return csr_matrix(
+            (np.ones(len(indices), dtype=np.uint8), indices, indptr),
+            shape=(len(supports), self.num_qubits),
+        )
+
+    def _matching(self, sector: bool) -> pymatching.Matching:
+        # The decoder of the errors seen by the checks of the sector
+
+        px, py, pz = self.perr
+        p = px + py if sector else pz + py
+
+        if not self.p_meas:
+            # Flips accumulated over the rounds
+            p = (1 - (1 - 2 * p) ** self.rounds) / 2
+            return pymatching.Matching.from_check_matrix(
+                self.check_matrices[sector],
+                weights=_weight(p),
+                faults_matrix=self.logical_matrices[sector],
+                merge_strategy="independent",
+            )
+
+        # The space-time check matrix over the rounds and the final readout,
+        # whose detection events are differences of consecutive outcomes. A
+        # data error before the round r is seen in the round r only, with
+        # the readout flips as data errors before the last round, and a
+        # measurement error in the round r is seen in the rounds r and r + 1
+        H = self.check_matrices[sector]
+        logicals = self.logical_matrices[sector]
+        layers = self.rounds + 1
+
+        steps = eye(layers, self.rounds) + eye(layers, self.rounds, k=-1)
+
+        check_matrix = hstack(
+            [kron(identity(layers), H), kron(steps, identity(H.shape[0]))]
+        )
+        faults_matrix = hstack(
+            [
+                kron(np.ones((1, layers), dtype=np.uint8), logicals),
+                csr_matrix((logicals.shape[0], self.rounds * H.shape[0])),
+            ]
+        )
+        weights = np.repeat(
+            [_weight(p), _weight(self.p_meas), _weight(self.p_meas)],
+            [self.rounds * H.shape[1], H.shape[1], self.rounds * H.shape[0]],
+        )
+
+        return pymatching.Matching.from_check_matrix(
+            check_matrix.tocsc(),
+            weights=weights,
+            faults_matrix=faults_matrix.tocsc(),
+            merge_strategy="independent",
+        )
+
+
+def _weight(p: float) -> float:
+    p = min(max(p, _MIN_PERR), _MAX_PERR)
+    return float(np.log((1 - p) / p))
+
+
+def _zero_bits(rows: int, shots: int) -> np.ndarray:
+    return np.zeros((rows, -(-shots // 64)), dtype=np.uint64)
+
+
+def _sample_positions(
+    rng: np.random.Generator, rows: int, shots: int, p: float
+) -> tuple[np.ndarray]:
+    # The rows and shots of i.i.d. events of probability p, in increasing
+    # order, drawing the gaps between consecutive events rather than a value
+    # for each position
+
+    total = rows * shots
+    if p <= 0 or not total:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    positions = []
+    last = -1
+    while last < total:
+        size = int(1.05 * p * (total - last)) + 64
+        blocks = last + np.cumsum(rng.geometric(p, size))
+        positions.append(blocks)
+        last = blocks[-1]
+
+    positions = np.concatenate(positions)
+    positions = positions[positions < total]
+
+    return positions // shots, positions % shots
+
+
+def _set_bits(bits: np.ndarray, rows: np.ndarray, shots: np.ndarray) -> None:
+    # Sets distinct bits given in increasing order, so the bits of each word
+    # are consecutive and are summed into the word at once
+
+    if not len(rows):
+        return
+
+    flat = bits.reshape(-1)
+    words = rows * bits.shape[1] + shots // 64
+    values = np.left_shift(np.uint64(1), (shots % 64).astype(np.uint64))
+
+    starts = np.flatnonzero(np.diff(words, prepend=-1))
+    flat[words[starts]] |= np.add.reduceat(values, starts)
+
+
+def _flip_bits(
+    rng: np.random.Generator, bits: np.ndarray, shots: int, p: float
+) -> None:
+    if p > 0:
+        flips = _zero_bits(len(bits), shots)
+        _set_bits(flips, *_sample_positions(rng, len(bits), shots, p))
+        bits ^= flips
+
+
+def _parity(H: csr_matrix, bits: np.ndarray) -> np.ndarray:
+    # The bit-packed product of the sparse matrix with the bit-packed rows,
+    # XORing the rows in the support of each row of the matrix
+
+    parity = np.zeros((H.shape[0], bits.shape[1]), dtype=np.uint64)
+
+    starts = H.indptr[:-1]
+    nonempty = np.diff(H.indptr) > 0
+    if H.nnz:
+        parity[nonempty] = np.bitwise_xor.reduceat(
+            bits[H.indices], starts[nonempty], axis=0
+        )
+
+    return parity
+
+
+def _unpack_bits(bits: np.ndarray, shots: int) -> np.ndarray:
+    # The boolean array of shape (shots, rows) of the bit-packed rows
+
+    unpacked = np.unpackbits(
+        bits.astype("<u8").view(np.uint8), axis=1, count=shots, bitorder="little"
+    )
+
+    return unpacked.T.astype(bool)
@@ -0,0 +1,746 @@
+import numpy as np
+from itertools import product
+from qulacs import QuantumState
+from qulacs.gate import Pauli
+from qulacs.state import drop_qubit, tensor_product
+
+__all__ = [
+    "GateSequence",
+    "apply_op",
+    "branch_states",
+    "exact_expectation",
+    "sample_trajectory",
+    "TrajectorySampler",
+    "FaultExpansion",
+    "enumerate_fault_paths",
+]
+
+# Pauli matrices indexed as in qulacs: 0 = I, 1 = X, 2 = Y, 3 = Z
+PAULI_MATRICES = [
+    np.eye(2, dtype=complex),
+    np.array([[0, 1], [1, 0]], dtype=complex),
+    np.array([[0, -1j], [1j, 0]], dtype=complex),
+    np.array([[1, 0], [0, -1]], dtype=complex),
+]
+
+
+class GateSequence:
+
+    def __init__(self, qubit_count: int) -> None:
+        r"""
+        A recording of a protocol built from the qulacs builders. A GateSequence
+        can be passed to the builders in place of a QuantumState, through the
+        helpers update_state, add_ancillas and postselect, and records the
+        operations instead of applying them.
+
+        Noise gates (qulacs Probabilistic gates) are recorded as noise locations,
+        each with the probabilities and Pauli gates of its non-trivial faults.
+
+        Properties of a GateSequence object:
+
+        :property initial_qubit_count: The number of qubits of the input state.
+
+        :property qubit_count: The number of qubits at the current end of the recording.
+
+        :property ops: The list of recorded operations, as tuples
+            ("gate", gate),
+            ("noise", gate, probs, paulis),
+            ("add", n),
+            ("drop", qubits, values),
+            ("branch", qubits, patterns).
+
+        :property noise_locations: The indices in ops of the noise locations.
+        """
+
+        self.initial_qubit_count = qubit_count
+        self.qubit_count = qubit_count
+        self.ops = []
+        self.noise_locations = []
+
+    def get_qubit_count(self) -> int:
+        return self.qubit_count
+
+    def update(self, gate) -> None:
+        r"""
+        Records a qulacs gate.
+
+        :param gate: a qulacs gate
+        """
+
+        if gate.get_name() == "Probabilistic":
+            probs, paulis = _pauli_faults(gate)
+            self.noise_locations.append(len(self.ops))
+            self.ops.append(("noise", gate, probs, paulis))
+        else:
+            self.ops.append(("gate", gate))
+
+    def add_qubits(self, n: int) -> None:
+        r"""
+        Records adjoining n qubits in the zero state after the existing qubits.
+
+        :param n: the number of qubits
+        """
+
+        self.ops.append(("add", n))
+        self.qubit_count += n
+
+    def drop(self, qubits: list[int], values: list[int]) -> None:
+        r"""
+        Records projecting the qubits onto the given values and removing them,
+        without normalizing the state.
+
+        :param qubits: list of qubits
+        :param values: list of 0/1 values
+        """
+
+        self.ops.append(("drop", list(qubits), list(values)))
+        self.qubit_count -= len(qubits)
+
+    def branch(self, qubits: list[int], patterns: list[list[int]]) -> None:
+        r"""
+        Records a sum over the outcomes in patterns: the rest of the protocol
+        is run on each projection of the state onto one of the patterns, as in
+        drop, and the results are added.
+
+        :param qubits: list of qubits
+        :param patterns: list of lists of 0/1 values
+        """
+
+        self.ops.append(("branch", list(qubits), [list(p) for p in patterns]))
+        self.qubit_count -= len(qubits)
+
+    def initial_state(self) -> QuantumState:
+        r"""
+        The all zeros state on the input qubits of the sequence.
+
+        :return: a QuantumState
+        """
+
+        state = QuantumState(self.initial_qubit_count)
+        state.set_zero_state()
+        return state
+
+
+def apply_op(op: tuple, state: QuantumState) -> QuantumState:
+    r"""
+    Applies one operation of a GateSequence, other than a branch, to the state.
+    Noise locations are applied ideally, i.e. they are skipped.
+
+    :param op: an operation of a GateSequence
+    :param state: a QuantumState
+
+    :return: the updated QuantumState
+    """
+
+    return _apply_op(op, state, state.get_qubit_count())
+
+
+def exact_expectation(
+    sequence: GateSequence,
+    terminal,
+    prune: float = 1e-6,
+    max_faults: int = None,
+) -> tuple[np.ndarray, float]:
+    r"""
+    Propagates the sequence exactly as a mixture over the Pauli faults of its
+    noise locations, starting from the all zeros state. Each branch of the
+    mixture is a state vector carrying the probability of its faults, and
+    branches are explored one at a time so that memory stays proportional to
+    the number of faults in a branch.
+
+    The outcomes of a branch operation are not explored separately: they are
+    kept together as a batch of states, see branch_states, and every later
+    operation is applied once to the whole batch.
+
+    Branches whose probability falls below prune, or that would have more than
+    max_faults faults, are discarded and their total probability is returned,
+    bounding the error of the result.
+
+    :param sequence: a GateSequence
+    :param terminal: a function mapping the final state of a branch to an
+        array of values, e.g. (norm, probability of an error). The function is
+        passed batched states and should sum over the batch qubits.
+    :param prune: the smallest branch probability that is propagated
+    :param max_faults: the largest number of faults in a branch
+
+    :return: a tuple (expectation, pruned) of the probability-weighted sum of
+        terminal over all branches and the total probability discarded
+    """
+
+    max_faults = len(sequence.noise_locations) if max_faults is None else max_faults
+    widths = _op_widths(sequence)
+
+    pruned = [0.0]
+
+    def propagate(state, start, weight, faults):
+        total = 0.0
+
+        for ii in range(start, len(sequence.ops)):
+            op = sequence.ops[ii]
+
+            if op[0] == "noise":
+                probs, paulis = op[2], op[3]
+
+                for prob, pauli in zip(probs, paulis):
+                    if faults >= max_faults or weight * prob < prune:
+                        pruned[0] += weight * prob
+                        continue
+
+                    fault_state = state.copy()
+                    pauli.update_quantum_state(fault_state)
+                    total = total + propagate(
+                        fault_state, ii + 1, weight * prob, faults + 1
+                    )
+
+                weight *= 1 - np.sum(probs)
+
+            else:
+                state = _apply_op(op, state, widths[ii])
+
+        return total + weight * np.asarray(terminal(state))
+
+    expectation = propagate(sequence.initial_state(), 0, 1.0, 0)
+
+    return expectation, pruned[0]
+
+
+def sample_trajectory(
+    sequence: GateSequence, terminal, rng: np.random.Generator
+) -> np.ndarray:
+    r"""
+    Runs one noisy trajectory of the sequence, starting from the all zeros
+    state, with the faults of every noise location drawn from rng. This is the
+    seeded counterpart of running the noisy builders on a QuantumState, whose
+    noise gates draw from the unseeded random number generator of qulacs.
+
+    The outcomes of a branch operation are kept together as a batch of states,
+    see branch_states, so the rest of the protocol is applied once to the
+    whole batch, with the same faults for every outcome. The expectation over
+    trajectories is the same as running each outcome with its own faults.
+
+    :param sequence: a GateSequence
+    :param terminal: a function mapping the final state of a branch to an
+        array of values, e.g. (norm, probability of an error). The function is
+        passed batched states and should sum over the batch qubits.
+    :param rng: a numpy random Generator
+
+    :return: the value of terminal for the trajectory
+    """
+
+    widths = _op_widths(sequence)
+    state = sequence.initial_state()
+
+    for ii, op in enumerate(sequence.ops):
+        if op[0] == "noise":
+            probs, paulis = op[2], op[3]
+
+            fault = np.searchsorted(np.cumsum(probs), rng.random(), side="right")
+            if fault < len(paulis):
+                paulis[fault].update_quantum_state(state)
+
+        else:
+            state = _apply_op(op, state, widths[ii])
+
+    return np.asarray(terminal(state))
+
+
+class TrajectorySampler:
+
+    def __init__(
+        self, sequence: GateSequence, terminal, checkpoint_interval: int = 16
+    ) -> None:
+        r"""
+        Samples noisy trajectories of a GateSequence, as sample_trajectory, with
+        the faults of a whole trajectory drawn up front. Only the Pauli faults
+        that fire are applied, a trajectory without faults returns the cached
+        value of the fault-free run, and a trajectory with faults resumes
+        from the last fault-free state stored before its first fault.
+
+        Fault-free states are stored every checkpoint_interval operations, so
+        memory grows as the length of the sequence over the interval.
+
+        Properties of a TrajectorySampler object:
+
+        :property sequence: The GateSequence that is sampled.
+
+        :property terminal: The function mapping the final state to an array of
+            values, as in sample_trajectory.
+
+        :property fire_probs: The probability that each noise location has a fault.
+
+        :property checkpoints: A dictionary mapping operation indices to the
+            fault-free state before that operation.
+
+        :property ideal_value: The value of terminal for the fault-free run.
+        """
+
+        self.sequence = sequence
+        self.terminal = terminal
+
+        locations = sequence.noise_locations
+        self.fire_probs = np.array([np.sum(sequence.ops[ii][2]) for ii in locations])
+        self._locations = np.array(locations, dtype=np.int64)
+        self._cumulative = [np.cumsum(sequence.ops[ii][2]) for ii in locations]
+        self._widths = _op_widths(sequence)
+
+        self.checkpoints, state = _fault_free_checkpoints(
+            sequence, self._widths, checkpoint_interval
+        )
+
+        self.ideal_value = np.asarray(terminal(state))
+
+    def sample(self, rng: np.random.Generator) -> np.ndarray:
+        r"""
+        Runs one noisy trajectory of the sequence.
+
+        :param rng: a numpy random Generator
+
+        :return: the value of terminal for the trajectory
+        """
+
+        fired = np.flatnonzero(rng.random(len(self.fire_probs)) < self.fire_probs)
+
+        if not len(fired):
+            return self.ideal_value.copy()
+
+        # Pick the fault of each location that fired, in proportion to its probability
+        draws = rng.random(len(fired)) * self.fire_probs[fired]
+        faults = dict()
+        for loc, draw in zip(fired, draws):
+            cumulative = self._cumulative[loc]
+            fault = min(
+                np.searchsorted(cumulative, draw, side="right"), len(cumulative) - 1
+            )
+            faults[self._locations[loc]] = self.sequence.ops[self._locations[loc]][3][
+                fault
+            ]
+
+        return self.run_faults(faults)
+
+    def run_faults(self, faults: dict) -> np.ndarray:
+        r"""
+        Runs the sequence with the given faults, from the last fault-free
+        state stored before the first of them.
+
+        :param faults: a dictionary mapping operation indices of noise locations
+            to the Pauli gate of their fault
+
+        :return: the value of terminal for the run
+        """
+
+        if not len(faults):
+            return self.ideal_value.copy()
+
+        first = min(faults)
+        start = max(ii for ii in self.checkpoints if ii <= first)
+
+        return self._resume(self.checkpoints[start].copy(), start, faults)
+
+    def run(self, count: int, rng: np.random.Generator) -> np.ndarray:
+        r"""
+        Runs count noisy trajectories of the sequence.
+
+        :param count: the number of trajectories
+        :param rng: a numpy random Generator
+
+        :return: an array with the value of terminal for each trajectory
+        """
+
+        return np.array([self.sample(rng) for _ in range(count)])
+
+    def _resume(self, state: QuantumState, start: int, faults: dict) -> np.ndarray:
+        # Runs the sequence from the operation at start, applying the given
+        # Pauli faults at their noise locations and skipping the others
+
+        for ii in range(start, len(self.sequence.ops)):
+            op = self.sequence.ops[ii]
+
+            if op[0] == "noise":
+                if ii in faults:
+                    faults[ii].update_quantum_state(state)
+            else:
+                state = _apply_op(op, state, self._widths[ii])
+
+        return np.asarray(self.terminal(state))
+
+
+class FaultExpansion:
+
+    def __init__(
+        self,
+        perr: float,
+        order: int,
+        values: np.ndarray,
+        weights: np.ndarray,
+        path_rates: np.ndarray,
+        location_rates: np.ndarray,
+    ) -> None:
+        r"""
+        The values of a terminal function on every fault path of a GateSequence
+        with at most order faults, for noise whose fault probabilities are
+        proportional to a strength p. The expectation of the terminal is
+
+        E(p) = sum over paths of p**k weight prod_{l not in path} (1 - p rate_l) value
+
+        with k the number of faults of the path, weight the product of the rates
+        of its faults and rate_l the total fault rate of location l.
+
+        Properties of a FaultExpansion object:
+
+        :property perr: The strength the sequence was recorded at. Rates are
+            fault probabilities at that strength divided by it.
+
+        :property order: The largest number of faults of a path.
+
+        :property values: The value of the terminal on each path, one row per path.
+
+        :property weights: The product of the rates of the faults of each path.
+
+        :property path_rates: The total fault rates of the locations of each path,
+            padded with zeros to order columns.
+
+        :property location_rates: The total fault rate of each noise location.
+        """
+
+        self.perr = perr
+        self.order = order
+        self.values = values
+        self.weights = weights
+        self.path_rates = path_rates
+        self.location_rates = location_rates
+
+    def coefficients(self) -> np.ndarray:
+        r"""
+        The exact coefficients A_0, ..., A_order of the expansion
+        E(p) = A_0 + A_1 p + A_2 p**2 + ...
+
+        :return: an array with one row for each power of p
+        """
+
+        # Elementary symmetric polynomials of the rates of all locations
+        elem = np.zeros(self.order + 1)
+        elem[0] = 1.0
+        for rate in self.location_rates:
+            elem[1:] = elem[1:] + rate * elem[:-1]
+
+        # The same, leaving out the locations of each path, by dividing by
+        # (1 + rate x) for each of them
+        comp = np.tile(elem, (len(self.weights), 1))
+        for col in range(self.path_rates.shape[1]):
+            rate = self.path_rates[:, col]
+            for jj in range(1, self.order + 1):
+                comp[:, jj] = comp[:, jj] - rate * comp[:, jj - 1]
+
+        faults = np.count_nonzero(self.path_rates, axis=1)
+
+        coeffs = np.zeros((self.order + 1,) + self.values.shape[1:])
+        for kk in range(self.order + 1):
+            paths = faults == kk
+            for nn in range(kk, self.order + 1):
+                scale = (-1) ** (nn - kk) * comp[paths, nn - kk] * self.weights[paths]
+                coeffs[nn] += np.tensordot(scale, self.values[paths], axes=1)
+
+        return coeffs
+
+    def evaluate(self, perr: float) -> tuple[np.ndarray, float]:
+        r"""
+        Sums the paths with their exact probabilities at strength perr.
+
+        :param perr: the noise strength
+
+        :return: a tuple (value, tail) of the sum over paths, and the probability
+            of more than order faults, which bounds the error of the sum for
+            terminals valued in [0, 1]
+        """
+
+        rates = perr * self.location_rates
+
+        no_fault = np.prod(1 - rates)
+        faults = np.count_nonzero(self.path_rates, axis=1)
+
+        probs = (
+            no_fault
+            * perr**faults
+            * self.weights
+            / np.prod(1 - perr * self.path_rates, axis=1)
+        )
+        value = np.tensordot(probs, self.values, axes=1)
+
+        # Probability of at most order faults, from the odds of each location
+        odds = rates / (1 - rates)
+        elem = np.zeros(self.order + 1)
+        elem[0] = 1.0
+        for odd in odds:
+            elem[1:] = elem[1:] + odd * elem[:-1]
+
+        return value, max(0.0, 1 - no_fault * np.sum(elem))
+
+
+def enumerate_fault_paths(
+    sequence: GateSequence,
+    terminal,
+    perr: float,
+    order: int = 2,
+    checkpoint_interval: int = 16,
+) -> FaultExpansion:
+    r"""
+    Evaluates the terminal on every path of the sequence with at most order Pauli
+    faults. The fault-free run is done once, storing its state every
+    checkpoint_interval operations, and the paths whose first fault is at a
+    given noise location resume from the last stored state before it. The
+    paths with further faults branch off from there.
+
+    The fault probabilities of the noise locations must be proportional to the
+    strength perr the sequence was recorded at, as for the noisy builders.
+
+    :param sequence: a GateSequence
+    :param terminal: a function mapping the final state of a branch to an
+        array of values, as in exact_expectation
+    :param perr: the strength the sequence was recorded at
+    :param order: the largest number of faults of a path
+    :param checkpoint_interval: the number of operations between stored states
+
+    :return: a FaultExpansion
+    """
+
+    widths = _op_widths(sequence)
+    checkpoints, state = _fault_free_checkpoints(sequence, widths, checkpoint_interval)
+
+    values = [np.asarray(terminal(state))]
+    weights = [1.0]
+    path_rates = [[0.0] * order]
+
+    def propagate(state, start, weight, rates):
+        for ii in range(start, len(sequence.ops)):
+            op = sequence.ops[ii]
+
+            if op[0] == "noise":
+                if len(rates) < order:
+                    branch_faults(state, ii, weight, rates)
+            else:
+                state = _apply_op(op, state, widths[ii])
+
+        values.append(np.asarray(terminal(state)))
+        weights.append(weight)
+        path_rates.append(rates + [0.0] * (order - len(rates)))
+
+    def branch_faults(state, ii, weight, rates):
+        # Follows each fault of the noise location at ii on a copy of the state
+        probs, paulis = sequence.ops[ii][2], sequence.ops[ii][3]
+        rate = np.sum(probs) / perr
+
+        for prob, pauli in zip(probs, paulis):
+            fault_state = state.copy()
+            pauli.update_quantum_state(fault_state)
+            propagate(fault_state, ii + 1, weight * prob / perr, rates + [rate])
+
+    if order > 0:
+        for ii in sequence.noise_locations:
+            start = max(jj for jj in checkpoints if jj <= ii)
+            state = checkpoints[start].copy()
+            for jj in range(start, ii):
+                if sequence.ops[jj][0] != "noise":
+                    state = _apply_op(sequence.ops[jj], state, widths[jj])
+
+            branch_faults(state, ii, 1.0, [])
+
+    location_rates = np.array(
+        [np.sum(sequence.ops[ii][2]) / perr for ii in sequence.noise_locations]
+    )
+
+    return FaultExpansion(
+        perr,
+        order,
+        np.array(values),
+        np.array(weights),
+        np.array(path_rates).reshape(len(weights), order),
+        location_rates,
+    )
+
+
+def branch_states(
+    state: QuantumState,
+    width: int,
+    qubits: list[int],
+    patterns: list[list[int]],
+    tol: float = 1e-10,
+) -> QuantumState:
+    r"""
+    Projects a batch of states onto each of the patterns of the qubits, and
+    compresses the projections into a new batch.
+
+    A batch of states on width qubits is held in a single QuantumState, the
+    index of the state in the batch being stored in extra qubits labeled from
+    width upwards. Gates on the first width qubits act on every state of the
+    batch at once, and summing a probability over the extra qubits sums it over
+    the batch.
+
+    Quantities that are quadratic in the states, such as post-selection and
+    error probabilities, summed over the batch only depend on the mixture of
+    the states. The projections are therefore replaced by the singular vectors
+    of their matrix, weighted by the singular values, dropping those with
+    squared singular value below tol. The new batch has at most 2**(width -
+    len(qubits)) states, however many branch operations are nested.
+
+    :param state: a QuantumState holding a batch of states
+    :param width: the number of qubits of each state of the batch
+    :param qubits: list of qubits below width to be projected and removed
+    :param patterns: list of lists of 0/1 values to project the qubits onto
+    :param tol: the smallest squared singular value kept
+
+    :return: a QuantumState holding the new batch
+    """
+
+    matrix = state.get_vector().reshape(-1, 2**width)
+
+    projections = np.concatenate(
+        [_project_rows(matrix, width, qubits, pattern) for pattern in patterns]
+    )
+
+    _, sing, vh = np.linalg.svd(projections, full_matrices=False)
+    keep = sing**2 > tol
+
+    return _batch_state(sing[keep, None] * vh[keep], width - len(qubits))
+
+
+def _fault_free_checkpoints(
+    sequence: GateSequence, widths: list[int], interval: int
+) -> tuple[dict, QuantumState]:
+    # Runs the sequence without faults, keeping the state before every
+    # interval-th operation, and returns the stored and final states
+
+    checkpoints = dict()
+    state = sequence.initial_state()
+    for ii, op in enumerate(sequence.ops):
+        if not ii % interval:
+            checkpoints[ii] = state.copy()
+        state = _apply_op(op, state, widths[ii])
+
+    return checkpoints, state
+
+
+def _op_widths(sequence: GateSequence) -> list[int]:
+    # The number of qubits of the states of a batch before each operation
+
+    widths = []
+    width = sequence.initial_qubit_count
+    for op in sequence.ops:
+        widths.append(width)
+        if op[0] == "add":
+            width += op[1]
+        elif op[0] in ["drop", "branch"]:
+            width -= len(op[1])
+
+    return widths
+
+
+def _apply_op(op: tuple, state: QuantumState, width: int) -> QuantumState:
+
+    if op[0] == "gate":
+        op[1].update_quantum_state(state)
+
+    elif op[0] == "add":
+        if state.get_qubit_count() == width:
+            anc = QuantumState(op[1])
+            anc.set_zero_state()
+            return tensor_product(anc, state)
+
+        # New qubits go between the qubits of the states and the batch qubits
+        matrix = state.get_vector().reshape(-1, 2**width)
+        added = np.zeros((matrix.shape[0], 2 ** (width + op[1])), dtype=complex)
+        added[:, : 2**width] = matrix
+
+        return _batch_state(added, width + op[1])
+
+    elif op[0] == "drop":
+        if state.get_qubit_count() == width:
+            return drop_qubit(state, op[1], op[2])
+
+        matrix = state.get_vector().reshape(-1, 2**width)
+
+        return _batch_state(
+            _project_rows(matrix, width, op[1], op[2]), width - len(op[1])
+        )
+
+    elif op[0] == "branch":
+        return branch_states(state, width, op[1], op[2])
+
+    return state
+
+
+def _project_rows(
+    matrix: np.ndarray, width: int, qubits: list[int], values: list[int]
+) -> np.ndarray:
+    # Projects each row of the matrix, a state on width qubits, onto the values
+    # of the qubits and removes them, as drop_qubit does
+
+    index = [slice(None)] * (width + 1)
+    for qubit, value in zip(qubits, values):
+        index[width - qubit] = value
+
+    tensor = matrix.reshape([matrix.shape[0]] + [2] * width)
+
+    return tensor[tuple(index)].reshape(matrix.shape[0], -1)
+
+
+def _batch_state(matrix: np.ndarray, width: int) -> QuantumState:
+    # Holds the rows of the matrix, states on width qubits, as a batch in a
+    # single QuantumState, padding the batch to a power of two
+
+    batch_qubits = int(np.ceil(np.log2(max(matrix.shape[0], 1))))
+
+    vector = np.zeros(2 ** (width + batch_qubits), dtype=complex)
+    vector[: matrix.size] = matrix.reshape(-1)
+
+    state = QuantumState(width + batch_qubits)
+    state.load(vector)
+
+    return state
+
+
+# Pauli decompositions of the gates of noise channels, keyed by their matrices
+_PAULI_CACHE = dict()
+
+
+def _pauli_faults(gate) -> tuple[np.ndarray, list]:
+    # Splits a qulacs Probabilistic gate into the probabilities and Pauli
+    # gates of its non-identity branches
+
+    probs = []
+    paulis = []
+
+    for prob, branch in zip(gate.get_distribution(), gate.get_gate_list()):
+        targets = branch.get_target_index_list()
+        ids = _pauli_ids(branch)
+
+        if not any(ids):
+            continue
+
+        probs.append(prob)
+        paulis.append(Pauli(targets, ids))
+
+    return np.array(probs), paulis
+
+
+def _pauli_ids(branch) -> list[int]:
+
+    matrix = np.asarray(branch.get_matrix())
+    key = matrix.tobytes()
+
+    if key not in _PAULI_CACHE:
+        n = len(branch.get_target_index_list())
+
+        # qulacs orders the basis with the first target as the lowest bit
+        for ids in product(range(4), repeat=n):
+            pmat = np.ones((1, 1), dtype=complex)
+            for pid in ids:
+                pmat = np.kron(PAULI_MATRICES[pid], pmat)
+
+            overlap = np.trace(pmat.conj().T @ matrix) / 2**n
+            if np.isclose(abs(overlap), 1.0):
+                _PAULI_CACHE[key] = list(ids)
+                break
+        else:
+            raise ValueError("noise gate " + branch.get_name() + " is not a Pauli")
+
+    return _PAULI_CACHE[key]
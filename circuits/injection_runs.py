@@ -0,0 +1,233 @@
+import numpy as np
+
+from circuits.gate_sequences import TrajectorySampler
+from circuits.monte_carlo import chunk_seed, run_chunks
+from circuits.steane_injection import multi_run_sequence, postselection_terminal
+
+__all__ = [
+    "InjectionStats",
+    "run_injection",
+]
+
+# The number of Hadamard tests of each protocol
+_PROTOCOL_TESTS = {
+    "single": 1,
+    "double": 2,
+    "triple": 3,
+}
+
+
+class InjectionStats:
+
+    def __init__(self) -> None:
+        r"""
+        Running sums over trajectories of the post-selected Hadamard-test
+        protocols. Each trajectory yields the probability ps of passing
+        post-selection and the joint probability err of passing with a
+        logical error, as returned by one_single_run and one_double_run.
+
+        Properties of an InjectionStats object:
+
+        :property trajectories: The number of trajectories.
+
+        :property sums: The sums of ps, err, ps**2, err**2 and ps*err.
+        """
+
+        self.trajectories = 0
+        self.sums = np.zeros(5)
+
+    def add(self, ps: float, err: float) -> None:
+        self.trajectories += 1
+        self.sums += [ps, err, ps * ps, err * err, ps * err]
+
+    def merge(self, trajectories: int, sums: np.ndarray) -> None:
+        self.trajectories += trajectories
+        self.sums += sums
+
+    @property
+    def ps_rate(self) -> float:
+        return self.sums[0] / self.trajectories if self.trajectories else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        # Logical error rate conditioned on passing post-selection
+        return self.sums[1] / self.sums[0] if self.sums[0] else 0.0
+
+    def ps_interval(self, z: float = 1.96) -> tuple[float, float]:
+        r"""
+        The normal confidence interval of the post-selection probability.
+
+        :param z: the number of standard deviations of the interval
+
+        :return: a tuple (low, high)
+        """
+
+        n = self.trajectories
+        if n < 2:
+            return (0.0, 1.0)
+
+        mean = self.sums[0] / n
+        var = max(self.sums[2] / n - mean**2, 0.0) * n / (n - 1)
+        half = z * np.sqrt(var / n)
+
+        return (max(0.0, mean - half), min(1.0, mean + half))
+
+    def error_interval(self, z: float = 1.96) -> tuple[float, float]:
+        r"""
+        The confidence interval of the conditional logical error rate, from
+        the delta method for the ratio of the mean of err to the mean of ps.
+
+        :param z: the number of standard deviations of the interval
+
+        :return: a tuple (low, high)
+        """
+
+        n = self.trajectories
+        if n < 2 or not self.sums[0]:
+            return (0.0, 1.0)
+
+        mean_ps = self.sums[0] / n
+        mean_err = self.sums[1] / n
+        rate = mean_err / mean_ps
+
+        var_ps = self.sums[2] / n - mean_ps**2
+        var_err = self.sums[3] / n - mean_err**2
+        cov = self.sums[4] / n - mean_ps * mean_err
+
+        var = max(var_err - 2 * rate * cov + rate**2 * var_ps, 0.0) * n / (n - 1)
+        half = z * np.sqrt(var / n) / mean_ps
+
+        return (max(0.0, rate - half), min(1.0, rate + half))
+
+    def is_resolved(self, target_rel_width: float, z: float = 1.96) -> bool:
+        r"""
+        Determines if the width of the confidence interval of the conditional
+        logical error rate, relative to the rate, is below target_rel_width.
+
+        :param target_rel_width: the target relative width
+        :param z: the number of standard deviations of the interval
+
+        :return: a boolean
+        """
+
+        if self.error_rate <= 0:
+            return False
+
+        low, high = self.error_interval(z)
+
+        return (high - low) / self.error_rate <= target_rel_width
+
+    def __repr__(self) -> str:
+        return (
+            f"InjectionStats(trajectories={self.trajectories}, "
+            f"ps_rate={self.ps_rate}, error_rate={self.error_rate})"
+        )
+
+
+def run_injection(
+    perrs: list[float],
+    protocol: str = "single",
+    trajectories: int = 10000,
+    chunk_trajectories: int = 100,
+    target_rel_width: float = None,
+    idling=True,
+    workers: int = None,
+    seed: int = None,
+    callback=None,
+) -> list[InjectionStats]:
+    r"""
+    Runs noisy trajectories of a post-selected Hadamard-test protocol of
+    steane_injection for each noise strength in perrs, across a pool of
+    processes. The trajectories of each strength are split into chunks,
+    each seeded independently from seed, the protocol, the strength and the
+    index of the chunk, so results do not depend on the number of workers.
+
+    :param perrs: a list of circuit-level noise strengths
+    :param protocol: "single" for one_single_run, "double" for one_double_run or
+        "triple" for three Hadamard tests, see multi_run_sequence
+    :param trajectories: the largest number of trajectories for each strength
+    :param chunk_trajectories: the number of trajectories in each chunk
+    :param target_rel_width: no further chunks are issued for a strength once the
+        width of the 95% interval of its conditional logical error rate, relative
+        to the rate, is below this
+    :param idling: A boolean indicating if idling noise is applied
+    :param workers: the number of worker processes, defaults to the number of
+        cores. With workers=1 the chunks are run in this process.
+    :param seed: an optional seed for reproducible chunk seeds
+    :param callback: an optional function called as callback(index, stats)
+        each time the results of a chunk for the strength at index are merged
+
+    :return: a list of InjectionStats, one for each strength
+    """
+
+    assert protocol in _PROTOCOL_TESTS
+
+    entropy = np.random.SeedSequence(seed).entropy
+
+    # Chunks are keyed by the arguments of the protocol, so the seeds of a
+    # strength do not depend on the other strengths in perrs
+    keys = [repr((protocol, float(perr), bool(idling))) for perr in perrs]
+    stats = [InjectionStats() for _ in perrs]
+    issued = [0] * len(perrs)
+    used = {key: 0 for key in keys}
+
+    def is_done(ii):
+        if issued[ii] >= trajectories:
+            return True
+        return target_rel_width is not None and stats[ii].is_resolved(target_rel_width)
+
+    def next_chunk():
+        # Round-robin over the noise strengths with trajectories left to issue
+        order = sorted(range(len(perrs)), key=lambda ii: issued[ii])
+        for ii in order:
+            if is_done(ii):
+                continue
+
+            count = min(chunk_trajectories, trajectories - issued[ii])
+            chunk = used[keys[ii]]
+            used[keys[ii]] += 1
+
+            issued[ii] += count
+
+            args = (
+                protocol,
+                perrs[ii],
+                idling,
+                count,
+                chunk_seed(entropy, keys[ii], chunk),
+            )
+            return ii, args
+
+        return None
+
+    def merge(ii, result):
+        stats[ii].merge(*result)
+        if callback is not None:
+            callback(ii, stats[ii])
+
+    run_chunks(next_chunk, _injection_chunk, merge, workers)
+
+    return stats
+
+
+# Samplers of the recorded protocols cached in each worker process, keyed by
+# their arguments
+_SAMPLER_CACHE = dict()
+
+
+def _injection_chunk(
+    protocol: str, perr: float, idling: bool, count: int, seed: int
+) -> tuple[int, np.ndarray]:
+
+    key = (protocol, perr, idling)
+    if key not in _SAMPLER_CACHE:
+        seq = multi_run_sequence(perr, _PROTOCOL_TESTS[protocol], idling=idling)
+        _SAMPLER_CACHE[key] = TrajectorySampler(seq, postselection_terminal)
+
+    rng = np.random.default_rng(seed)
+
+    chunk_stats = InjectionStats()
+    for ps, err in _SAMPLER_CACHE[key].run(count, rng):
+        chunk_stats.add(ps, err)
+
+    return chunk_stats.trajectories, chunk_stats.sums
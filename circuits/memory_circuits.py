@@ -0,0 +1,262 @@
+from stim import Circuit, CircuitRepeatBlock, target_rec
+
+from csscode.cssCode import cssCode
+from circuits.circuit_tools import FlagSchedule, syndrome_schedule
+from circuits.noise_models import NoiseModel
+
+__all__ = [
+    "memory_experiment",
+]
+
+
+def memory_experiment(
+    code: cssCode,
+    rounds: int,
+    basis="Z",
+    p_data: float = 0.0,
+    p_meas: float = 0.0,
+    noise_model: NoiseModel = None,
+    schedule=None,
+    flags=False,
+) -> Circuit:
+    r"""
+    Builds a memory experiment for a CSS code: the data qubits are prepared in
+    the given basis, rounds of syndrome extraction are performed and the data
+    qubits are then measured transversally in the same basis.
+
+    The first round is specialized, with detectors only for the checks whose
+    outcomes are deterministic, and the remaining rounds are emitted once
+    inside a REPEAT block with detectors comparing consecutive rounds. The
+    final data readout closes the checks of the basis and includes the
+    logical operators of that basis as observables, so the size of the
+    circuit does not grow with the number of rounds.
+
+    Ancilla qubits are labeled after the data qubits, first for the
+    Z-checks and then for the X-checks.
+
+    :param code: a cssCode
+    :param rounds: the number of rounds of syndrome extraction
+    :param basis: the basis "Z" or "X" in which the logical state is prepared
+        and measured
+    :param p_data: the strength of the single-qubit depolarizing channel
+        applied to the data qubits at the start of each round
+        (code-capacity/phenomenological noise)
+    :param p_meas: the probability of flipping the reported outcome of each
+        measurement (phenomenological noise)
+    :param noise_model: a NoiseModel applied to the whole circuit
+        (circuit-level noise)
+    :param schedule: the rounds of CNOTs of the syndrome extraction. None or
+        "coloring" uses the schedule of syndrome_schedule, which avoids hook
+        errors that lower the circuit distance, "greedy" measures the Z-checks
+        and then the X-checks with CNOTs placed greedily, in the order of the
+        qubit labels, whose hook errors can lower the circuit distance, and a
+        list of rounds of pairs (control, target) is used as it is
+    :param flags: A boolean indicating if the hook errors of the checks are
+        flagged, see FlagSchedule. The flag qubits are labeled after the
+        ancillas and every flag measurement is a detector.
+
+    :return: a stim Circuit
+    """
+
+    assert rounds > 0
+    assert basis in ["Z", "X"]
+
+    sector = basis == "Z"
+
+    data = sorted(code.qubits)
+    offset = max(data) + 1
+    nz = len(code.check_dict[True])
+    nx = len(code.check_dict[False])
+
+    ancillas = {
+        True: [offset + zcheck for zcheck in range(nz)],
+        False: [offset + nz + xcheck for xcheck in range(nx)],
+    }
+
+    if schedule is None or schedule == "coloring":
+        schedule = syndrome_schedule(code, ancillas)
+    elif schedule == "greedy":
+        schedule = _syndrome_schedule(code, ancillas)
+
+    flag_schedule = None
+    if flags:
+        flag_schedule = FlagSchedule(code, schedule, ancillas, offset + nz + nx)
+        schedule = flag_schedule.rounds
+
+    # Outcomes of each round are recorded as the flags measured during the
+    # round, the Z-checks, the X-checks and the flags measured with them
+    flag_records = []
+    if flag_schedule is not None:
+        flag_records = [key for keys in flag_schedule.measurements for key in keys]
+    nflags = len(flag_records)
+    nmid = nflags - (len(flag_schedule.measurements[-1]) if flags else 0)
+
+    nmeas = nz + nx + nflags
+    round_offset = {True: nmid, False: nmid + nz}
+
+    circuit = Circuit()
+
+    circuit.append("R" if sector else "RX", data)
+    circuit.append("R", ancillas[True])
+    circuit.append("RX", ancillas[False])
+    if flag_schedule is not None:
+        _append_flag_resets(circuit, flag_schedule, flag_schedule.resets[-1])
+    circuit.append("TICK")
+
+    # First round, where only the checks of the basis are deterministic
+    _append_syndrome_round(
+        circuit, data, ancillas, schedule, p_data, p_meas, flag_schedule
+    )
+    _append_flag_detectors(circuit, flag_schedule, flag_records, nmeas, nmid)
+
+    for ii, anc in enumerate(ancillas[sector]):
+        circuit.append(
+            "DETECTOR",
+            [target_rec(-nmeas + round_offset[sector] + ii)],
+            [anc, 0],
+        )
+
+    # Steady-state rounds comparing each check with the previous round
+    if rounds > 1:
+        body = Circuit()
+        body.append("SHIFT_COORDS", [], [0, 1])
+
+        _append_syndrome_round(
+            body, data, ancillas, schedule, p_data, p_meas, flag_schedule
+        )
+        _append_flag_detectors(body, flag_schedule, flag_records, nmeas, nmid)
+
+        for sect in [True, False]:
+            for ii, anc in enumerate(ancillas[sect]):
+                lookback = -nmeas + round_offset[sect] + ii
+                body.append(
+                    "DETECTOR",
+                    [target_rec(lookback), target_rec(lookback - nmeas)],
+                    [anc, 0],
+                )
+
+        circuit.append(CircuitRepeatBlock(rounds - 1, body))
+
+    # Final transversal readout of the data qubits
+    circuit.append("M" if sector else "MX", data, p_meas)
+
+    data_rec = {q: -len(data) + ii for ii, q in enumerate(data)}
+
+    for label, check in code.check_dict[sector].items():
+        lookback = -len(data) - nmeas + round_offset[sector] + label
+        targets = [target_rec(data_rec[q]) for q in sorted(check)]
+        targets.append(target_rec(lookback))
+        circuit.append("DETECTOR", targets, [ancillas[sector][label], 1])
+
+    logicals = code.zlogicals if sector else code.xlogicals
+    for ii, logical in enumerate(logicals):
+        targets = [target_rec(data_rec[q]) for q in sorted(logical)]
+        circuit.append("OBSERVABLE_INCLUDE", targets, ii)
+
+    if noise_model is not None:
+        circuit = noise_model.noisy_circuit(circuit)
+
+    return circuit
+
+
+def _syndrome_schedule(
+    code: cssCode, ancillas: dict[bool, list[int]]
+) -> list[list[tuple[int]]]:
+    # Rounds of CNOTs measuring all Z-checks and then all X-checks, with each
+    # CNOT placed greedily in the first round where both qubits are free
+
+    schedule = []
+
+    for sector in [True, False]:
+        rounds = []
+        busy = []
+        for label, check in code.check_dict[sector].items():
+            anc = ancillas[sector][label]
+            for q in sorted(check):
+                pair = (q, anc) if sector else (anc, q)
+
+                rnd = 0
+                while rnd < len(rounds) and not busy[rnd].isdisjoint(pair):
+                    rnd += 1
+
+                if rnd == len(rounds):
+                    rounds.append([])
+                    busy.append(set())
+
+                rounds[rnd].append(pair)
+                busy[rnd].update(pair)
+
+        schedule.extend(rounds)
+
+    return schedule
+
+
+def _append_syndrome_round(
+    circuit: Circuit,
+    data: list[int],
+    ancillas: dict[bool, list[int]],
+    schedule: list[list[tuple[int]]],
+    p_data: float,
+    p_meas: float,
+    flag_schedule: FlagSchedule = None,
+) -> None:
+
+    if p_data > 0:
+        circuit.append("DEPOLARIZE1", data, p_data)
+
+    for rnd, round in enumerate(schedule):
+        for pair in round:
+            circuit.append("CX", pair)
+        if flag_schedule is not None:
+            _append_flag_measurements(
+                circuit, flag_schedule, flag_schedule.measurements[rnd], p_meas
+            )
+            _append_flag_resets(circuit, flag_schedule, flag_schedule.resets[rnd])
+        circuit.append("TICK")
+
+    circuit.append("MR", ancillas[True], p_meas)
+    circuit.append("MRX", ancillas[False], p_meas)
+    if flag_schedule is not None:
+        _append_flag_measurements(
+            circuit, flag_schedule, flag_schedule.measurements[-1], p_meas
+        )
+        _append_flag_resets(circuit, flag_schedule, flag_schedule.resets[-1])
+    circuit.append("TICK")
+
+
+def _append_flag_measurements(
+    circuit: Circuit, flag_schedule: FlagSchedule, keys: list[tuple], p_meas: float
+) -> None:
+    # Flags of Z-checks are measured in the X basis and those of X-checks in
+    # the Z basis, in the order of the keys
+
+    for sector, label in keys:
+        circuit.append(
+            "MX" if sector else "M", flag_schedule.flags[(sector, label)], p_meas
+        )
+
+
+def _append_flag_resets(
+    circuit: Circuit, flag_schedule: FlagSchedule, keys: list[tuple]
+) -> None:
+
+    for sector, label in keys:
+        circuit.append("RX" if sector else "R", flag_schedule.flags[(sector, label)])
+
+
+def _append_flag_detectors(
+    circuit: Circuit,
+    flag_schedule: FlagSchedule,
+    flag_records: list[tuple],
+    nmeas: int,
+    nmid: int,
+) -> None:
+    # Each flag outcome of the round is zero without faults
+
+    for ii, key in enumerate(flag_records):
+        index = ii if ii < nmid else ii + nmeas - len(flag_records)
+        circuit.append(
+            "DETECTOR",
+            [target_rec(-nmeas + index)],
+            [flag_schedule.flags[key], 0],
+        )
@@ -0,0 +1,388 @@
+import re
+import numpy as np
+from stim import Circuit, CircuitInstruction, CircuitRepeatBlock, gate_data
+from qulacs import QuantumCircuit, QuantumState
+from qulacs.gate import (
+    CNOT,
+    CPTP,
+    CZ,
+    H,
+    P0,
+    P1,
+    RX,
+    RY,
+    RZ,
+    S,
+    SWAP,
+    X,
+    Y,
+    Z,
+    BitFlipNoise,
+    DephasingNoise,
+    DenseMatrix,
+    DepolarizingNoise,
+    Instrument,
+    Measurement,
+    Probabilistic,
+    Sdag,
+    TwoQubitDepolarizingNoise,
+    merge,
+    sqrtX,
+    sqrtXdag,
+    sqrtY,
+    sqrtYdag,
+)
+
+from circuits.gate_sequences import GateSequence
+from circuits.qulacs_circuits import update_state
+
+__all__ = [
+    "append_rotation",
+    "is_clifford",
+    "to_stim",
+    "to_qulacs",
+    "sample_measurements",
+]
+
+# Rotations are I instructions tagged with their axis and angle
+_ROTATION_TAG = re.compile(r"^R([XYZ])\((.+)\)$")
+
+# The Clifford gates for the rotations by multiples of pi/2 about each axis
+_CLIFFORD_ROTATIONS = {
+    "X": ["I", "SQRT_X", "X", "SQRT_X_DAG"],
+    "Y": ["I", "SQRT_Y", "Y", "SQRT_Y_DAG"],
+    "Z": ["I", "S", "Z", "S_DAG"],
+}
+
+_QULACS_ROTATIONS = {
+    "X": RX,
+    "Y": RY,
+    "Z": RZ,
+}
+
+# The qulacs gates of the stim unitary gates, by their canonical stim names
+_QULACS_GATES = {
+    "X": X,
+    "Y": Y,
+    "Z": Z,
+    "H": H,
+    "S": S,
+    "S_DAG": Sdag,
+    "SQRT_X": sqrtX,
+    "SQRT_X_DAG": sqrtXdag,
+    "SQRT_Y": sqrtY,
+    "SQRT_Y_DAG": sqrtYdag,
+    "CX": CNOT,
+    "CZ": CZ,
+    "SWAP": SWAP,
+}
+
+# The basis change before and after a measurement or reset in each basis
+_BASIS_CHANGES = {
+    "M": [],
+    "MR": [],
+    "R": [],
+    "MX": [H],
+    "MRX": [H],
+    "RX": [H],
+}
+
+# Instructions that do not act on the state
+_ANNOTATIONS = [
+    "TICK",
+    "DETECTOR",
+    "OBSERVABLE_INCLUDE",
+    "QUBIT_COORDS",
+    "SHIFT_COORDS",
+]
+
+
+def append_rotation(circuit: Circuit, axis: str, qubits: list[int], angle: float):
+    r"""
+    Appends the rotation exp(-i angle P / 2) about the Pauli axis P to each of
+    the qubits. A stim Circuit cannot hold non-Clifford gates, so the rotation
+    is an I instruction tagged with its axis and angle, such as I[RY(0.785)].
+    It is noiseless like any other gate, and NoiseModel adds the single-qubit
+    gate noise after it. The circuit can then be lowered to stim with to_stim if
+    it is Clifford, or to qulacs with to_qulacs.
+
+    The angle is that of the standard rotation: the qulacs gate RY(q, theta)
+    is the rotation by -theta.
+
+    :param circuit: a stim Circuit
+    :param axis: "X", "Y" or "Z"
+    :param qubits: list of qubits
+    :param angle: the rotation angle
+
+    :return: the stim Circuit
+    """
+
+    assert axis in _CLIFFORD_ROTATIONS
+
+    tag = "R" + axis + "(" + repr(float(angle)) + ")"
+    circuit.append(CircuitInstruction("I", list(qubits), tag=tag))
+
+    return circuit
+
+
+def is_clifford(circuit: Circuit) -> bool:
+    r"""
+    Determines if the circuit can be simulated by stim, i.e. if all of its
+    rotations are by multiples of pi/2.
+
+    :param circuit: a stim Circuit, possibly with rotations of append_rotation
+
+    :return: a boolean
+    """
+
+    for op in circuit.flattened():
+        rotation = _rotation(op)
+        if rotation is not None and _quarter_turns(rotation[1]) is None:
+            return False
+
+    return True
+
+
+def to_stim(circuit: Circuit) -> Circuit:
+    r"""
+    Lowers the rotations of a Clifford circuit to stim gates.
+
+    :param circuit: a stim Circuit, possibly with rotations of append_rotation
+
+    :return: a stim Circuit without rotations
+    """
+
+    lowered = Circuit()
+
+    for op in circuit:
+        if isinstance(op, CircuitRepeatBlock):
+            lowered.append(CircuitRepeatBlock(op.repeat_count, to_stim(op.body_copy())))
+            continue
+
+        rotation = _rotation(op)
+        if rotation is None:
+            lowered.append(op)
+            continue
+
+        turns = _quarter_turns(rotation[1])
+        if turns is None:
+            raise ValueError("rotation " + op.tag + " is not Clifford")
+
+        name = _CLIFFORD_ROTATIONS[rotation[0]][turns]
+        if name != "I":
+            lowered.append(name, [t.value for t in op.targets_copy()])
+
+    return lowered
+
+
+def to_qulacs(circuit: Circuit, state: QuantumState, postselect=False):
+    r"""
+    Applies the circuit to a QuantumState, or records it in a GateSequence, with
+    the qulacs gates of its instructions. Noise channels are applied as qulacs
+    noise gates, and measurements write their outcome to the classical register
+    of the state, indexed by the order of the measurements in the circuit. With
+    postselect, measurements instead project onto the zero outcome without
+    normalizing, as postselect does, so the norm of the state is the
+    probability of all of them being zero.
+
+    Resets of qubits that have not yet been acted on are skipped, as they are
+    in the zero state. Other resets are applied as a qulacs CPTP channel, which
+    normalizes the state, so with postselect they are only allowed as part of a
+    measurement. The outcomes of measurements with a flip probability, as in
+    M(p), are flipped with that probability, the qubit being left in the state
+    of the actual outcome. Detectors, observables and coordinates are ignored.
+
+    :param circuit: a stim Circuit, possibly with rotations of append_rotation
+    :param state: a QuantumState or GateSequence on at least circuit.num_qubits qubits
+    :param postselect: A boolean indicating if measurements are post-selected
+
+    :return: the updated state
+    """
+
+    active = set()
+    measurements = 0
+
+    for op in circuit.flattened():
+        name = gate_data(op.name).name
+        if name in _ANNOTATIONS:
+            continue
+
+        qubits = [t.value for t in op.targets_copy() if t.is_qubit_target]
+        args = op.gate_args_copy()
+
+        rotation = _rotation(op)
+        if rotation is not None:
+            # qulacs rotates in the opposite direction
+            for q in qubits:
+                update_state(state, _QULACS_ROTATIONS[rotation[0]](q, -rotation[1]))
+
+        elif name in _QULACS_GATES:
+            if len(qubits) != len(op.targets_copy()):
+                raise ValueError("classically controlled gates are not supported")
+
+            if gate_data(name).is_two_qubit_gate:
+                for ii in range(0, len(qubits), 2):
+                    update_state(state, _QULACS_GATES[name](qubits[ii], qubits[ii + 1]))
+            else:
+                for q in qubits:
+                    update_state(state, _QULACS_GATES[name](q))
+
+        elif name in ["DEPOLARIZE1", "X_ERROR", "Y_ERROR", "Z_ERROR"]:
+            for q in qubits:
+                update_state(state, _noise_gate(name, q, args[0]))
+
+        elif name == "DEPOLARIZE2":
+            for ii in range(0, len(qubits), 2):
+                update_state(
+                    state,
+                    TwoQubitDepolarizingNoise(qubits[ii], qubits[ii + 1], args[0]),
+                )
+
+        elif name in _BASIS_CHANGES:
+            for q in qubits:
+                if name.startswith("M"):
+                    for gate in _BASIS_CHANGES[name]:
+                        update_state(state, gate(q))
+
+                    flip = args[0] if len(args) else 0.0
+                    if flip and name in ["M", "MX"]:
+                        # The outcome is recorded flipped with probability flip
+                        # by a weak measurement, and the qubit is collapsed to
+                        # its actual outcome by a full dephasing
+                        kraus = _flipped_measurement(q, flip)
+                        if postselect:
+                            update_state(state, kraus[0])
+                        else:
+                            update_state(state, Instrument(kraus, measurements))
+                        update_state(state, DephasingNoise(q, 0.5))
+                    else:
+                        # The qubit is reset afterwards, so flipping it before
+                        # the measurement only flips the outcome
+                        if flip:
+                            update_state(state, BitFlipNoise(q, flip))
+
+                        if postselect:
+                            update_state(state, P0(q))
+                        else:
+                            update_state(state, Measurement(q, measurements))
+                    measurements += 1
+
+                    if name in ["M", "MX"]:
+                        for gate in _BASIS_CHANGES[name]:
+                            update_state(state, gate(q))
+                        continue
+
+                    # After a post-selected measurement the qubit is in the zero state
+                    if not postselect:
+                        update_state(state, _reset_gate(q))
+
+                elif q in active:
+                    if postselect:
+                        raise ValueError("resets of active qubits are not linear")
+                    update_state(state, _reset_gate(q))
+
+                for gate in _BASIS_CHANGES[name]:
+                    update_state(state, gate(q))
+
+        else:
+            raise ValueError("instruction " + name + " is not supported by qulacs")
+
+        active.update(qubits)
+
+    return state
+
+
+def sample_measurements(
+    circuit: Circuit, shots: int, backend: str = None, seed: int = None
+) -> np.ndarray:
+    r"""
+    Samples the measurement outcomes of the circuit on the fastest backend that
+    can run it: stim if the circuit is Clifford, see is_clifford, and qulacs
+    otherwise, one state vector per shot.
+
+    :param circuit: a stim Circuit, possibly with rotations of append_rotation
+    :param shots: the number of shots
+    :param backend: "stim" or "qulacs" to choose the backend, or None
+    :param seed: an optional seed, used by stim only since the noise and
+        measurement gates of qulacs draw from its own generator
+
+    :return: a boolean array of shape (shots, number of measurements)
+    """
+
+    if backend is None:
+        backend = "stim" if is_clifford(circuit) else "qulacs"
+
+    assert backend in ["stim", "qulacs"]
+
+    if backend == "stim":
+        return to_stim(circuit).compile_sampler(seed=seed).sample(shots)
+
+    # Lower the circuit once, its gates drawing new noise and outcomes each shot
+    seq = GateSequence(circuit.num_qubits)
+    to_qulacs(circuit, seq)
+
+    compiled = QuantumCircuit(circuit.num_qubits)
+    for op in seq.ops:
+        compiled.add_gate(op[1])
+
+    samples = np.zeros((shots, circuit.num_measurements), dtype=bool)
+    state = QuantumState(circuit.num_qubits)
+    for shot in range(shots):
+        state.set_zero_state()
+        compiled.update_quantum_state(state)
+
+        for ii in range(circuit.num_measurements):
+            samples[shot, ii] = state.get_classical_value(ii)
+
+    return samples
+
+
+def _rotation(op: CircuitInstruction):
+    # The axis and angle of a rotation of append_rotation, or None
+
+    if op.name != "I" or not op.tag:
+        return None
+
+    match = _ROTATION_TAG.match(op.tag)
+    if match is None:
+        return None
+
+    return match.group(1), float(match.group(2))
+
+
+def _quarter_turns(angle: float):
+    # The number of quarter turns of a rotation by a multiple of pi/2, or None
+
+    turns = angle / (np.pi / 2)
+    if not np.isclose(turns, np.round(turns)):
+        return None
+
+    return int(np.round(turns)) % 4
+
+
+def _flipped_measurement(qubit: int, flip: float) -> list:
+    # The Kraus operators of the outcomes 0 and 1 of a measurement whose
+    # outcome is flipped with probability flip
+
+    keep, swap = np.sqrt(1 - flip), np.sqrt(flip)
+
+    return [
+        DenseMatrix(qubit, np.diag([keep, swap])),
+        DenseMatrix(qubit, np.diag([swap, keep])),
+    ]
+
+
+def _reset_gate(qubit: int):
+    return CPTP([P0(qubit), merge(P1(qubit), X(qubit))])
+
+
+def _noise_gate(name: str, qubit: int, perr: float):
+
+    if name == "DEPOLARIZE1":
+        return DepolarizingNoise(qubit, perr)
+    if name == "X_ERROR":
+        return BitFlipNoise(qubit, perr)
+    if name == "Z_ERROR":
+        return DephasingNoise(qubit, perr)
+
+    return Probabilistic([perr], [Y(qubit)])
@@ -0,0 +1,353 @@
+import hashlib
+import os
+import numpy as np
+import pymatching
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from stim import Circuit
+
+from csscode.cssCode import cssCode
+from circuits.memory_circuits import memory_experiment
+from circuits.noise_models import NoiseModel
+from circuits.results_store import ResultsStore, task_key
+
+__all__ = [
+    "SamplingTask",
+    "SampleStats",
+    "run_tasks",
+    "run_chunks",
+    "chunk_seed",
+    "wilson_interval",
+]
+
+
+class SamplingTask:
+
+    def __init__(
+        self,
+        circuit: Circuit = None,
+        code: cssCode = None,
+        rounds: int = 1,
+        basis="Z",
+        p_data: float = 0.0,
+        p_meas: float = 0.0,
+        noise_model: NoiseModel = None,
+        decoder="pymatching",
+        max_shots: int = 10**6,
+        max_errors: int = None,
+        target_rel_width: float = None,
+        metadata: dict = None,
+    ) -> None:
+        r"""
+        A Monte Carlo task estimating the logical error rate of a stim Circuit
+        with detectors and observables. Instead of a circuit, a cssCode can be
+        given together with the arguments of memory_experiment.
+
+        Properties of a SamplingTask object:
+
+        :property circuit: The stim Circuit that is sampled.
+
+        :property decoder: The decoder applied to the detection events, either
+            "pymatching" or None. With None, a shot is a logical error if any
+            observable flips.
+
+        :property max_shots: The largest number of shots to take.
+
+        :property max_errors: The task stops once this many logical errors are seen.
+
+        :property target_rel_width: The task stops once the width of the 95%
+            Wilson interval relative to the estimated error rate is below this.
+
+        :property metadata: A dictionary of user data describing the task.
+        """
+
+        assert (circuit is None) != (code is None)
+        assert decoder in ["pymatching", None]
+
+        if code is not None:
+            circuit = memory_experiment(
+                code, rounds, basis, p_data, p_meas, noise_model=noise_model
+            )
+        elif noise_model is not None:
+            circuit = noise_model.noisy_circuit(circuit)
+
+        self.circuit = circuit
+        self.decoder = decoder
+        self.max_shots = max_shots
+        self.max_errors = max_errors
+        self.target_rel_width = target_rel_width
+        self.metadata = dict() if metadata is None else metadata
+
+    def is_resolved(self, stats: "SampleStats") -> bool:
+        r"""
+        Determines if the statistics collected for the task meet one of its
+        stopping conditions.
+
+        :param stats: a SampleStats
+
+        :return: a boolean
+        """
+
+        if stats.shots >= self.max_shots:
+            return True
+
+        if self.max_errors is not None and stats.errors >= self.max_errors:
+            return True
+
+        if self.target_rel_width is not None and stats.errors > 0:
+            low, high = stats.interval()
+            return (high - low) / stats.rate <= self.target_rel_width
+
+        return False
+
+
+class SampleStats:
+
+    def __init__(self, shots: int = 0, errors: int = 0) -> None:
+        r"""
+        Counts of shots and logical errors collected for a task.
+
+        :property shots: The number of shots taken.
+
+        :property errors: The number of shots with a logical error.
+        """
+
+        self.shots = shots
+        self.errors = errors
+
+    @property
+    def rate(self) -> float:
+        return self.errors / self.shots if self.shots else 0.0
+
+    def interval(self, z: float = 1.96) -> tuple[float, float]:
+        r"""
+        The Wilson score interval of the logical error rate.
+
+        :param z: the number of standard deviations of the interval
+
+        :return: a tuple (low, high)
+        """
+
+        return wilson_interval(self.errors, self.shots, z)
+
+    def merge(self, shots: int, errors: int) -> None:
+        self.shots += shots
+        self.errors += errors
+
+    def __repr__(self) -> str:
+        return f"SampleStats(shots={self.shots}, errors={self.errors})"
+
+
+def wilson_interval(errors: int, shots: int, z: float = 1.96) -> tuple[float, float]:
+    r"""
+    The Wilson score interval of a binomial proportion.
+
+    :param errors: the number of successes of the binomial
+    :param shots: the number of trials of the binomial
+    :param z: the number of standard deviations of the interval
+
+    :return: a tuple (low, high)
+    """
+
+    if not shots:
+        return (0.0, 1.0)
+
+    rate = errors / shots
+    denom = 1 + z**2 / shots
+    center = (rate + z**2 / (2 * shots)) / denom
+    half = z * np.sqrt(rate * (1 - rate) / shots + z**2 / (4 * shots**2)) / denom
+
+    return (max(0.0, center - half), min(1.0, center + half))
+
+
+def run_tasks(
+    tasks: list[SamplingTask],
+    chunk_shots: int = 10000,
+    workers: int = None,
+    seed: int = None,
+    callback=None,
+    store: ResultsStore = None,
+) -> list[SampleStats]:
+    r"""
+    Samples a list of tasks, splitting the shots of each task into chunks that
+    are run across a pool of processes. Each chunk is seeded independently from
+    seed, the task key and the chunk index, so identical tasks share their
+    chunk indices rather than their samples. Results are merged as chunks
+    complete and no further chunks are issued for a task once it is resolved.
+
+    :param tasks: a list of SamplingTasks
+    :param chunk_shots: the number of shots in each chunk
+    :param workers: the number of worker processes, defaults to the number of
+        cores. With workers=1 the chunks are run in this process.
+    :param seed: an optional seed for reproducible chunk seeds
+    :param callback: an optional function called as callback(index, stats)
+        each time the results of a chunk for the task at index are merged
+    :param store: an optional ResultsStore. Counts already stored for a task
+        count towards its stopping conditions, so completed tasks are skipped
+        and partial ones topped up, and the counts of each chunk are appended
+        to the store as they arrive, with its index and the entropy of seed.
+        Chunks stored with the same entropy are never drawn again, even if
+        an interrupted run left gaps in their indices.
+
+    :return: a list of SampleStats, one for each task
+    """
+
+    entropy = np.random.SeedSequence(seed).entropy
+
+    texts = [str(task.circuit) for task in tasks]
+    keys = [task_key(task, seed_policy=seed) for task in tasks]
+    stats = [SampleStats() for _ in tasks]
+
+    # Shots issued to each task, including chunks still running
+    issued = [0] * len(tasks)
+
+    # Chunk indices of each key that are running or stored with the same
+    # entropy, whose seeds are never drawn again
+    used = {key: set() for key in keys}
+
+    if store is not None:
+        totals = store.totals()
+        for ii, key in enumerate(keys):
+            shots, errors, _ = totals.get(key, (0, 0, 0))
+            stats[ii].merge(shots, errors)
+            issued[ii] = shots
+
+        for key, chunks in store.chunks(entropy).items():
+            if key in used:
+                used[key].update(chunks)
+
+    def next_chunk():
+        # Round-robin over the unresolved tasks with shots left to issue
+        order = sorted(range(len(tasks)), key=lambda ii: issued[ii])
+        for ii in order:
+            task = tasks[ii]
+            if task.is_resolved(stats[ii]) or issued[ii] >= task.max_shots:
+                continue
+
+            shots = min(chunk_shots, task.max_shots - issued[ii])
+
+            chunk = 0
+            while chunk in used[keys[ii]]:
+                chunk += 1
+            used[keys[ii]].add(chunk)
+
+            issued[ii] += shots
+
+            args = (
+                texts[ii],
+                task.decoder,
+                shots,
+                chunk_seed(entropy, keys[ii], chunk),
+            )
+            return (ii, chunk), args
+
+        return None
+
+    def merge(tag, result):
+        ii, chunk = tag
+        stats[ii].merge(*result)
+        if store is not None:
+            store.append(
+                keys[ii],
+                *result,
+                metadata=tasks[ii].metadata,
+                chunk=chunk,
+                entropy=entropy,
+            )
+        if callback is not None:
+            callback(ii, stats[ii])
+
+    run_chunks(next_chunk, _sample_chunk, merge, workers)
+
+    return stats
+
+
+def run_chunks(next_chunk, run_chunk, merge, workers: int = None) -> None:
+    r"""
+    Runs chunks of work across a pool of processes, keeping twice as many
+    chunks in flight as there are workers and merging their results as they
+    complete, so that next_chunk sees every result merged so far.
+
+    :param next_chunk: a function called without arguments that returns the
+        next chunk as a pair (tag, args), or None once no chunk is left
+    :param run_chunk: a function of the module level, called in a worker as
+        run_chunk(*args), returning the result of a chunk
+    :param merge: a function called as merge(tag, result) in this process
+    :param workers: the number of worker processes, defaults to the number of
+        cores. With workers=1 the chunks are run in this process.
+    """
+
+    workers = os.cpu_count() if workers is None else workers
+
+    if workers == 1:
+        chunk = next_chunk()
+        while chunk is not None:
+            tag, args = chunk
+            merge(tag, run_chunk(*args))
+            chunk = next_chunk()
+
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = dict()
+
+        def fill():
+            while len(running) < 2 * workers:
+                chunk = next_chunk()
+                if chunk is None:
+                    return
+                tag, args = chunk
+                running[pool.submit(run_chunk, *args)] = tag
+
+        fill()
+        while len(running):
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                merge(running.pop(future), future.result())
+            fill()
+
+
+def chunk_seed(entropy: int, key, chunk_index: int) -> int:
+    r"""
+    The seed of a chunk of samples, independent for every entropy, key and
+    chunk index.
+
+    :param entropy: the entropy of a numpy SeedSequence
+    :param key: an integer or a string identifying the task, such as a task
+        key, whose sha256 hash spawns the seed sequence
+    :param chunk_index: the index of the chunk within the task
+
+    :return: an integer seed
+    """
+
+    if isinstance(key, str):
+        digest = hashlib.sha256(key.encode()).digest()
+        key = tuple(
+            int.from_bytes(digest[ii : ii + 4], "little") for ii in range(0, 32, 4)
+        )
+    else:
+        key = (key,)
+
+    seq = np.random.SeedSequence(entropy, spawn_key=key + (chunk_index,))
+    return int(seq.generate_state(1, np.uint64)[0])
+
+
+# Matching graphs cached in each worker process, keyed by the circuit text
+_MATCHING_CACHE = dict()
+
+
+def _sample_chunk(text: str, decoder, shots: int, seed: int) -> tuple[int, int]:
+
+    circuit = Circuit(text)
+    sampler = circuit.compile_detector_sampler(seed=seed)
+    dets, obs = sampler.sample(shots=shots, separate_observables=True)
+
+    if decoder is None:
+        return shots, int(np.count_nonzero(np.any(obs, axis=1)))
+
+    if text not in _MATCHING_CACHE:
+        dem = circuit.detector_error_model(decompose_errors=True)
+        _MATCHING_CACHE[text] = pymatching.Matching.from_detector_error_model(dem)
+
+    predictions = _MATCHING_CACHE[text].decode_batch(dets)
+
+    return shots, int(np.count_nonzero(np.any(predictions != obs, axis=1)))
@@ -0,0 +1,294 @@
+import numpy as np
+from stim import Circuit, CircuitInstruction, CircuitRepeatBlock, gate_data
+
+__all__ = [
+    "NoiseModel",
+]
+
+
+class NoiseModel:
+
+    def __init__(
+        self,
+        p1: float = 0.0,
+        p2: float = 0.0,
+        p_idle: float = 0.0,
+        p_reset: float = 0.0,
+        p_meas: float = 0.0,
+        gate_rates: dict[str, float] = None,
+        qubit_rates: dict[int, float] = None,
+        coupler_rates: dict[tuple[int], float] = None,
+    ) -> None:
+        r"""
+        A circuit-level noise model that is applied to a noiseless, scheduled
+        stim Circuit in a single pass. Rounds of the schedule are taken to be
+        separated by TICK instructions.
+
+        Properties of a NoiseModel object:
+
+        :property p1: Strength of the single-qubit depolarizing channel applied
+        after each single-qubit gate.
+
+        :property p2: Strength of the two-qubit depolarizing channel applied
+        after each two-qubit gate.
+
+        :property p_idle: Strength of the single-qubit depolarizing channel applied
+        to active qubits that are not acted on in a round.
+
+        :property p_reset: Strength of the single-qubit depolarizing channel applied
+        after each reset.
+
+        :property p_meas: Strength of the single-qubit depolarizing channel applied
+        before each measurement.
+
+        :property gate_rates: A dictionary mapping gate names to noise strengths
+        that override p1 (p2) for that single-qubit (two-qubit) gate.
+
+        :property qubit_rates: A dictionary mapping qubit labels to noise strengths
+        that override the single-qubit noise locations on that qubit which are
+        switched on in the model. A strength can also be given for each type of
+        location separately, as a dictionary mapping some of "gate", "idle",
+        "reset" and "measurement" to strengths, the other types keeping the
+        strength of the model.
+
+        :property coupler_rates: A dictionary mapping pairs of qubits (a, b), with
+        a < b, to noise strengths that override the two-qubit gate noise on that
+        pair when it is switched on in the model.
+        """
+
+        self.p1 = p1
+        self.p2 = p2
+        self.p_idle = p_idle
+        self.p_reset = p_reset
+        self.p_meas = p_meas
+
+        gate_rates = dict() if gate_rates is None else gate_rates
+        self.gate_rates = {gate_data(k).name: v for k, v in gate_rates.items()}
+        self.qubit_rates = dict() if qubit_rates is None else dict(qubit_rates)
+        self.coupler_rates = dict()
+        if coupler_rates is not None:
+            self.coupler_rates = {(min(k), max(k)): v for k, v in coupler_rates.items()}
+
+    @classmethod
+    def uniform(cls, perr: float, idling=True) -> "NoiseModel":
+        r"""
+        The uniform circuit-level depolarizing noise model, with every noise
+        location having strength perr. Its locations are those of the noisy
+        builders of stim_circuits, after gates and resets and before
+        measurements, but it is not equivalent to them: the builders place
+        idling noise by their own schedules rather than by TICKs, and some
+        also flip measurement outcomes.
+
+        :param perr: the noise strength
+        :param idling: A boolean indicating if idling noise is applied
+
+        :return: a NoiseModel
+        """
+
+        return cls(
+            p1=perr,
+            p2=perr,
+            p_idle=perr if idling else 0.0,
+            p_reset=perr,
+            p_meas=perr,
+        )
+
+    @classmethod
+    def from_architecture(
+        cls,
+        architecture,
+        p1: float = 0.0,
+        p2: float = 0.0,
+        p_idle: float = 0.0,
+        p_reset: float = 0.0,
+        p_meas: float = 0.0,
+        gate_rates: dict[str, float] = None,
+    ) -> "NoiseModel":
+        r"""
+        A NoiseModel with the error rates of the qubits and couplers of an
+        ArchitectureGraph, for circuits on its physical qubits such as those
+        of route_circuit. The qubit rates override the single-qubit noise
+        locations and the coupler rates the two-qubit gate noise, where set.
+        A qubit rate is a single strength, so it overrides every type of
+        single-qubit location switched on in the model: with a nonzero p_meas
+        the measurement noise of the qubit is its rate, and likewise for
+        p_reset and p_idle, not only its gate noise p1.
+
+        :param architecture: an ArchitectureGraph
+        :param p1: the default single-qubit gate noise
+        :param p2: the default two-qubit gate noise
+        :param p_idle: the default idling noise
+        :param p_reset: the default reset noise
+        :param p_meas: the default measurement noise
+        :param gate_rates: the default noise of some gates
+
+        :return: a NoiseModel
+        """
+
+        qubits = np.flatnonzero(~np.isnan(architecture.qubit_rates))
+        couplers = np.flatnonzero(~np.isnan(architecture.coupler_rates))
+
+        qubit_rates = {
+            int(q): float(rate)
+            for q, rate in zip(qubits, architecture.qubit_rates[qubits])
+        }
+        coupler_rates = {
+            (int(a), int(b)): float(rate)
+            for (a, b), rate in zip(
+                architecture.edges[couplers], architecture.coupler_rates[couplers]
+            )
+        }
+
+        return cls(
+            p1, p2, p_idle, p_reset, p_meas, gate_rates, qubit_rates, coupler_rates
+        )
+
+    def noisy_circuit(self, circuit: Circuit, active: list[int] = None) -> Circuit:
+        r"""
+        Produces a copy of the noiseless circuit with the noise of the model
+        inserted. Qubits become active once they are first acted on (or if they
+        are listed in active) and inactive once measured without a reset.
+
+        :param circuit: a noiseless stim Circuit with rounds separated by TICKs
+        :param active: a list of qubits that are active at the start of the circuit
+
+        :return: a stim Circuit
+        """
+
+        noisy = Circuit()
+        active_set = set() if active is None else set(active)
+
+        self._insert_noise(circuit, noisy, active_set)
+
+        return noisy
+
+    def _insert_noise(self, circuit: Circuit, noisy: Circuit, active_set: set) -> None:
+
+        # qubits acted on in the current round
+        round_set = set()
+
+        for op in circuit:
+
+            if isinstance(op, CircuitRepeatBlock):
+                self._flush_round(noisy, active_set, round_set)
+                body = Circuit()
+                self._insert_noise(op.body_copy(), body, active_set)
+                noisy.append(CircuitRepeatBlock(op.repeat_count, body))
+                round_set = set()
+                continue
+
+            if op.name == "TICK":
+                self._flush_round(noisy, active_set, round_set)
+                noisy.append(op)
+                round_set = set()
+                continue
+
+            gate = gate_data(op.name)
+            qubits = [t.value for t in op.targets_copy() if t.is_qubit_target]
+
+            # Annotations, such as QUBIT_COORDS, and pre-existing noise channels
+            # are copied as they are
+            if not len(qubits) or not (
+                gate.is_unitary or gate.is_reset or gate.produces_measurements
+            ):
+                noisy.append(op)
+                continue
+
+            round_set.update(qubits)
+
+            if gate.produces_measurements:
+                self._append_channel(
+                    noisy, "DEPOLARIZE1", qubits, self.p_meas, "measurement"
+                )
+                noisy.append(op)
+
+                if gate.is_reset:
+                    self._append_channel(
+                        noisy, "DEPOLARIZE1", qubits, self.p_reset, "reset"
+                    )
+                else:
+                    active_set.difference_update(qubits)
+
+            elif gate.is_reset:
+                noisy.append(op)
+                self._append_channel(
+                    noisy, "DEPOLARIZE1", qubits, self.p_reset, "reset"
+                )
+                active_set.update(qubits)
+
+            elif gate.is_two_qubit_gate:
+                noisy.append(op)
+                pairs = self._qubit_pairs(op)
+                perr = self.gate_rates.get(gate.name, self.p2)
+                self._append_pair_channel(noisy, pairs, perr)
+                active_set.update(qubits)
+
+            else:
+                noisy.append(op)
+                perr = self.gate_rates.get(gate.name, self.p1)
+                self._append_channel(noisy, "DEPOLARIZE1", qubits, perr, "gate")
+                active_set.update(qubits)
+
+        self._flush_round(noisy, active_set, round_set)
+
+    def _flush_round(self, noisy: Circuit, active_set: set, round_set: set) -> None:
+        # Apply noise to active qubits that were idle in the round
+        if len(round_set):
+            idle_list = sorted(active_set - round_set)
+            self._append_channel(noisy, "DEPOLARIZE1", idle_list, self.p_idle, "idle")
+
+    def _append_channel(
+        self,
+        noisy: Circuit,
+        channel: str,
+        qubits: list[int],
+        perr: float,
+        location: str,
+    ) -> None:
+        # Locations switched off in the model stay off for every qubit
+        if perr <= 0:
+            return
+
+        # Group the targets by their noise strength so that each strength
+        # costs a single instruction
+        groups = dict()
+        for q in qubits:
+            rate = self._qubit_rate(q, location, perr)
+            if rate > 0:
+                groups.setdefault(rate, []).append(q)
+
+        for rate, targets in groups.items():
+            noisy.append(CircuitInstruction(channel, targets, [rate]))
+
+    def _qubit_rate(self, qubit: int, location: str, perr: float) -> float:
+        # The strength of a single-qubit location of the given type on the qubit
+        rate = self.qubit_rates.get(qubit, perr)
+        if isinstance(rate, dict):
+            return rate.get(location, perr)
+        return rate
+
+    def _append_pair_channel(
+        self, noisy: Circuit, pairs: list[tuple[int, int]], perr: float
+    ) -> None:
+        if perr <= 0:
+            return
+
+        # Grouped by strength as for the single-qubit channels
+        groups = dict()
+        for a, b in pairs:
+            rate = self.coupler_rates.get((min(a, b), max(a, b)), perr)
+            if rate > 0:
+                groups.setdefault(rate, []).extend([a, b])
+
+        for rate, targets in groups.items():
+            noisy.append(CircuitInstruction("DEPOLARIZE2", targets, [rate]))
+
+    @staticmethod
+    def _qubit_pairs(op: CircuitInstruction) -> list[tuple[int, int]]:
+        targets = op.targets_copy()
+        pairs = []
+        for ii in range(0, len(targets), 2):
+            a, b = targets[ii], targets[ii + 1]
+            if a.is_qubit_target and b.is_qubit_target:
+                pairs.append((a.value, b.value))
+        return pairs
@@ -0,0 +1,198 @@
+import numbers
+import numpy as np
+from stim import Circuit, CircuitRepeatBlock, DetectorErrorModel, gate_data
+
+from circuits.noise_models import NoiseModel
+
+__all__ = [
+    "NoiseSweep",
+]
+
+
+class NoiseSweep:
+
+    def __init__(
+        self,
+        circuit: Circuit,
+        noise_model: NoiseModel = None,
+        reference: float = 1.0,
+        active: list[int] = None,
+    ) -> None:
+        r"""
+        A template for sweeping the noise strength of a fixed circuit. The
+        schedule and the noise placement are worked out once; each point of a
+        sweep then only substitutes the noise probabilities into the template.
+
+        Every noise probability of the template is stored relative to the
+        reference strength, so that at noise strength p it becomes
+        p * probability / reference.
+
+        Properties of a NoiseSweep object:
+
+        :property weights: A list of the distinct relative noise strengths
+        appearing in the template.
+
+        :property segments: A list of circuit text segments, with the
+        probability weights[slots[ii]] placed between segments[ii] and
+        segments[ii + 1].
+
+        :property slots: A list of indices into weights, one for each
+        noise probability of the template.
+
+        :param circuit: a stim Circuit. If no noise_model is given this is taken
+            to be a noisy circuit built at noise strength reference.
+        :param noise_model: a NoiseModel, applied to the (noiseless) circuit to
+            build the template at noise strength reference.
+        :param reference: the noise strength at which the template is built.
+        :param active: a list of qubits that are active at the start of the
+            circuit, passed to the noise model.
+        """
+
+        if noise_model is not None:
+            circuit = noise_model.noisy_circuit(circuit, active=active)
+
+        self.reference = reference
+        self.weights = []
+        self.slots = []
+        self.segments = [""]
+        self._weight_index = dict()
+
+        self._build_template(circuit, "")
+
+    def _build_template(self, circuit: Circuit, indent: str) -> None:
+
+        for op in circuit:
+            if isinstance(op, CircuitRepeatBlock):
+                self.segments[-1] += indent + "REPEAT " + str(op.repeat_count) + " {\n"
+                self._build_template(op.body_copy(), indent + "    ")
+                self.segments[-1] += indent + "}\n"
+                continue
+
+            args = op.gate_args_copy()
+            text = str(op)
+
+            # Instructions without noise probabilities are copied as they are
+            if not gate_data(op.name).is_noisy_gate or not len(args):
+                self.segments[-1] += indent + text + "\n"
+                continue
+
+            # Split the instruction around its parenthesized probabilities
+            head = text[: text.index("(")]
+            tail = text[text.index(")") + 1 :]
+
+            self.segments[-1] += indent + head + "("
+
+            for jj, arg in enumerate(args):
+                weight = arg / self.reference
+                if weight not in self._weight_index:
+                    self._weight_index[weight] = len(self.weights)
+                    self.weights.append(weight)
+
+                self.slots.append(self._weight_index[weight])
+                self.segments.append("" if jj == len(args) - 1 else ", ")
+
+            self.segments[-1] += ")" + tail + "\n"
+
+    def circuit(self, perr: float) -> Circuit:
+        r"""
+        Produces the circuit of the template at noise strength perr.
+
+        :param perr: the noise strength
+
+        :return: a stim Circuit
+        """
+
+        probs = [repr(float(perr * w)) for w in self.weights]
+
+        text = [self.segments[0]]
+        for slot, segment in zip(self.slots, self.segments[1:]):
+            text.append(probs[slot])
+            text.append(segment)
+
+        return Circuit("".join(text))
+
+    def circuits(self, perrs: list[float]) -> list[Circuit]:
+        r"""
+        Produces the circuits of the template for each noise strength in perrs.
+
+        :param perrs: list of noise strengths
+
+        :return: a list of stim Circuits
+        """
+
+        return [self.circuit(perr) for perr in perrs]
+
+    def detector_error_models(
+        self, perrs: list[float], **kwargs
+    ) -> list[DetectorErrorModel]:
+        r"""
+        Produces the detector error models of the template for each noise
+        strength in perrs. Keyword arguments are passed on to
+        Circuit.detector_error_model.
+
+        :param perrs: list of noise strengths
+
+        :return: a list of stim DetectorErrorModels
+        """
+
+        return [self.circuit(perr).detector_error_model(**kwargs) for perr in perrs]
+
+    def sample(
+        self, perrs: list[float], shots: int | list[int], seed: int = None
+    ) -> list[np.ndarray]:
+        r"""
+        Samples the measurement record of the template for each noise strength
+        in perrs.
+
+        :param perrs: list of noise strengths
+        :param shots: the number of shots for every point, or a list with the
+            number of shots for each point
+        :param seed: an optional seed, from which a seed for each point is drawn
+
+        :return: a list of boolean arrays of shape (shots, num_measurements)
+        """
+
+        results = []
+        for perr, nshots, pseed in zip(perrs, *self._budgets(perrs, shots, seed)):
+            sampler = self.circuit(perr).compile_sampler(seed=pseed)
+            results.append(sampler.sample(shots=nshots))
+
+        return results
+
+    def sample_detectors(
+        self, perrs: list[float], shots: int | list[int], seed: int = None
+    ) -> list[tuple[np.ndarray, np.ndarray]]:
+        r"""
+        Samples the detection events and observable flips of the template for
+        each noise strength in perrs.
+
+        :param perrs: list of noise strengths
+        :param shots: the number of shots for every point, or a list with the
+            number of shots for each point
+        :param seed: an optional seed, from which a seed for each point is drawn
+
+        :return: a list of tuples of boolean arrays (detection_events, observable_flips)
+        """
+
+        results = []
+        for perr, nshots, pseed in zip(perrs, *self._budgets(perrs, shots, seed)):
+            sampler = self.circuit(perr).compile_detector_sampler(seed=pseed)
+            results.append(sampler.sample(shots=nshots, separate_observables=True))
+
+        return results
+
+    @staticmethod
+    def _budgets(perrs: list[float], shots: int | list[int], seed: int) -> tuple:
+
+        # numpy integers are not int, so the scalar case is tested as Integral
+        if isinstance(shots, numbers.Integral):
+            shots = [int(shots)] * len(perrs)
+
+        assert len(shots) == len(perrs)
+
+        if seed is None:
+            seeds = [None] * len(perrs)
+        else:
+            seeds = np.random.SeedSequence(seed).generate_state(len(perrs)).tolist()
+
+        return shots, seeds
@@ -1,14 +1,26 @@
 import numpy as np
-from qulacs import QuantumState
+from qulacs import QuantumCircuit, QuantumState
+from qulacs.circuit import QuantumCircuitOptimizer
 from qulacs.state import tensor_product, drop_qubit
 from qulacs.gate import CNOT, H, RY, S, Sdag, P0
 from qulacs.gate import DepolarizingNoise, TwoQubitDepolarizingNoise
 
-from circuits.circuit_tools import repetition_encoding_schedule
-
-from codes.decoders import bit_strings
+from circuits.circuit_tools import (
+    repetition_encoding_schedule,
+    steane_decoding_schedule,
+    steane_encoding_schedule,
+)
+from circuits.gate_sequences import GateSequence
 
 __all__ = [
+    "add_ancillas",
+    "apply_compiled",
+    "compiled_circuit",
+    "outcome_probabilities",
+    "postselect",
+    "postselection_probabilities",
+    "update_state",
+    "nonzero_support",
     "encoded_chad",
     "encoded_cy",
     "magic_state_init",
@@ -27,20 +39,249 @@ __all__ = [
 ]
 
 
+def update_state(state: QuantumState, gate) -> None:
+    r"""
+    Applies the qulacs gate to the state. If the state is a GateSequence
+    the gate is recorded instead.
+
+    :param state: a QuantumState or GateSequence
+    :param gate: a qulacs gate
+    """
+
+    if isinstance(state, GateSequence):
+        state.update(gate)
+    else:
+        gate.update_quantum_state(state)
+
+
+def add_ancillas(state: QuantumState, n: int) -> QuantumState:
+    r"""
+    Adjoins n qubits in the zero state, labeled after the existing qubits
+    of the state. If the state is a GateSequence this is recorded instead.
+
+    :param state: a QuantumState or GateSequence
+    :param n: the number of ancilla qubits
+
+    :return: the enlarged QuantumState (or the GateSequence)
+    """
+
+    if isinstance(state, GateSequence):
+        state.add_qubits(n)
+        return state
+
+    anc = QuantumState(n)
+    anc.set_zero_state()
+
+    return tensor_product(anc, state)
+
+
+def postselect(
+    state: QuantumState, qubits: list[int], values: list[int]
+) -> QuantumState:
+    r"""
+    Projects the qubits onto the given values and removes them from the state,
+    without normalizing, so that the norm of the result is the probability of
+    the outcome. If the state is a GateSequence this is recorded instead.
+
+    :param state: a QuantumState or GateSequence
+    :param qubits: list of qubits to be removed
+    :param values: list of 0/1 values to project the qubits onto
+
+    :return: the reduced QuantumState (or the GateSequence)
+    """
+
+    if isinstance(state, GateSequence):
+        state.drop(qubits, values)
+        return state
+
+    return drop_qubit(state, qubits, values)
+
+
+def outcome_probabilities(state: QuantumState, qubits: list[int]) -> np.ndarray:
+    r"""
+    The probabilities of all outcomes of measuring the qubits in the
+    computational basis, from a single reduction of the state vector. For an
+    unnormalized state these are the squared norms of its projections, as
+    given by drop_qubit and get_squared_norm.
+
+    :param state: a QuantumState
+    :param qubits: list of measured qubits
+
+    :return: an array with one axis of length 2 for each qubit, in the order of qubits
+    """
+
+    probs = np.abs(state.get_vector()) ** 2
+    n = state.get_qubit_count()
+
+    # qulacs stores qubit q as bit q of the index, i.e. axis n-1-q of the tensor
+    axes = [n - 1 - q for q in qubits]
+    rest = [ax for ax in range(n) if ax not in axes]
+
+    probs = probs.reshape([2] * n).transpose(axes + rest)
+
+    return probs.reshape([2] * len(qubits) + [-1]).sum(axis=-1)
+
+
+def postselection_probabilities(
+    state: QuantumState, qubits: list[int], patterns: list[list[int]], target: int
+) -> tuple[np.ndarray, np.ndarray]:
+    r"""
+    For each post-selected pattern of outcomes of the measured qubits, the
+    probability of the pattern and the joint probability of the pattern and of
+    finding the target qubit in the zero state. These are the values of
+    get_squared_norm and get_zero_probability(target) after projecting with
+    drop_qubit, computed for all patterns from a single reduction of the state
+    vector.
+
+    :param state: a QuantumState
+    :param qubits: list of measured qubits, not including target
+    :param patterns: list of lists of 0/1 values of the measured qubits
+    :param target: the qubit read out after post-selection
+
+    :return: a tuple (norms, zero_probs) of arrays with one entry for each pattern
+    """
+
+    probs = outcome_probabilities(state, list(qubits) + [target])
+    probs = probs.reshape(2 ** len(qubits), 2)
+
+    index = np.asarray(patterns, dtype=np.int64) @ (
+        2 ** np.arange(len(qubits) - 1, -1, -1)
+    )
+
+    return probs[index].sum(axis=1), probs[index, 0]
+
+
+# Compiled circuits of the ideal builders, keyed by the builder, the block
+# layout, the number of qubits and the fusion block size
+_COMPILED_CACHE = dict()
+
+
+def compiled_circuit(
+    builder, blocks: list[list[int]], qubit_count: int, fuse: int = None
+) -> QuantumCircuit:
+    r"""
+    The qulacs QuantumCircuit of an ideal builder, such as steane_encoder,
+    steane_decoder, repetition_decoder, encoded_chad or encoded_cy, on the
+    given blocks. The circuit is recorded once for each block layout and
+    number of qubits and then cached, so that repeated runs do not rebuild
+    the gates of the builder.
+
+    With fuse the gates are merged by the qulacs QuantumCircuitOptimizer into
+    dense gates on at most fuse qubits. On the Clifford encoders and decoders
+    at 14 qubits fusion is slower than the specialized gates it replaces, so
+    it is off by default.
+
+    :param builder: a builder taking a state followed by the blocks, that only
+        applies gates
+    :param blocks: list of the blocks passed to the builder
+    :param qubit_count: the number of qubits of the states the circuit acts on
+    :param fuse: the largest number of qubits of a fused gate, or None
+
+    :return: a QuantumCircuit
+    """
+
+    key = (builder, tuple(tuple(block) for block in blocks), qubit_count, fuse)
+
+    if key not in _COMPILED_CACHE:
+        seq = GateSequence(qubit_count)
+        builder(seq, *blocks)
+
+        circuit = QuantumCircuit(qubit_count)
+        for op in seq.ops:
+            if op[0] != "gate":
+                raise ValueError(builder.__name__ + " does not only apply gates")
+            circuit.add_gate(op[1])
+
+        if fuse is not None:
+            QuantumCircuitOptimizer().optimize(circuit, fuse)
+
+        _COMPILED_CACHE[key] = circuit
+
+    return _COMPILED_CACHE[key]
+
+
+def apply_compiled(state: QuantumState, builder, *blocks, fuse: int = None):
+    r"""
+    Updates the state with the cached compiled circuit of an ideal builder,
+    see compiled_circuit. If the state is a GateSequence the builder records
+    its gates as usual.
+
+    :param state: a QuantumState or GateSequence
+    :param builder: a builder taking a state followed by the blocks, that only
+        applies gates
+    :param blocks: the blocks passed to the builder
+    :param fuse: the largest number of qubits of a fused gate, or None
+
+    :return: the updated state
+    """
+
+    if isinstance(state, GateSequence):
+        return builder(state, *blocks)
+
+    qubit_count = state.get_qubit_count()
+
+    compiled_circuit(builder, blocks, qubit_count, fuse).update_quantum_state(state)
+
+    return state
+
+
+# The number of amplitudes thresholded at a time by nonzero_support
+_SUPPORT_CHUNK = 1 << 20
+
+
+def nonzero_support(
+    state: QuantumState, thresh: float = 1e-5
+) -> tuple[np.ndarray, np.ndarray]:
+    r"""
+    Finds the computational basis states with probability greater than the
+    threshold, reading the amplitude vector once and thresholding it in chunks,
+    so the only full size array held besides the state is the copy of the vector.
+
+    :param state: a QuantumState
+    :param thresh: the probability threshold
+
+    :return: a tuple (bits, probs) where bits is a uint8 array with a row for each
+        basis state, the column q holding the value of qubit q, and probs the
+        array of their probabilities, in decreasing order of probability
+    """
+
+    vec = state.get_vector()
+    n = len(vec).bit_length() - 1
+
+    indices = []
+    probs = []
+    for start in range(0, len(vec), _SUPPORT_CHUNK):
+        amps = vec[start : start + _SUPPORT_CHUNK]
+        chunk_probs = amps.real**2 + amps.imag**2
+        found = np.flatnonzero(chunk_probs > thresh)
+        indices.append(found + start)
+        probs.append(chunk_probs[found])
+
+    indices = np.concatenate(indices)
+    probs = np.concatenate(probs)
+
+    order = np.argsort(-probs, kind="stable")
+    indices = indices[order]
+    probs = probs[order]
+
+    bits = ((indices[:, None] >> np.arange(n)) & 1).astype(np.uint8)
+
+    return bits, probs
+
+
 def print_nonzeros(state: QuantumState, thresh=1e-5):
     r"""
     Prints out all computational basis states with marginal probability
     greater than the threshold specified for being observed when the
-    QuantumState state is measured.
+    QuantumState state is measured, most likely first.
 
     :param state:
     :param thresh:
     """
 
-    outs = bit_strings(state.get_qubit_count())
-    for s in outs:
-        if state.get_marginal_probability(s) > thresh:
-            print(s)
+    bits, _ = nonzero_support(state, thresh)
+    for s in bits[:, : state.get_qubit_count()]:
+        print(s.tolist())
 
 
 def repetition_decoder(state: QuantumState, repnBlock: list[int]) -> QuantumState:
@@ -64,9 +305,9 @@ def repetition_decoder(state: QuantumState, repnBlock: list[int]) -> QuantumStat
     for ii in range(n - 1):
         control = repnBlock[n - 1 - ii]
         target = repnBlock[n - 2 - ii]
-        CNOT(control, target).update_quantum_state(state)
+        update_state(state, CNOT(control, target))
 
-    H(repnBlock[0]).update_quantum_state(state)
+    update_state(state, H(repnBlock[0]))
 
     return state
 
@@ -87,16 +328,16 @@ def encoded_chad(
     angle = np.pi / 4.0
 
     for ii in range(len(target_block)):
-        RY(target_block[ii], -angle).update_quantum_state(state)
+        update_state(state, RY(target_block[ii], -angle))
 
     for ii in range(len(target_block)):
         qtarget = target_block[ii]
         qcontrol = control_block[ii]
 
-        CNOT(qcontrol, qtarget).update_quantum_state(state)
+        update_state(state, CNOT(qcontrol, qtarget))
 
     for ii in range(len(target_block)):
-        RY(target_block[ii], angle).update_quantum_state(state)
+        update_state(state, RY(target_block[ii], angle))
 
     return state
 
@@ -115,16 +356,16 @@ def encoded_cy(
     """
 
     for ii in range(len(target_block)):
-        Sdag(target_block[ii]).update_quantum_state(state)
+        update_state(state, Sdag(target_block[ii]))
 
     for ii in range(len(target_block)):
         qtarget = target_block[ii]
         qcontrol = control_block[ii]
 
-        CNOT(qcontrol, qtarget).update_quantum_state(state)
+        update_state(state, CNOT(qcontrol, qtarget))
 
     for ii in range(len(target_block)):
-        S(target_block[ii]).update_quantum_state(state)
+        update_state(state, S(target_block[ii]))
 
     return state
 
@@ -147,11 +388,11 @@ def magic_state_init(
     """
 
     # Initialize register in the |+> state
-    P0(qubit).update_quantum_state(state)
-    H(qubit).update_quantum_state(state)
+    update_state(state, P0(qubit))
+    update_state(state, H(qubit))
 
     # Rotate the state about the Y-axis
-    RY(qubit, angle).update_quantum_state(state)
+    update_state(state, RY(qubit, angle))
 
     return state
 
@@ -170,8 +411,8 @@ def plus_state_init(state: QuantumState, qubit: int) -> QuantumState:
     """
 
     # Initialize register in the |+> state
-    P0(qubit).update_quantum_state(state)
-    H(qubit).update_quantum_state(state)
+    update_state(state, P0(qubit))
+    update_state(state, H(qubit))
 
     return state
 
@@ -191,36 +432,24 @@ def repetition_encoder(
             encoded into the qubits of block.
     """
 
-    schedule = repetition_encoding_schedule(block)
+    flag_label = None
 
     if flag:
-        anc = QuantumState(1)
-        anc.set_zero_state()
-        state = tensor_product(anc, state)
-
-        # modifications to the cnot schedule for including the flag qubit with
-        # considerations for circuit-level noise
-
-        mark = int(len(block) / 2)
+        state = add_ancillas(state, 1)
         flag_label = int(state.get_qubit_count()) - 1
 
-        if len(block) % 2:
-            schedule[-1].append((block[mark - 1], flag_label))
-        else:
-            schedule.append([(block[mark - 1], flag_label)])
-
-        schedule.append([(block[-1], flag_label)])
+    schedule = repetition_encoding_schedule(block, flag_label)
 
     for round in schedule:
         for pair in round:
             control = pair[0]
             target = pair[1]
 
-            CNOT(control, target).update_quantum_state(state)
+            update_state(state, CNOT(control, target))
 
     if flag:
         # Post-select on trivial outcome
-        state = drop_qubit(state, [flag_label], [0])
+        state = postselect(state, [flag_label], [0])
 
     return state
 
@@ -237,22 +466,16 @@ def steane_encoder(state: QuantumState, block: list[int]) -> QuantumState:
             encoded into the qubits of block.
     """
 
-    schedule = [
-        [(0, 6), (3, 4)],
-        [(0, 5), (1, 4), (3, 6)],
-        [(1, 0), (2, 4), (3, 5)],
-        [(2, 0), (1, 5)],
-        [(2, 6)],
-    ]
+    schedule = steane_encoding_schedule(block)
 
     for qub in range(1, 4):
-        H(block[qub]).update_quantum_state(state)
+        update_state(state, H(block[qub]))
 
     # Following the convention in FIG. 3.
 
     for round in schedule:
         for pair in round:
-            CNOT(pair[0], pair[1]).update_quantum_state(state)
+            update_state(state, CNOT(pair[0], pair[1]))
 
     return state
 
@@ -279,24 +502,18 @@ def steane_decoder(state: QuantumState, block: list[int]) -> QuantumState:
             encoded into the qubits of block.
     """
 
-    cnot_schedule = [
-        [(1, 5), (2, 6)],
-        [(2, 0), (3, 5)],
-        [(1, 0), (2, 4), (3, 6)],
-        [(1, 4), (0, 5)],
-        [(0, 6), (3, 4)],
-    ]
+    cnot_schedule = steane_decoding_schedule(block)
 
     for round in cnot_schedule:
         for pair in round:
             control = pair[0]
             target = pair[1]
 
-            CNOT(control, target).update_quantum_state(state)
+            update_state(state, CNOT(control, target))
 
     # Rotate x-stabilizer qubits to the Z-basis.
     for qub in range(1, 4):
-        H(block[qub]).update_quantum_state(state)
+        update_state(state, H(block[qub]))
 
     return state
 
@@ -322,9 +539,9 @@ def noisy_transversal_cnot(
         qtarget = target_block[ii]
         qcontrol = control_block[ii]
 
-        CNOT(qcontrol, qtarget).update_quantum_state(state)
+        update_state(state, CNOT(qcontrol, qtarget))
 
-        TwoQubitDepolarizingNoise(qcontrol, qtarget, perr).update_quantum_state(state)
+        update_state(state, TwoQubitDepolarizingNoise(qcontrol, qtarget, perr))
 
     return state
 
@@ -351,27 +568,27 @@ def noisy_encoded_chad(
 
     for ii in range(len(target_block)):
 
-        RY(target_block[ii], -angle).update_quantum_state(state)
+        update_state(state, RY(target_block[ii], -angle))
 
         # single-qubit gate noise
-        DepolarizingNoise(target_block[ii], perr).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(target_block[ii], perr))
 
         if idling:
             # idling noise on control block
-            DepolarizingNoise(control_block[ii], perr).update_quantum_state(state)
+            update_state(state, DepolarizingNoise(control_block[ii], perr))
 
     state = noisy_transversal_cnot(state, control_block, target_block, perr)
 
     for ii in range(len(target_block)):
 
-        RY(target_block[ii], angle).update_quantum_state(state)
+        update_state(state, RY(target_block[ii], angle))
 
         # single-qubit gate noise
-        DepolarizingNoise(target_block[ii], perr).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(target_block[ii], perr))
 
         if idling:
             # idling noise on control block
-            DepolarizingNoise(control_block[ii], perr).update_quantum_state(state)
+            update_state(state, DepolarizingNoise(control_block[ii], perr))
 
     return state
 
@@ -394,10 +611,10 @@ def noisy_encoded_cy(
 
     for ii in range(len(target_block)):
 
-        Sdag(target_block[ii]).update_quantum_state(state)
+        update_state(state, Sdag(target_block[ii]))
 
         # single-qubit gate noise
-        DepolarizingNoise(target_block[ii], perr).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(target_block[ii], perr))
 
         # idling noise on control block
         # DepolarizingNoise(control_block[ii], perr).update_quantum_state(state)
@@ -405,10 +622,10 @@ def noisy_encoded_cy(
     state = noisy_transversal_cnot(state, control_block, target_block, perr)
 
     for ii in range(len(target_block)):
-        S(target_block[ii]).update_quantum_state(state)
+        update_state(state, S(target_block[ii]))
 
         # single-qubit gate noise
-        DepolarizingNoise(target_block[ii], perr).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(target_block[ii], perr))
 
         # idling noise on control block
         # DepolarizingNoise(control_block[ii], perr).update_quantum_state(state)
@@ -432,10 +649,10 @@ def noisy_magic_state_init(
     :return: a QuantumState object
     """
 
-    H(qubit).update_quantum_state(state)
-    RY(qubit, angle).update_quantum_state(state)
+    update_state(state, H(qubit))
+    update_state(state, RY(qubit, angle))
 
-    DepolarizingNoise(qubit, perr).update_quantum_state(state)
+    update_state(state, DepolarizingNoise(qubit, perr))
 
     return state
 
@@ -455,10 +672,10 @@ def noisy_plus_state_init(state: QuantumState, qubit: int, perr: float) -> Quant
     """
 
     # Initialize register in the |+> state
-    P0(qubit).update_quantum_state(state)
-    H(qubit).update_quantum_state(state)
+    update_state(state, P0(qubit))
+    update_state(state, H(qubit))
 
-    DepolarizingNoise(qubit, perr).update_quantum_state(state)
+    update_state(state, DepolarizingNoise(qubit, perr))
 
     return state
 
@@ -478,30 +695,20 @@ def noisy_repetition_encoder(
             encoded into the logical state of the block.
     """
 
-    schedule = repetition_encoding_schedule(block)
+    flag_label = None
 
     if flag:
-        anc = QuantumState(1)
-        anc.set_zero_state()
-        state = tensor_product(anc, state)
-
-        mark = int(len(block) / 2)
-
+        state = add_ancillas(state, 1)
         flag_label = int(max(block)) + 1
 
-        if len(block) % 2:
-            schedule[-1].append((block[mark - 1], flag_label))
-        else:
-            schedule.append([(block[mark - 1], flag_label)])
-
-        schedule.append([(block[-1], flag_label)])
+    schedule = repetition_encoding_schedule(block, flag_label)
 
     # set of active qubits in the circuit
     active_set = set([block[0]])
 
     # Initialization noise for qubits in rest of block
     for qub in block[1:]:
-        DepolarizingNoise(qub, perr).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(qub, perr))
 
     for round in schedule:
         # set of qubits active in this round
@@ -518,21 +725,21 @@ def noisy_repetition_encoder(
             control = pair[0]
             target = pair[1]
 
-            CNOT(control, target).update_quantum_state(state)
-            TwoQubitDepolarizingNoise(control, target, perr).update_quantum_state(state)
+            update_state(state, CNOT(control, target))
+            update_state(state, TwoQubitDepolarizingNoise(control, target, perr))
 
         if idling:
             # Apply noise to idle qubits in this round
             idle_set = active_set - round_set
             for idler in idle_set:
-                DepolarizingNoise(idler, perr).update_quantum_state(state)
+                update_state(state, DepolarizingNoise(idler, perr))
 
     if flag:
         # Measure the flag qubit
-        DepolarizingNoise(flag_label, perr).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(flag_label, perr))
         # P0(flag_label).update_quantum_state(state)
 
-        state = drop_qubit(state, [flag_label], [0])
+        state = postselect(state, [flag_label], [0])
 
     return state
 
@@ -562,13 +769,7 @@ def noisy_steane_decoder(
             encoded into the qubits listed in block.
     """
 
-    cnot_schedule = [
-        [(1, 5), (2, 6)],
-        [(2, 0), (3, 5)],
-        [(1, 0), (2, 4), (3, 6)],
-        [(1, 4), (0, 5)],
-        [(0, 6), (3, 4)],
-    ]
+    cnot_schedule = steane_decoding_schedule(block)
 
     msmt_schedule = [[], [], [2], [1, 5], [0, 3, 4, 6]]
 
@@ -586,23 +787,23 @@ def noisy_steane_decoder(
 
             control = pair[0]
             target = pair[1]
-            CNOT(control, target).update_quantum_state(state)
+            update_state(state, CNOT(control, target))
             TwoQubitDepolarizingNoise(control, target, perr)
 
         for idler in idle_set:
-            DepolarizingNoise(idler, perr).update_quantum_state(state)
+            update_state(state, DepolarizingNoise(idler, perr))
 
         # add qubits to be measured to the measured set
         # and apply noise
-        for qub in msmt_schedule[rnd]:
+        for qub in [block[q] for q in msmt_schedule[rnd]]:
             measured_set.add(qub)
-            DepolarizingNoise(qub, perr).update_quantum_state(state)
+            update_state(state, DepolarizingNoise(qub, perr))
 
     # Rotate x-stabilizer qubits to the Z-basis. Noise is not applied here since
     # we applied already and circuit-level noise affects x- and z-msmts
     # uniformly (so the hadamard is ideal)
     for qub in range(1, 4):
-        H(block[qub]).update_quantum_state(state)
+        update_state(state, H(block[qub]))
 
     return state
 
@@ -622,22 +823,16 @@ def noisy_steane_encoder(
             encoded into the qubits of block.
     """
 
-    schedule = [
-        [(0, 6), (3, 4)],
-        [(0, 5), (1, 4), (3, 6)],
-        [(1, 0), (2, 4), (3, 5)],
-        [(2, 0), (1, 5)],
-        [(2, 6)],
-    ]
+    schedule = steane_encoding_schedule(block)
 
     for qub in range(1, 4):
-        H(block[qub]).update_quantum_state(state)
+        update_state(state, H(block[qub]))
 
     # Apply initialization noise, so noise will not be applied as
     # qubits are made active.
 
     for qub in block[1:]:
-        DepolarizingNoise(qub, perr).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(qub, perr))
 
     # Which qubits are active in the state and should
     # be acted on with noise in each round
@@ -658,13 +853,13 @@ def noisy_steane_encoder(
             control = pair[0]
             target = pair[1]
 
-            CNOT(control, target).update_quantum_state(state)
-            TwoQubitDepolarizingNoise(control, target, perr).update_quantum_state(state)
+            update_state(state, CNOT(control, target))
+            update_state(state, TwoQubitDepolarizingNoise(control, target, perr))
 
         if idling:
             # Identify idling qubits and apply noise
             idle_set = active_set - round_set
             for idler in idle_set:
-                DepolarizingNoise(idler, perr).update_quantum_state(state)
+                update_state(state, DepolarizingNoise(idler, perr))
 
     return state
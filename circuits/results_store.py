@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import socket
+import uuid
+import numpy as np
+from datetime import datetime
+
+from csscode.cssCode import cssCode
+from circuits.noise_models import NoiseModel
+
+__all__ = [
+    "ResultsStore",
+    "task_key",
+]
+
+
+def task_key(
+    circuit=None, code: cssCode = None, noise=None, decoder=None, seed_policy=None
+) -> str:
+    r"""
+    Produces a stable hash identifying a simulation task from the circuit
+    (or code), the noise, the decoder and the policy used to seed it.
+
+    :param circuit: a stim Circuit, or a SamplingTask whose circuit and decoder
+        are then used
+    :param code: a cssCode, used when no circuit is given
+    :param noise: a NoiseModel, or any JSON-serializable description of the noise
+    :param decoder: a JSON-serializable description of the decoder
+    :param seed_policy: a JSON-serializable description of the seeding, e.g. the seed
+
+    :return: a hexadecimal string
+    """
+
+    if hasattr(circuit, "circuit") and hasattr(circuit, "decoder"):
+        decoder = circuit.decoder if decoder is None else decoder
+        circuit = circuit.circuit
+
+    if isinstance(noise, NoiseModel):
+        noise = {k: v for k, v in vars(noise).items()}
+        noise["qubit_rates"] = sorted(noise["qubit_rates"].items())
+        # Left out when empty so that keys of earlier results are unchanged
+        if len(noise["coupler_rates"]):
+            noise["coupler_rates"] = sorted(noise["coupler_rates"].items())
+        else:
+            del noise["coupler_rates"]
+
+    description = {
+        "circuit": None if circuit is None else str(circuit),
+        "code": None if code is None else _code_description(code),
+        "noise": noise,
+        "decoder": decoder,
+        "seed_policy": seed_policy,
+    }
+
+    text = json.dumps(description, sort_keys=True, default=repr)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _code_description(code: cssCode) -> dict:
+    return {
+        "x": sorted(sorted(check) for check in code.code[False]),
+        "z": sorted(sorted(check) for check in code.code[True]),
+    }
+
+
+class ResultsStore:
+
+    def __init__(self, path: str) -> None:
+        r"""
+        A local, append-only store of shot and error counts for simulation
+        campaigns, kept in a directory of JSON-lines files. Each writer
+        appends to a file named after its host, so stores written on several
+        nodes can be merged by copying their records.
+
+        Every record holds the counts of one batch of shots for a task key,
+        so an interrupted campaign keeps all batches written before it stopped.
+
+        :property path: The directory of the store.
+
+        :property filename: The file this process appends records to.
+        """
+
+        self.path = path
+        self.filename = os.path.join(path, socket.gethostname() + ".jsonl")
+
+        os.makedirs(path, exist_ok=True)
+
+    def append(
+        self,
+        key: str,
+        shots: int,
+        errors: int,
+        metadata: dict = None,
+        chunk: int = None,
+        entropy: int = None,
+    ) -> None:
+        r"""
+        Atomically appends the counts of one batch of shots for the task key.
+
+        :param key: the task key, see task_key
+        :param shots: the number of shots in the batch
+        :param errors: the number of logical errors in the batch
+        :param metadata: an optional dictionary describing the task, used as
+            columns of the table
+        :param chunk: the index of the chunk of the batch, if it was seeded by
+            its index
+        :param entropy: the entropy of the seed sequence of the chunk
+        """
+
+        record = {
+            "id": uuid.uuid4().hex,
+            "key": key,
+            "shots": int(shots),
+            "errors": int(errors),
+            "time": datetime.now().isoformat(),
+            "metadata": dict() if metadata is None else metadata,
+            "chunk": None if chunk is None else int(chunk),
+            "entropy": None if entropy is None else int(entropy),
+        }
+
+        self._write_records([record])
+
+    def _write_records(self, records: list[dict]) -> None:
+        # A single write to a file opened in append mode is not interleaved
+        # with the writes of other processes
+        text = "".join(json.dumps(rec, default=repr) + "\n" for rec in records)
+
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, text.encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def records(self) -> list[dict]:
+        r"""
+        Reads all records of the store. Lines that were cut short by an
+        interrupted write are skipped, and records of a chunk seeded with the
+        same entropy and index as an earlier record, which hold the same
+        samples, are read once.
+
+        :return: a list of dictionaries
+        """
+
+        records = []
+        seeds = set()
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".jsonl"):
+                continue
+            with open(os.path.join(self.path, name)) as file:
+                for line in file:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+                    seed = _record_seed(rec)
+                    if seed is not None:
+                        if seed in seeds:
+                            continue
+                        seeds.add(seed)
+
+                    records.append(rec)
+
+        return records
+
+    def chunks(self, entropy: int) -> dict[str, set[int]]:
+        r"""
+        The indices of the chunks stored for each task key that were seeded
+        with the entropy.
+
+        :param entropy: the entropy of a seed sequence
+
+        :return: a dictionary mapping task keys to sets of chunk indices
+        """
+
+        chunks = dict()
+        for rec in self.records():
+            if rec.get("chunk") is not None and rec.get("entropy") == entropy:
+                chunks.setdefault(rec["key"], set()).add(rec["chunk"])
+
+        return chunks
+
+    def totals(self) -> dict[str, tuple[int, int, int]]:
+        r"""
+        Aggregates the records of the store by task key.
+
+        :return: a dictionary mapping each key to a tuple (shots, errors, batches)
+        """
+
+        totals = dict()
+        for rec in self.records():
+            shots, errors, batches = totals.get(rec["key"], (0, 0, 0))
+            totals[rec["key"]] = (
+                shots + rec["shots"],
+                errors + rec["errors"],
+                batches + 1,
+            )
+
+        return totals
+
+    def table(self) -> dict[str, np.ndarray]:
+        r"""
+        Aggregates the records of the store by task key into columns for
+        plotting: key, shots, errors, rate, and one column for each
+        metadata field.
+
+        :return: a dictionary mapping column names to numpy arrays
+        """
+
+        totals = dict()
+        metadata = dict()
+        for rec in self.records():
+            shots, errors = totals.get(rec["key"], (0, 0))
+            totals[rec["key"]] = (shots + rec["shots"], errors + rec["errors"])
+            metadata.setdefault(rec["key"], dict()).update(rec["metadata"])
+
+        keys = list(totals)
+        shots = np.array([totals[k][0] for k in keys], dtype=np.int64)
+        errors = np.array([totals[k][1] for k in keys], dtype=np.int64)
+
+        columns = {
+            "key": np.array(keys),
+            "shots": shots,
+            "errors": errors,
+            "rate": errors / np.maximum(shots, 1),
+        }
+
+        fields = sorted(set().union(*[set(m) for m in metadata.values()]))
+        for field in fields:
+            columns[field] = np.array([metadata[k].get(field) for k in keys])
+
+        return columns
+
+    def merge(self, other: "ResultsStore") -> int:
+        r"""
+        Copies into this store the records of another store that it does not
+        already hold, skipping those of chunks it holds with the same seed.
+
+        :param other: a ResultsStore, or the path of one
+
+        :return: the number of records copied
+        """
+
+        if isinstance(other, str):
+            other = ResultsStore(other)
+
+        held = self.records()
+        ids = set(rec["id"] for rec in held)
+        seeds = set(_record_seed(rec) for rec in held) - {None}
+
+        new = [
+            rec
+            for rec in other.records()
+            if rec["id"] not in ids and _record_seed(rec) not in seeds
+        ]
+
+        if len(new):
+            self._write_records(new)
+
+        return len(new)
+
+
+def _record_seed(rec: dict):
+    # The key, entropy and chunk index determining the samples of a record, or
+    # None for records that were not seeded by their chunk index
+    if rec.get("chunk") is None or rec.get("entropy") is None:
+        return None
+    return (rec["key"], rec["entropy"], rec["chunk"])
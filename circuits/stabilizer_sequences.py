@@ -0,0 +1,395 @@
+import numpy as np
+import stim
+from itertools import product
+
+from circuits.gate_sequences import PAULI_MATRICES, GateSequence, _pauli_ids
+
+__all__ = [
+    "clifford_rotation_terms",
+    "stabilizer_postselect",
+    "NearCliffordSampler",
+]
+
+# The stim gates P, sqrt(P) and its inverse for each Pauli axis P, indexed as
+# in qulacs: 1 = X, 2 = Y, 3 = Z
+_ROTATION_GATES = {
+    1: ("X", "SQRT_X", "SQRT_X_DAG"),
+    2: ("Y", "SQRT_Y", "SQRT_Y_DAG"),
+    3: ("Z", "S", "S_DAG"),
+}
+
+# The controlled qulacs gates, as stim gates acting on the control then the target
+_CONTROLLED_GATES = {
+    "CNOT": "CX",
+    "CZ": "CZ",
+}
+
+
+def clifford_rotation_terms(axis: int, angle: float) -> list[tuple[float, str]]:
+    r"""
+    Decomposes the channel of the rotation R = exp(-i angle P / 2) about the
+    Pauli axis P into a quasi-probability mixture of Clifford channels
+
+    R rho R^dag = a rho + b P rho P + c V rho V^dag
+
+    with a = (1 + cos(angle) - |sin(angle)|) / 2, b = (1 - cos(angle) -
+    |sin(angle)|) / 2, c = |sin(angle)| and V the square root of P turning in
+    the direction of the sign of sin(angle). The coefficients sum to one, and
+    the sum of their absolute values, the negativity of the decomposition, is
+    largest at odd multiples of pi/4, where it is sqrt(2). At multiples of
+    pi/2 the rotation is Clifford and there is a single term.
+
+    The angle is that of the standard rotation: the qulacs gate RY(q, theta)
+    is the rotation by -theta.
+
+    :param axis: the Pauli axis, 1 = X, 2 = Y, 3 = Z
+    :param angle: the rotation angle
+
+    :return: a list of tuples (coefficient, name of the stim gate or "I")
+    """
+
+    cos, sin = np.cos(angle), np.sin(angle)
+    pauli, sqrt, sqrt_dag = _ROTATION_GATES[axis]
+
+    terms = [
+        ((1 + cos - abs(sin)) / 2, "I"),
+        ((1 - cos - abs(sin)) / 2, pauli),
+        (abs(sin), sqrt if sin > 0 else sqrt_dag),
+    ]
+
+    return [(coeff, name) for coeff, name in terms if not np.isclose(coeff, 0.0)]
+
+
+def stabilizer_postselect(
+    sim: stim.TableauSimulator, qubits: list[int], values: list[int]
+) -> float:
+    r"""
+    Projects the qubits of a stabilizer state onto the given values, keeping
+    the state normalized, and returns the probability of the outcome. If the
+    outcome is impossible the probability is zero and the state is left
+    partially projected.
+
+    :param sim: a stim TableauSimulator
+    :param qubits: list of qubits
+    :param values: list of 0/1 values to project the qubits onto
+
+    :return: the probability of the outcome
+    """
+
+    prob = 1.0
+    for qubit, value in zip(qubits, values):
+        z = sim.peek_z(qubit)
+
+        if not z:
+            sim.postselect_z(qubit, desired_value=bool(value))
+            prob *= 0.5
+        elif (z < 0) != bool(value):
+            return 0.0
+
+    return prob
+
+
+class NearCliffordSampler:
+
+    def __init__(self, sequence: GateSequence, terminal) -> None:
+        r"""
+        Samples noisy trajectories of a GateSequence on the stim tableau
+        simulator, so that the cost grows polynomially with the number of qubits
+        rather than as 2**n. The Clifford gates of the sequence are applied as
+        stim tableaus, and each non-Clifford rotation about a Pauli axis, such
+        as the RY magic-state rotations, is replaced by one of the Clifford
+        channels of clifford_rotation_terms, drawn in proportion to the absolute
+        value of its coefficient. The value of a trajectory is weighted by the
+        sign of the drawn coefficients times the negativity of the sequence, the
+        product of the negativities of its rotations, so that its expectation is
+        that of sample_trajectory.
+
+        The variance of the values grows as the square of the negativity, i.e.
+        exponentially in the number of non-Clifford rotations but not in the
+        number of qubits. Drops and branches post-select the stabilizer states,
+        carrying the probability of the outcome as their norm.
+
+        Properties of a NearCliffordSampler object:
+
+        :property sequence: The GateSequence that is sampled.
+
+        :property terminal: A function terminal(sim, qubits) mapping the final
+            stabilizer state, a normalized stim TableauSimulator, to an array of
+            values, with qubits[q] the simulator qubit of the qubit q of the
+            sequence. The sampler scales the values by the norm of the state.
+
+        :property instructions: The operations of the sequence lowered to the
+            simulator qubits.
+
+        :property rotations: The Clifford terms of each non-Clifford rotation, as
+            lists of tuples (coefficient, stim Tableau or None for the identity).
+
+        :property qubits: The simulator qubit of each qubit at the end of the sequence.
+
+        :property negativity: The product of the negativities of the rotations.
+        """
+
+        self.sequence = sequence
+        self.terminal = terminal
+
+        self.rotations = []
+        self.instructions = []
+        self._lower()
+
+        self._noise = [
+            ii for ii, inst in enumerate(self.instructions) if inst[0] == "noise"
+        ]
+        self.fire_probs = np.array([self.instructions[ii][2][-1] for ii in self._noise])
+
+        self._rotation_probs = []
+        self._rotation_signs = []
+        for terms in self.rotations:
+            coeffs = np.array([coeff for coeff, _ in terms])
+            self._rotation_probs.append(
+                np.cumsum(np.abs(coeffs)) / np.abs(coeffs).sum()
+            )
+            self._rotation_signs.append(np.sign(coeffs))
+
+        self.negativity = float(
+            np.prod([sum(abs(coeff) for coeff, _ in terms) for terms in self.rotations])
+        )
+
+    def sample(self, rng: np.random.Generator) -> np.ndarray:
+        r"""
+        Runs one noisy trajectory of the sequence, with its Pauli faults and the
+        Clifford terms of its rotations drawn from rng.
+
+        :param rng: a numpy random Generator
+
+        :return: the weighted value of terminal for the trajectory
+        """
+
+        faults = dict()
+        fired = np.flatnonzero(rng.random(len(self.fire_probs)) < self.fire_probs)
+        for loc, draw in zip(fired, rng.random(len(fired)) * self.fire_probs[fired]):
+            cumulative = self.instructions[self._noise[loc]][2]
+            fault = min(
+                np.searchsorted(cumulative, draw, side="right"), len(cumulative) - 1
+            )
+            faults[self._noise[loc]] = fault
+
+        choices = [
+            min(np.searchsorted(probs, draw, side="right"), len(probs) - 1)
+            for probs, draw in zip(
+                self._rotation_probs, rng.random(len(self.rotations))
+            )
+        ]
+        sign = np.prod(
+            [signs[choice] for signs, choice in zip(self._rotation_signs, choices)]
+        )
+
+        return sign * self.negativity * self.run_terms(choices, faults)
+
+    def run(self, count: int, rng: np.random.Generator) -> np.ndarray:
+        r"""
+        Runs count noisy trajectories of the sequence.
+
+        :param count: the number of trajectories
+        :param rng: a numpy random Generator
+
+        :return: an array with the weighted value of terminal for each trajectory
+        """
+
+        return np.array([self.sample(rng) for _ in range(count)])
+
+    def run_terms(self, choices: list[int], faults: dict = None) -> np.ndarray:
+        r"""
+        Runs the sequence with the given Clifford term of each rotation and the
+        given Pauli faults.
+
+        :param choices: the index of the term of each rotation
+        :param faults: a dictionary mapping indices of noise instructions to the
+            index of their fault, by default no faults
+
+        :return: the value of terminal, scaled by the norm of the final state
+        """
+
+        faults = dict() if faults is None else faults
+
+        return self._resume(stim.TableauSimulator(), 0, 1.0, choices, faults)
+
+    def term_sum(self, faults: dict = None) -> np.ndarray:
+        r"""
+        The exact value of the sequence with the given Pauli faults, summing
+        over all the Clifford terms of its rotations with their coefficients.
+        The number of terms is at most 3 to the number of rotations.
+
+        :param faults: a dictionary mapping indices of noise instructions to the
+            index of their fault, by default no faults
+
+        :return: the value of terminal, scaled by the norm of the final state
+        """
+
+        total = 0.0
+        for choices in product(*[range(len(terms)) for terms in self.rotations]):
+            coeff = np.prod(
+                [terms[ii][0] for terms, ii in zip(self.rotations, choices)]
+            )
+            total = total + coeff * self.run_terms(list(choices), faults)
+
+        return total
+
+    def _resume(
+        self,
+        sim: stim.TableauSimulator,
+        start: int,
+        norm: float,
+        choices: list[int],
+        faults: dict,
+    ) -> np.ndarray:
+
+        for ii in range(start, len(self.instructions)):
+            inst = self.instructions[ii]
+
+            if inst[0] == "tableau":
+                sim.do_tableau(inst[1], inst[2])
+
+            elif inst[0] == "rotation":
+                tableau = self.rotations[inst[1]][choices[inst[1]]][1]
+                if tableau is not None:
+                    sim.do_tableau(tableau, [inst[2]])
+
+            elif inst[0] == "noise":
+                if ii in faults:
+                    sim.do_pauli_string(inst[1][faults[ii]])
+
+            elif inst[0] == "project":
+                norm *= stabilizer_postselect(sim, inst[1], inst[2])
+                if inst[3]:
+                    sim.reset(*inst[1])
+
+            elif inst[0] == "branch":
+                total = None
+                for pattern in inst[2]:
+                    branch = sim.copy()
+                    prob = stabilizer_postselect(branch, inst[1], pattern)
+                    if not prob:
+                        continue
+
+                    branch.reset(*inst[1])
+                    value = self._resume(branch, ii + 1, norm * prob, choices, faults)
+                    total = value if total is None else total + value
+
+                if total is not None:
+                    return total
+
+                # No pattern is possible, finish the run with a zero norm
+                norm = 0.0
+                sim.reset(*inst[1])
+
+        return norm * np.asarray(self.terminal(sim, self.qubits))
+
+    def _lower(self) -> None:
+        # Lowers the operations of the sequence to instructions on simulator
+        # qubits. Qubits removed by a drop or branch are reset and reused by
+        # later adds, and the others keep their simulator qubit when the
+        # sequence relabels them.
+
+        qubits = list(range(self.sequence.initial_qubit_count))
+        free = []
+
+        for op in self.sequence.ops:
+            if op[0] == "gate":
+                self.instructions.append(self._lower_gate(op[1], qubits))
+
+            elif op[0] == "noise":
+                paulis = []
+                for pauli in op[3]:
+                    targets = [qubits[q] for q in pauli.get_target_index_list()]
+                    string = stim.PauliString(max(targets) + 1)
+                    for target, pid in zip(targets, _pauli_ids(pauli)):
+                        string[target] = pid
+                    paulis.append(string)
+
+                self.instructions.append(("noise", paulis, np.cumsum(op[2])))
+
+            elif op[0] == "add":
+                for _ in range(op[1]):
+                    qubits.append(free.pop(0) if len(free) else len(qubits) + len(free))
+
+            else:
+                targets = [qubits[q] for q in op[1]]
+                if op[0] == "drop":
+                    self.instructions.append(("project", targets, op[2], True))
+                else:
+                    self.instructions.append(("branch", targets, op[2]))
+
+                qubits = [q for q in qubits if q not in targets]
+                free = sorted(free + targets)
+
+        self.qubits = qubits
+
+    def _lower_gate(self, gate, qubits: list[int]) -> tuple:
+        name = gate.get_name()
+        targets = [qubits[q] for q in gate.get_target_index_list()]
+        controls = [qubits[q] for q in gate.get_control_index_list()]
+
+        if name in ["Projection-0", "Projection-1"]:
+            return ("project", targets, [int(name[-1])], False)
+
+        if len(controls):
+            if name not in _CONTROLLED_GATES:
+                raise ValueError("controlled gate " + name + " is not supported")
+            tableau = stim.Tableau.from_named_gate(_CONTROLLED_GATES[name])
+            return ("tableau", tableau, controls + targets)
+
+        matrix = np.asarray(gate.get_matrix())
+        tableau = _clifford_tableau(matrix)
+        if tableau is not None:
+            return ("tableau", tableau, targets)
+
+        axis, angle = _pauli_rotation(matrix)
+        terms = [
+            (coeff, None if term == "I" else stim.Tableau.from_named_gate(term))
+            for coeff, term in clifford_rotation_terms(axis, angle)
+        ]
+        self.rotations.append(terms)
+
+        return ("rotation", len(self.rotations) - 1, targets[0])
+
+
+# Tableaus of the Clifford gates, or None for other gates, keyed by their matrices
+_TABLEAU_CACHE = dict()
+
+
+def _clifford_tableau(matrix: np.ndarray):
+    key = (matrix.shape, matrix.tobytes())
+
+    if key not in _TABLEAU_CACHE:
+        try:
+            # qulacs orders the basis with the first target as the lowest bit
+            tableau = stim.Tableau.from_unitary_matrix(matrix, endian="little")
+        except ValueError:
+            tableau = None
+
+        # stim rounds gates close to a Clifford gate, so check the conversion
+        # up to a phase
+        if tableau is not None:
+            unitary = tableau.to_unitary_matrix(endian="little")
+            overlap = np.trace(unitary.conj().T @ matrix) / len(matrix)
+            if not np.isclose(abs(overlap), 1.0):
+                tableau = None
+
+        _TABLEAU_CACHE[key] = tableau
+
+    return _TABLEAU_CACHE[key]
+
+
+def _pauli_rotation(matrix: np.ndarray) -> tuple[int, float]:
+    # The axis and standard angle of a single-qubit gate that is, up to a
+    # phase, cos(angle/2) I - i sin(angle/2) P
+
+    coeffs = [np.trace(pauli @ matrix) / 2 for pauli in PAULI_MATRICES]
+    axes = [pid for pid in range(1, 4) if not np.isclose(abs(coeffs[pid]), 0.0)]
+
+    if matrix.shape != (2, 2) or len(axes) != 1:
+        raise ValueError("gate is neither Clifford nor a rotation about a Pauli axis")
+
+    ratio = 1j * coeffs[axes[0]] * np.conj(coeffs[0])
+
+    return axes[0], 2 * np.arctan2(ratio.real, abs(coeffs[0]) ** 2)
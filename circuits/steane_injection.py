@@ -1,23 +1,57 @@
+import warnings
 import numpy as np
 from qulacs import QuantumState
 from qulacs.gate import H, RY, X, DepolarizingNoise
-from qulacs.state import drop_qubit, tensor_product
+from qulacs.state import drop_qubit
 from codes.decoders import bit_strings
 
+from circuits.gate_sequences import (
+    FaultExpansion,
+    GateSequence,
+    enumerate_fault_paths,
+    exact_expectation,
+)
 from circuits.qulacs_circuits import (
+    add_ancillas,
+    apply_compiled,
+    update_state,
     noisy_encoded_chad,
     noisy_repetition_encoder,
     noisy_plus_state_init,
     noisy_magic_state_init,
     noisy_steane_encoder,
+    outcome_probabilities,
+    postselection_probabilities,
     steane_decoder,
 )
-
+from circuits.subset_sampling import SubsetSamples, subset_sample_sequence
 
 __all__ = [
     "repn_had_test",
     "one_double_run",
     "one_single_run",
+    "single_run_sequence",
+    "double_run_sequence",
+    "multi_run_sequence",
+    "exact_single_run",
+    "exact_double_run",
+    "exact_multi_run",
+    "multi_run_expansion",
+    "multi_run_subset_samples",
+    "postselection_terminal",
+]
+
+# The largest number of faults per branch reached by the exact runs when
+# max_faults is not given, the error probability being of second order
+_EXACT_MAX_FAULTS = 2
+
+_STEANE_BLOCK = [0, 1, 2, 3, 4, 5, 6]
+_REPN_BLOCK = [7, 8, 9, 10, 11, 12, 13]
+
+# Trivial Steane syndrome together with every even-parity repetition-block
+# outcome
+_POSTSELECTION_PATTERNS = [
+    [0, 0, 0, 0, 0, 0] + list(bs) for bs in bit_strings(7) if not sum(bs) % 2
 ]
 
 
@@ -35,8 +69,7 @@ def repn_had_test(
     """
 
     # Initialize ancilla qubits and tensor with the input state
-    rep_anc = QuantumState(7)
-    state = tensor_product(rep_anc, state)
+    state = add_ancillas(state, len(repnBlock))
 
     # Initialize the ancilla in the |+> state:
     state = noisy_plus_state_init(state, repnBlock[0], perr)
@@ -50,8 +83,8 @@ def repn_had_test(
 
     # Rotate ancilla qubits into the X-basis for readout. Noise applied first.
     for qub in repnBlock:
-        DepolarizingNoise(qub, perr).update_quantum_state(state)
-        H(qub).update_quantum_state(state)
+        update_state(state, DepolarizingNoise(qub, perr))
+        update_state(state, H(qub))
 
     return state
 
@@ -67,56 +100,23 @@ def one_single_run(perr: float) -> tuple[float]:
 
     """
 
-    steaneBlock = [0, 1, 2, 3, 4, 5, 6]
-    repnBlock = [7, 8, 9, 10, 11, 12, 13]
-
     # Option to include idling errors or not:
     idling = True
 
-    # All even parity bit strings of length 7:
-    bs7 = [x for x in bit_strings(7) if not sum(x) % 2]
-
-    angle = np.pi / 4.0
-
-    # post-selection probability
-    ps_prob = 0
-
-    # logical error probability for post-selected states
-    err_prob = 0
-
     # Initialize the state on the steaneBlock to all zeros
-    state = QuantumState(len(steaneBlock))
+    state = QuantumState(len(_STEANE_BLOCK))
     state.set_zero_state()
 
-    # Rotate first qubit into the |A> state then apply the
-    # Steane encoding map:
-    state = noisy_magic_state_init(state, steaneBlock[0], perr, angle)
-    state = noisy_steane_encoder(state, steaneBlock, perr, idling=idling)
+    # Prepare the encoded magic state and perform the encoded Hadamard test:
+    state = _magic_block(state, perr, idling)
+    state = repn_had_test(state, _STEANE_BLOCK, _REPN_BLOCK, perr, idling=idling)
 
-    # Perform the encoded Hadamard test:
-    state = repn_had_test(state, steaneBlock, repnBlock, perr, idling=idling)
+    # Decode and rotate the logical qubit so that |0> indicates an error:
+    state = _logical_readout(state)
 
-    # Apply the steane-decoder circuit, with logical qubit mapped to the
-    # first position of the steaneBlock:
-    state = steane_decoder(state, steaneBlock)
-
-    # Rotate the qubit to diagonalize the Hadamard gate
-    RY(steaneBlock[0], -angle).update_quantum_state(state)
-    H(steaneBlock[0]).update_quantum_state(state)
-
-    # Add the probability of an error, corresponding to the
-    # probability of observing |1> in the output:
-    X(steaneBlock[0]).update_quantum_state(state)
-
-    # Look over all post-selected patterns (even bitstrings)
-    for bs in bs7:
-        qubit_state = drop_qubit(
-            state, steaneBlock[1:] + repnBlock, [0, 0, 0, 0, 0, 0] + list(bs)
-        )
-
-        # Add probability of this outcome to the post-selection probability:
-        ps_prob += qubit_state.get_squared_norm()
-        err_prob += qubit_state.get_zero_probability(steaneBlock[0])
+    # Post-selection probability, and logical error probability for
+    # post-selected states, summed over all post-selected patterns
+    ps_prob, err_prob = postselection_terminal(state)
 
     return ps_prob, err_prob
 
@@ -132,65 +132,308 @@ def one_double_run(perr: float) -> tuple[float]:
 
 
     """
-    steaneBlock = [0, 1, 2, 3, 4, 5, 6]
-    repnBlock = [7, 8, 9, 10, 11, 12, 13]
-
     bs7 = [x for x in bit_strings(7) if not sum(x) % 2]
 
-    angle = np.pi / 4.0
     idling = True
 
     ps_prob = 0
     err_prob = 0
 
     # Initialize the steaneBlock to the all zeros state:
-    state = QuantumState(len(steaneBlock))
+    state = QuantumState(len(_STEANE_BLOCK))
     state.set_zero_state()
 
     # Rotate first qubit in the steaneBlock to the magic state then
     # encode the steaneBlock into the Steane codespace:
-    state = noisy_magic_state_init(state, steaneBlock[0], perr, angle)
-    state = noisy_steane_encoder(state, steaneBlock, perr, idling=idling)
+    state = _magic_block(state, perr, idling)
 
     # Perform first encoded Hadamard test:
-    state = repn_had_test(state, steaneBlock, repnBlock, perr, idling=idling)
+    state = repn_had_test(state, _STEANE_BLOCK, _REPN_BLOCK, perr, idling=idling)
+
+    # Probabilities of the measurement patterns of the first test, to
+    # determine which patterns a second Hadamard test is performed for:
+    pbs = outcome_probabilities(state, _REPN_BLOCK).reshape(-1)
 
     # Scan over measurement patterns to post-select over:
     for firstbs in bs7:
+        if pbs[int("".join(map(str, firstbs)), 2)] > 1e-10:
+            # Project out the repnBlock onto the pattern:
+            bs_state = drop_qubit(state, _REPN_BLOCK, list(firstbs))
 
-        # For each pattern project out the repnBlock and take the norm
-        # of the state to determine if a second Hadamard test will be
-        # performed:
-
-        bs_state = drop_qubit(state, repnBlock, list(firstbs))
-        pbs = bs_state.get_squared_norm()
-
-        if pbs > 1e-10:
             # Perform second Hadamard test:
             bs_state = repn_had_test(
-                bs_state, steaneBlock, repnBlock, perr, idling=idling
+                bs_state, _STEANE_BLOCK, _REPN_BLOCK, perr, idling=idling
             )
 
-            # Decode the Steane-encoded state
-            bs_state = steane_decoder(bs_state, steaneBlock)
-
-            # Logical qubit now at first position in steaneBlock
-            # rotate into Hadamard eigenbasis:
-            RY(steaneBlock[0], -angle).update_quantum_state(bs_state)
-            H(steaneBlock[0]).update_quantum_state(bs_state)
+            # Decode the Steane-encoded state and rotate the logical qubit
+            # so that |0> indicates an error:
+            bs_state = _logical_readout(bs_state)
 
-            # Flip the logical qubit so that |0> indicates error:
-            X(steaneBlock[0]).update_quantum_state(bs_state)
-
-            # Scan over measurement patterns to post-select over for the
+            # Sum over measurement patterns to post-select over for the
             # second Hadamard test:
-            for secondbs in bs7:
-                qubit_state = drop_qubit(
-                    bs_state,
-                    steaneBlock[1:] + repnBlock,
-                    [0, 0, 0, 0, 0, 0] + list(secondbs),
-                )
-                ps_prob += qubit_state.get_squared_norm()
-                err_prob += qubit_state.get_zero_probability(steaneBlock[0])
+            bs_ps, bs_err = postselection_terminal(bs_state)
+            ps_prob += bs_ps
+            err_prob += bs_err
 
     return ps_prob, err_prob
+
+
+def _magic_block(state: QuantumState, perr: float, idling: bool) -> QuantumState:
+    # Rotate first qubit into the |A> state then apply the
+    # Steane encoding map:
+
+    angle = np.pi / 4.0
+
+    state = noisy_magic_state_init(state, _STEANE_BLOCK[0], perr, angle)
+    state = noisy_steane_encoder(state, _STEANE_BLOCK, perr, idling=idling)
+
+    return state
+
+
+def _logical_readout(state: QuantumState) -> QuantumState:
+    # Apply the steane-decoder circuit, with logical qubit mapped to the
+    # first position of the steaneBlock:
+
+    angle = np.pi / 4.0
+
+    state = apply_compiled(state, steane_decoder, _STEANE_BLOCK)
+
+    # Rotate the qubit to diagonalize the Hadamard gate
+    update_state(state, RY(_STEANE_BLOCK[0], -angle))
+    update_state(state, H(_STEANE_BLOCK[0]))
+
+    # Flip the logical qubit so that |0> indicates an error:
+    update_state(state, X(_STEANE_BLOCK[0]))
+
+    return state
+
+
+def postselection_terminal(state: QuantumState) -> tuple[float]:
+    r"""
+    The terminal of the Hadamard-test protocols, see exact_expectation and
+    TrajectorySampler: the post-selection probability and the joint
+    probability of passing post-selection with a logical error, of a state
+    decoded by the logical readout, summed over the post-selected patterns.
+
+    :param state: a QuantumState
+
+    :return: a tuple (ps_prob, err_prob)
+    """
+
+    norms, zero_probs = postselection_probabilities(
+        state,
+        _STEANE_BLOCK[1:] + _REPN_BLOCK,
+        _POSTSELECTION_PATTERNS,
+        _STEANE_BLOCK[0],
+    )
+
+    return (norms.sum(), zero_probs.sum())
+
+
+def single_run_sequence(perr: float, idling=True) -> GateSequence:
+    r"""
+    Records the single post-selected Hadamard-test protocol of one_single_run
+    as a GateSequence, ending with the decoded state that is post-selected.
+
+    :param perr: the circuit-level noise strength
+    :param idling: A boolean indicating if idling noise is applied
+
+    :return: a GateSequence on the seven qubits of the steaneBlock
+    """
+
+    return multi_run_sequence(perr, 1, idling=idling)
+
+
+def double_run_sequence(perr: float, idling=True) -> GateSequence:
+    r"""
+    Records the double post-selected Hadamard-test protocol of one_double_run
+    as a GateSequence, with a branch over the outcomes of the first test,
+    ending with the decoded state of the second test that is post-selected.
+
+    :param perr: the circuit-level noise strength
+    :param idling: A boolean indicating if idling noise is applied
+
+    :return: a GateSequence on the seven qubits of the steaneBlock
+    """
+
+    return multi_run_sequence(perr, 2, idling=idling)
+
+
+def multi_run_sequence(perr: float, tests: int, idling=True) -> GateSequence:
+    r"""
+    Records the protocol of repeated post-selected Hadamard tests as a
+    GateSequence: each test but the last is followed by a branch over its
+    even-parity outcomes, and the sequence ends with the decoded state of the
+    last test that is post-selected.
+
+    When the sequence is run with exact_expectation or sample_trajectory the
+    outcomes of each branch are kept as a batch of at most 2**7 states, so
+    every test is applied once whatever the number of tests before it.
+
+    :param perr: the circuit-level noise strength
+    :param tests: the number of Hadamard tests
+    :param idling: A boolean indicating if idling noise is applied
+
+    :return: a GateSequence on the seven qubits of the steaneBlock
+    """
+
+    bs7 = [x for x in bit_strings(7) if not sum(x) % 2]
+
+    seq = GateSequence(len(_STEANE_BLOCK))
+
+    seq = _magic_block(seq, perr, idling)
+
+    for ii in range(tests):
+        if ii:
+            seq.branch(_REPN_BLOCK, bs7)
+        seq = repn_had_test(seq, _STEANE_BLOCK, _REPN_BLOCK, perr, idling=idling)
+
+    seq = _logical_readout(seq)
+
+    return seq
+
+
+def exact_single_run(perr: float, prune=0.0, max_faults=None) -> tuple[float]:
+    r"""
+    Computes the post-selection and error probabilities of the single
+    post-selected Hadamard-test protocol exactly, as the average of
+    one_single_run over the circuit-level noise, by propagating the
+    mixture of Pauli-fault branches of the protocol.
+
+    Branches with probability below prune, or more than max_faults faults,
+    are discarded, and their total probability bounds the error in both
+    returned probabilities. By default every branch with one fault and then,
+    if the discarded probability is still above err_prob, every branch with
+    two faults is propagated, which is exact to second order in perr. A
+    warning is issued when the discarded probability is above err_prob,
+    which is then only known to lie between err_prob and err_prob + pruned.
+
+    :param perr: the circuit-level noise strength
+    :param prune: the smallest branch probability that is propagated
+    :param max_faults: the largest number of faults in a branch, by default
+        the fewest up to two for which the discarded probability is at most
+        err_prob
+
+    :return: a tuple (ps_prob, err_prob, pruned)
+    """
+
+    return _exact_run(single_run_sequence(perr), prune, max_faults)
+
+
+def exact_double_run(perr: float, prune=0.0, max_faults=None) -> tuple[float]:
+    r"""
+    Computes the post-selection and error probabilities of the double
+    post-selected Hadamard-test protocol exactly, as the average of
+    one_double_run over the circuit-level noise, by propagating the
+    mixture of Pauli-fault branches of the protocol.
+
+    Branches with probability below prune, or more than max_faults faults,
+    are discarded, and their total probability bounds the error in both
+    returned probabilities. By default every branch with one fault and then,
+    if the discarded probability is still above err_prob, every branch with
+    two faults is propagated, which is exact to second order in perr. A
+    warning is issued when the discarded probability is above err_prob,
+    which is then only known to lie between err_prob and err_prob + pruned.
+
+    :param perr: the circuit-level noise strength
+    :param prune: the smallest branch probability that is propagated
+    :param max_faults: the largest number of faults in a branch, by default
+        the fewest up to two for which the discarded probability is at most
+        err_prob
+
+    :return: a tuple (ps_prob, err_prob, pruned)
+    """
+
+    return _exact_run(double_run_sequence(perr), prune, max_faults)
+
+
+def exact_multi_run(
+    perr: float, tests: int, prune=0.0, max_faults=None
+) -> tuple[float]:
+    r"""
+    Computes the post-selection and error probabilities of the protocol of
+    repeated post-selected Hadamard tests of multi_run_sequence exactly, as
+    in exact_single_run.
+
+    :param perr: the circuit-level noise strength
+    :param tests: the number of Hadamard tests
+    :param prune: the smallest branch probability that is propagated
+    :param max_faults: the largest number of faults in a branch, chosen as
+        in exact_single_run by default
+
+    :return: a tuple (ps_prob, err_prob, pruned)
+    """
+
+    return _exact_run(multi_run_sequence(perr, tests), prune, max_faults)
+
+
+def _exact_run(seq: GateSequence, prune: float, max_faults: int) -> tuple[float]:
+    # The exact post-selection and error probabilities of the sequence, with
+    # max_faults raised up to _EXACT_MAX_FAULTS while the discarded
+    # probability is above the error probability if it is not given
+
+    orders = range(1, _EXACT_MAX_FAULTS + 1) if max_faults is None else [max_faults]
+    for order in orders:
+        (ps_prob, err_prob), pruned = exact_expectation(
+            seq, postselection_terminal, prune, order
+        )
+        if pruned <= err_prob:
+            break
+
+    if pruned > err_prob:
+        warnings.warn(
+            f"the discarded probability {pruned:.3g} is above the error "
+            f"probability {err_prob:.3g}, which is only a lower bound"
+        )
+
+    return ps_prob, err_prob, pruned
+
+
+def multi_run_expansion(tests: int = 1, order: int = 2, idling=True) -> FaultExpansion:
+    r"""
+    Enumerates every fault path with at most order faults of the protocol of
+    repeated post-selected Hadamard tests of multi_run_sequence, giving the
+    exact low-order expansion of its post-selection and error probabilities
+    in the circuit-level noise strength.
+
+    :param tests: the number of Hadamard tests
+    :param order: the largest number of faults of a path
+    :param idling: A boolean indicating if idling noise is applied
+
+    :return: a FaultExpansion whose values are the pairs (ps_prob, err_prob)
+    """
+
+    # The fault rates of the expansion do not depend on the strength the
+    # protocol is recorded at
+    perr = 1e-3
+
+    seq = multi_run_sequence(perr, tests, idling=idling)
+
+    return enumerate_fault_paths(seq, postselection_terminal, perr, order)
+
+
+def multi_run_subset_samples(
+    tests: int = 1, max_faults: int = 3, shots: int = 1000, idling=True, seed=None
+) -> SubsetSamples:
+    r"""
+    Samples the protocol of repeated post-selected Hadamard tests of
+    multi_run_sequence stratified by the number of faults, giving estimates
+    of its post-selection and error probabilities at every noise strength.
+
+    :param tests: the number of Hadamard tests
+    :param max_faults: the largest number of faults sampled
+    :param shots: the number of samples for each number of faults
+    :param idling: A boolean indicating if idling noise is applied
+    :param seed: an optional seed
+
+    :return: a SubsetSamples whose values are the pairs (ps_prob, err_prob)
+    """
+
+    # The strata do not depend on the strength the protocol is recorded at
+    perr = 1e-3
+
+    seq = multi_run_sequence(perr, tests, idling=idling)
+
+    return subset_sample_sequence(
+        seq, postselection_terminal, perr, max_faults, shots, seed=seed
+    )
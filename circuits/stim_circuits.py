@@ -1,10 +1,22 @@
+import numpy as np
 from stim import Circuit
 from circuits.circuit_tools import (
     repetition_measurement_schedule,
     repetition_encoding_schedule,
+    steane_encoding_schedule,
+    steane_plus_schedule,
+    steane_zero_schedule,
 )
+from circuits.moment_circuits import append_rotation
 
 __all__ = [
+    "scheduled_repetition_measurement",
+    "scheduled_repetition_encoder",
+    "scheduled_steane_encoder",
+    "scheduled_steane_plus",
+    "scheduled_steane_zero",
+    "scheduled_encoded_cy",
+    "scheduled_encoded_chad",
     "noisy_repetition_measurement",
     "noisy_repetition_transversal_mx",
     "noisy_repetition_encoder",
@@ -98,19 +110,8 @@ def noisy_repetition_encoder(
 
     """
 
-    schedule = repetition_encoding_schedule(block)
-
-    if flag:
-        mark = int(len(block) / 2)
-
-        flag_label = int(max(block)) + 1
-
-        if len(block) % 2:
-            schedule[-1].append((block[mark - 1], flag_label))
-        else:
-            schedule.append([(block[mark - 1], flag_label)])
-
-        schedule.append([(block[-1], flag_label)])
+    flag_label = int(max(block)) + 1 if flag else None
+    schedule = repetition_encoding_schedule(block, flag_label)
 
     # set of active qubits in the circuit
     active_set = set([block[0]])
@@ -160,19 +161,13 @@ def noisy_steane_plus(
     :return:
     """
 
-    schedule = [
-        [(0, 1), (5, 3), (6, 2)],
-        [(4, 1), (0, 2), (6, 3)],
-        [(5, 1), (4, 6)],
-    ]
+    flag = max(block) + 1 if verify else None
+    schedule = steane_plus_schedule(block, flag)
 
-    if verify:
-        flag = max(block) + 1
-        block.append(flag)
-        schedule.extend([[(7, 0)], [(7, 5)], [(7, 6)]])
+    labels = list(block) + ([flag] if verify else [])
 
-    circuit.append("RX", [block[0]] + block[4:])
-    circuit.append("RZ", block[1:4])
+    circuit.append("RX", [labels[0]] + labels[4:])
+    circuit.append("RZ", labels[1:4])
 
     # set of active qubits in the circuit
     active_set = set()
@@ -181,30 +176,25 @@ def noisy_steane_plus(
         # set of qubits active in this round
         round_set = set()
         for pair in round:
-            control = block[pair[0]]
-            target = block[pair[1]]
-
             round_set = round_set.union(set(pair))
 
             # First determine if qubits need initialization noise
             for qubit in pair:
                 if qubit not in active_set:
-                    circuit.append("DEPOLARIZE1", block[qubit], perr)
+                    circuit.append("DEPOLARIZE1", qubit, perr)
                     active_set.add(qubit)
 
             # Apply noisy CNOT to pair
-            circuit.append("CNOT", [control, target])
-            circuit.append("DEPOLARIZE2", [control, target], perr)
+            circuit.append("CNOT", pair)
+            circuit.append("DEPOLARIZE2", pair, perr)
 
         # Apply noise to idle qubits in this round
         idle_set = active_set - round_set
-        idle_list = [block[q] for q in idle_set]
-        circuit.append("DEPOLARIZE1", idle_list, perr)
+        circuit.append("DEPOLARIZE1", idle_set, perr)
 
     if verify:
         circuit.append("DEPOLARIZE1", flag, perr)
         circuit.append("MX", flag)
-        block.remove(flag)
 
     return circuit
 
@@ -224,19 +214,13 @@ def noisy_steane_zero(
     :return:
     """
 
-    schedule = [
-        [(1, 0), (3, 5), (2, 6)],
-        [(4, 1), (2, 0), (3, 6)],
-        [(1, 5), (6, 4)],
-    ]
+    flag = max(block) + 1 if verify else None
+    schedule = steane_zero_schedule(block, flag)
 
-    if verify:
-        flag = max(block) + 1
-        block.append(flag)
-        schedule.extend([[(0, 7)], [(5, 7)], [(6, 7)]])
+    labels = list(block) + ([flag] if verify else [])
 
-    circuit.append("RZ", [block[0]] + block[4:])
-    circuit.append("RX", block[1:4])
+    circuit.append("RZ", [labels[0]] + labels[4:])
+    circuit.append("RX", labels[1:4])
 
     # set of active qubits in the circuit
     active_set = set()
@@ -264,7 +248,6 @@ def noisy_steane_zero(
     if verify:
         circuit.append("DEPOLARIZE1", flag, perr)
         circuit.append("MZ", flag)
-        block.remove(flag)
 
     return circuit
 
@@ -290,20 +273,9 @@ def noisy_steane_encoder(circuit: Circuit, block: list[int], perr: float) -> Cir
 
     circuit.append("DEPOLARIZE1", block[1:], perr)
 
-    schedule = [
-        [(0, 6), (3, 4)],
-        [(0, 5), (1, 4), (3, 6)],
-        [(1, 0), (2, 4), (3, 5)],
-        [(2, 0), (1, 5)],
-        [(2, 6)],
-    ]
-
-    for round in schedule:
+    for round in steane_encoding_schedule(block):
         qubits = [a for a in block]
-        for ctpair in round:
-            control = block[ctpair[0]]
-            target = block[ctpair[1]]
-
+        for control, target in round:
             circuit.append("CX", [control, target])
             circuit.append("DEPOLARIZE2", [control, target], perr)
             qubits.remove(control)
@@ -350,3 +322,221 @@ def noisy_encoded_cy(
         circuit.append("DEPOLARIZE1", [target_block[ii]], perr)
 
     return circuit
+
+
+def scheduled_repetition_measurement(circuit: Circuit, block: list[int]) -> Circuit:
+    r"""
+    Noiseless version of noisy_repetition_measurement with the rounds
+    of the schedule separated by TICKs, to be passed to a NoiseModel.
+
+    :param circuit:
+    :param block:
+
+    :return:
+    """
+
+    schedule = repetition_measurement_schedule(block)
+
+    for round in schedule:
+        for pair in round:
+            circuit.append("CNOT", pair)
+            circuit.append("MZ", pair[1])
+
+        circuit.append("TICK")
+
+    circuit.append("MX", block[0])
+
+    return circuit
+
+
+def scheduled_repetition_encoder(
+    circuit: Circuit, block: list[int], flag=False
+) -> Circuit:
+    r"""
+    Noiseless version of noisy_repetition_encoder with the rounds
+    of the schedule separated by TICKs, to be passed to a NoiseModel.
+
+    :param circuit: a stim Circuit
+    :param block: list of qubits to encode the state into
+    :param flag: A boolean indicating if an error-detecting flag
+        qubit should be used
+
+    :return: a stim Circuit
+    """
+
+    flag_label = int(max(block)) + 1 if flag else None
+    schedule = repetition_encoding_schedule(block, flag_label)
+
+    # set of active qubits in the circuit
+    active_set = set([block[0]])
+
+    for round in schedule:
+        for pair in round:
+            # First determine if qubits need initialization
+            for qubit in pair:
+                if qubit not in active_set:
+                    circuit.append("R", qubit)
+                    active_set.add(qubit)
+
+            circuit.append("CNOT", pair)
+
+        circuit.append("TICK")
+
+    if flag:
+        circuit.append("MR", flag_label)
+
+    return circuit
+
+
+def scheduled_steane_plus(circuit: Circuit, block: list[int], verify=False) -> Circuit:
+    r"""
+    Noiseless version of noisy_steane_plus with the rounds
+    of the schedule separated by TICKs, to be passed to a NoiseModel.
+
+    :param circuit:
+    :param block:
+    :param verify:
+
+    :return:
+    """
+
+    flag = max(block) + 1 if verify else None
+    schedule = steane_plus_schedule(block, flag)
+
+    labels = list(block) + ([flag] if verify else [])
+
+    circuit.append("RX", [labels[0]] + labels[4:])
+    circuit.append("RZ", labels[1:4])
+    circuit.append("TICK")
+
+    for round in schedule:
+        for pair in round:
+            circuit.append("CNOT", pair)
+
+        circuit.append("TICK")
+
+    if verify:
+        circuit.append("MX", flag)
+
+    return circuit
+
+
+def scheduled_steane_zero(circuit: Circuit, block: list[int], verify=False) -> Circuit:
+    r"""
+    Noiseless version of noisy_steane_zero with the rounds
+    of the schedule separated by TICKs, to be passed to a NoiseModel.
+
+    :param circuit:
+    :param block:
+    :param verify:
+
+    :return:
+    """
+
+    flag = max(block) + 1 if verify else None
+    schedule = steane_zero_schedule(block, flag)
+
+    labels = list(block) + ([flag] if verify else [])
+
+    circuit.append("RZ", [labels[0]] + labels[4:])
+    circuit.append("RX", labels[1:4])
+    circuit.append("TICK")
+
+    for round in schedule:
+        for pair in round:
+            circuit.append("CNOT", pair)
+
+        circuit.append("TICK")
+
+    if verify:
+        circuit.append("MZ", flag)
+
+    return circuit
+
+
+def scheduled_steane_encoder(circuit: Circuit, block: list[int]) -> Circuit:
+    r"""
+    Noiseless version of noisy_steane_encoder with the rounds
+    of the schedule separated by TICKs, to be passed to a NoiseModel.
+
+    :param circuit:
+    :param block:
+
+    :return: A stim circuit with the Steane encoding circuit appended.
+    """
+
+    assert len(block) == 7
+
+    circuit.append("RX", block[1:4])
+    circuit.append("RZ", block[4:])
+    circuit.append("TICK")
+
+    for round in steane_encoding_schedule(block):
+        for pair in round:
+            circuit.append("CX", pair)
+
+        circuit.append("TICK")
+
+    return circuit
+
+
+def scheduled_encoded_cy(
+    circuit: Circuit, target_block: list[int], control_block: list[int]
+) -> Circuit:
+    r"""
+    Noiseless version of noisy_encoded_cy with the three layers of the
+    transversal gate separated by TICKs, to be passed to a NoiseModel.
+
+    :param circuit:
+    :param target_block:
+    :param control_block:
+
+    :return:
+    """
+
+    assert len(target_block) == len(control_block)
+
+    circuit.append("S_DAG", target_block)
+    circuit.append("TICK")
+
+    for control, target in zip(control_block, target_block):
+        circuit.append("CNOT", [control, target])
+    circuit.append("TICK")
+
+    circuit.append("S", target_block)
+    circuit.append("TICK")
+
+    return circuit
+
+
+def scheduled_encoded_chad(
+    circuit: Circuit, target_block: list[int], control_block: list[int]
+) -> Circuit:
+    r"""
+    Noiseless version of the transversal controlled-Hadamard of encoded_chad,
+    with the three layers separated by TICKs, to be passed to a NoiseModel.
+    The RY rotations are not Clifford, see append_rotation, so the circuit is
+    run with qulacs through to_qulacs or sample_measurements.
+
+    :param circuit:
+    :param target_block:
+    :param control_block:
+
+    :return:
+    """
+
+    assert len(target_block) == len(control_block)
+
+    angle = np.pi / 4.0
+
+    append_rotation(circuit, "Y", target_block, angle)
+    circuit.append("TICK")
+
+    for control, target in zip(control_block, target_block):
+        circuit.append("CNOT", [control, target])
+    circuit.append("TICK")
+
+    append_rotation(circuit, "Y", target_block, -angle)
+    circuit.append("TICK")
+
+    return circuit
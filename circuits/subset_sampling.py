@@ -0,0 +1,423 @@
+import numpy as np
+import pymatching
+from itertools import product
+from stim import Circuit, CircuitInstruction, FlipSimulator, gate_data
+
+from circuits.gate_sequences import GateSequence, TrajectorySampler
+
+__all__ = [
+    "SubsetSamples",
+    "fault_count_probabilities",
+    "subset_sample_circuit",
+    "subset_sample_sequence",
+]
+
+
+class SubsetSamples:
+
+    def __init__(
+        self, rates: np.ndarray, values: list[np.ndarray], path_rates: list[np.ndarray]
+    ) -> None:
+        r"""
+        Samples of a noisy protocol stratified by the number of faults. For
+        each number of faults w, the samples draw w distinct noise locations
+        with probability proportional to the product of their rates, which is
+        the distribution of the faulty locations given w faults as the noise
+        strength goes to zero. The exact distribution at a strength p is
+        recovered by reweighting each sample by prod_l 1 / (1 - p rate_l) over
+        its locations, and the strata are combined with the exact probability
+        of w faults at p, so a single set of samples gives estimates at
+        every noise strength.
+
+        Properties of a SubsetSamples object:
+
+        :property rates: The fault probability of each noise location, relative
+            to the noise strength.
+
+        :property max_faults: The largest number of faults sampled.
+
+        :property values: A list with, for each number of faults, the array of
+            values of the samples, one row per sample.
+
+        :property path_rates: A list with, for each number of faults w, the
+            array of the rates of the w locations of each sample.
+        """
+
+        self.rates = rates
+        self.max_faults = len(values) - 1
+        self.values = values
+        self.path_rates = path_rates
+
+    def stratum_probabilities(self, perr: float) -> np.ndarray:
+        r"""
+        The probabilities of each number of faults up to max_faults at
+        noise strength perr.
+
+        :param perr: the noise strength
+
+        :return: an array of probabilities
+        """
+
+        return fault_count_probabilities(perr * self.rates, self.max_faults)
+
+    def stratum_means(self, perr: float = 0.0) -> list[np.ndarray]:
+        r"""
+        The estimated mean value of the protocol given each number of faults,
+        at noise strength perr.
+
+        :param perr: the noise strength
+
+        :return: a list of means, one for each number of faults
+        """
+
+        return [self._stratum(w, perr)[0] for w in range(self.max_faults + 1)]
+
+    def estimate(self, perr: float) -> tuple[np.ndarray, np.ndarray, float]:
+        r"""
+        Estimates the mean value of the protocol at noise strength perr.
+
+        :param perr: the noise strength
+
+        :return: a tuple (mean, stderr, tail) of the estimate over the strata,
+            its standard error, and the probability of more than max_faults
+            faults, which bounds the bias of the estimate for values in [0, 1]
+        """
+
+        probs = self.stratum_probabilities(perr)
+
+        mean = 0.0
+        var = 0.0
+        for w in range(self.max_faults + 1):
+            w_mean, w_var = self._stratum(w, perr)
+            mean = mean + probs[w] * w_mean
+            var = var + probs[w] ** 2 * w_var
+
+        return mean, np.sqrt(var), max(0.0, 1 - np.sum(probs))
+
+    def _stratum(self, w: int, perr: float) -> tuple[np.ndarray, np.ndarray]:
+        # Self-normalized importance-sampling mean of a stratum and its variance
+
+        values = self.values[w]
+        weights = 1 / np.prod(1 - perr * self.path_rates[w], axis=1)
+        weights = (weights / np.mean(weights)).reshape((-1,) + (1,) * (values.ndim - 1))
+
+        mean = np.mean(weights * values, axis=0)
+        var = np.mean((weights * (values - mean)) ** 2, axis=0) / len(values)
+
+        return mean, var
+
+
+def fault_count_probabilities(rates: np.ndarray, max_faults: int) -> np.ndarray:
+    r"""
+    The probabilities of exactly w faults, for w up to max_faults, among
+    independent locations with the given fault probabilities.
+
+    :param rates: the fault probability of each location
+    :param max_faults: the largest number of faults
+
+    :return: an array of probabilities
+    """
+
+    probs = np.zeros(max_faults + 1)
+    probs[0] = 1.0
+    for rate in rates:
+        probs[1:] = probs[1:] * (1 - rate) + probs[:-1] * rate
+        probs[0] *= 1 - rate
+
+    return probs
+
+
+def subset_sample_circuit(
+    circuit: Circuit,
+    max_faults: int = 4,
+    shots: int = 10000,
+    reference: float = 1.0,
+    decoder="pymatching",
+    batch_size: int = 1024,
+    seed: int = None,
+) -> SubsetSamples:
+    r"""
+    Samples the logical error of a noisy stim Circuit with detectors and
+    observables stratified by the number of faults, see SubsetSamples. The
+    noise channels of the circuit, and the flip probabilities of its
+    measurements, are its noise locations. A circuit built at noise strength
+    reference, e.g. by NoiseModel.uniform(reference), is the point p=reference.
+
+    Each sample runs the noiseless circuit on a stim FlipSimulator with its
+    faults inserted as Pauli errors, and is decoded with the decoder of the
+    circuit itself, so every point of the curve uses the same decoder.
+
+    :param circuit: a stim Circuit
+    :param max_faults: the largest number of faults sampled
+    :param shots: the number of samples for each number of faults
+    :param reference: the noise strength the circuit is built at
+    :param decoder: "pymatching" or None, as in SamplingTask
+    :param batch_size: the number of samples simulated together
+    :param seed: an optional seed
+
+    :return: a SubsetSamples with values 1 for a logical error and 0 otherwise
+    """
+
+    assert decoder in ["pymatching", None]
+
+    rng = np.random.default_rng(seed)
+
+    circuit = circuit.flattened()
+    instructions, locations = _circuit_locations(circuit)
+    probs = [loc[3] for loc in locations]
+    rates = np.array([np.sum(p) for p in probs]) / reference
+
+    matching = None
+    if decoder == "pymatching":
+        dem = circuit.detector_error_model(decompose_errors=True)
+        matching = pymatching.Matching.from_detector_error_model(dem)
+
+    values = []
+    path_rates = []
+    for w in range(max_faults + 1):
+        count = 1 if w == 0 else shots
+        subsets, faults = _sample_faults(probs, w, count, rng)
+
+        failures = []
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            dets, obs = _flip_batch(
+                circuit,
+                instructions,
+                locations,
+                subsets[start:stop],
+                faults[start:stop],
+                int(rng.integers(2**63)),
+            )
+            if matching is None:
+                failures.append(np.any(obs, axis=1))
+            else:
+                failures.append(np.any(matching.decode_batch(dets) != obs, axis=1))
+
+        values.append(np.concatenate(failures).astype(float))
+        path_rates.append(rates[subsets])
+
+    return SubsetSamples(rates, values, path_rates)
+
+
+def subset_sample_sequence(
+    sequence: GateSequence,
+    terminal,
+    perr: float,
+    max_faults: int = 3,
+    shots: int = 1000,
+    checkpoint_interval: int = 16,
+    seed: int = None,
+) -> SubsetSamples:
+    r"""
+    Samples the terminal of a GateSequence stratified by the number of Pauli
+    faults, see SubsetSamples. Each sample is run by a TrajectorySampler with
+    exactly its faults.
+
+    The fault probabilities of the noise locations must be proportional to the
+    strength perr the sequence was recorded at, as for the noisy builders.
+
+    :param sequence: a GateSequence
+    :param terminal: a function mapping the final state to an array of values,
+        as in sample_trajectory
+    :param perr: the strength the sequence was recorded at
+    :param max_faults: the largest number of faults sampled
+    :param shots: the number of samples for each number of faults
+    :param checkpoint_interval: the number of operations between stored states
+    :param seed: an optional seed
+
+    :return: a SubsetSamples
+    """
+
+    rng = np.random.default_rng(seed)
+
+    sampler = TrajectorySampler(sequence, terminal, checkpoint_interval)
+    locations = sequence.noise_locations
+    probs = [sequence.ops[ii][2] for ii in locations]
+    rates = np.array([np.sum(p) for p in probs]) / perr
+
+    values = [sampler.ideal_value[None]]
+    path_rates = [np.zeros((1, 0))]
+    for w in range(1, max_faults + 1):
+        subsets, faults = _sample_faults(probs, w, shots, rng)
+
+        w_values = []
+        for subset, fault in zip(subsets, faults):
+            run_faults = {
+                locations[loc]: sequence.ops[locations[loc]][3][ff]
+                for loc, ff in zip(subset, fault)
+            }
+            w_values.append(sampler.run_faults(run_faults))
+
+        values.append(np.array(w_values))
+        path_rates.append(rates[subsets])
+
+    return SubsetSamples(rates, values, path_rates)
+
+
+def _sample_faults(
+    probs: list[np.ndarray], w: int, count: int, rng: np.random.Generator
+) -> tuple[np.ndarray, np.ndarray]:
+    # Draws count sets of w distinct locations, with probability proportional to
+    # the product of their total fault probabilities, and a fault for each of
+    # them in proportion to its probability. Returns arrays (count, w) of the
+    # location indices, in increasing order, and of the fault indices.
+
+    rates = np.array([np.sum(p) for p in probs])
+    rates = rates / np.mean(rates)
+    nloc = len(rates)
+
+    # elem[l, j] is the elementary symmetric polynomial of degree j of the
+    # rates of the locations from l onwards
+    elem = np.zeros((nloc + 1, w + 1))
+    elem[nloc, 0] = 1.0
+    for loc in range(nloc - 1, -1, -1):
+        elem[loc] = elem[loc + 1]
+        elem[loc, 1:] += rates[loc] * elem[loc + 1, :-1]
+
+    subsets = np.zeros((count, w), dtype=np.int64)
+    left = np.full(count, w)
+    for loc in range(nloc):
+        pending = np.flatnonzero(left > 0)
+        if not len(pending):
+            break
+
+        k = left[pending]
+        include = rates[loc] * elem[loc + 1, k - 1] / elem[loc, k]
+        chosen = pending[rng.random(len(pending)) < include]
+
+        subsets[chosen, w - left[chosen]] = loc
+        left[chosen] -= 1
+
+    faults = np.zeros((count, w), dtype=np.int64)
+    for loc in np.unique(subsets):
+        where = subsets == loc
+        cumulative = np.cumsum(probs[loc]) / np.sum(probs[loc])
+        draws = rng.random(np.count_nonzero(where))
+        faults[where] = np.minimum(
+            np.searchsorted(cumulative, draws, side="right"), len(cumulative) - 1
+        )
+
+    return subsets, faults
+
+
+# The Pauli faults of the stim noise channels, in the order of their arguments
+_CHANNEL_PAULIS = {
+    "DEPOLARIZE1": ["X", "Y", "Z"],
+    "DEPOLARIZE2": ["".join(pp) for pp in product("IXYZ", repeat=2)][1:],
+    "PAULI_CHANNEL_1": ["X", "Y", "Z"],
+    "PAULI_CHANNEL_2": ["".join(pp) for pp in product("IXYZ", repeat=2)][1:],
+    "X_ERROR": ["X"],
+    "Y_ERROR": ["Y"],
+    "Z_ERROR": ["Z"],
+}
+
+
+def _circuit_locations(circuit: Circuit) -> tuple[list, list]:
+    # Splits a flattened circuit into its noiseless instructions and its noise
+    # locations. Each location is a tuple (instruction index, qubits, Pauli
+    # faults, probabilities, is_flip), with is_flip True for the flip of a
+    # measurement result, applied as the Pauli before the measurement and, for
+    # measurements that do not reset, again after it.
+
+    instructions = []
+    locations = []
+
+    for ii, op in enumerate(circuit):
+        data = gate_data(op.name)
+        args = op.gate_args_copy()
+        qubits = [t.value for t in op.targets_copy()]
+
+        if data.is_noisy_gate and not data.produces_measurements:
+            if op.name not in _CHANNEL_PAULIS:
+                raise ValueError("noise channel " + op.name + " is not supported")
+
+            paulis = _CHANNEL_PAULIS[op.name]
+            probs = (
+                np.array(args)
+                if len(args) > 1
+                else np.full(len(paulis), args[0] / len(paulis))
+            )
+            arity = 2 if data.is_two_qubit_gate else 1
+
+            for jj in range(0, len(qubits), arity):
+                locations.append((ii, qubits[jj : jj + arity], paulis, probs, False))
+
+            instructions.append(None)
+
+        elif data.produces_measurements and len(args) and args[0] > 0:
+            if op.name not in ["M", "MR", "MX", "MRX", "MY", "MRY"]:
+                raise ValueError("noisy measurement " + op.name + " is not supported")
+
+            flip = "Z" if op.name in ["MX", "MRX"] else "X"
+            for qubit in qubits:
+                locations.append((ii, [qubit], [flip], np.array(args[:1]), True))
+
+            instructions.append(CircuitInstruction(op.name, op.targets_copy()))
+
+        else:
+            instructions.append(op)
+
+    return instructions, locations
+
+
+def _flip_batch(
+    circuit: Circuit,
+    instructions: list,
+    locations: list,
+    subsets: np.ndarray,
+    faults: np.ndarray,
+    seed: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    # Runs the noiseless circuit on a FlipSimulator, one instance per row of
+    # subsets, inserting the chosen faults, and returns the detector and
+    # observable flips of every instance
+
+    batch = len(subsets)
+    sim = FlipSimulator(batch_size=batch, num_qubits=circuit.num_qubits, seed=seed)
+
+    # The instances and fault indices of every location that fires
+    fired = dict()
+    for loc in np.unique(subsets):
+        shots, cols = np.nonzero(subsets == loc)
+        fired.setdefault(locations[loc][0], []).append(
+            (loc, shots, faults[shots, cols])
+        )
+
+    def inject(entries, after=False):
+        masks = dict()
+        for loc, shots, fault in entries:
+            _, qubits, paulis, _, is_flip = locations[loc]
+            if after and not is_flip:
+                continue
+            for ff, shot in zip(fault, shots):
+                for qubit, pauli in zip(qubits, paulis[ff]):
+                    if pauli == "I":
+                        continue
+                    if pauli not in masks:
+                        masks[pauli] = np.zeros(
+                            (circuit.num_qubits, batch), dtype=np.bool_
+                        )
+                    masks[pauli][qubit, shot] ^= True
+
+        for pauli, mask in masks.items():
+            sim.broadcast_pauli_errors(pauli=pauli, mask=mask)
+
+    for ii, op in enumerate(instructions):
+        entries = fired.get(ii, [])
+
+        if op is None:
+            inject(entries)
+            continue
+
+        inject(entries)
+        sim.do(op)
+
+        # A measurement flip is undone after measurements that do not reset
+        if len(entries) and not gate_data(op.name).is_reset:
+            inject(entries, after=True)
+
+    dets = sim.get_detector_flips().T
+    obs = sim.get_observable_flips().T
+
+    return dets, obs
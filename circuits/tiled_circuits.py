@@ -0,0 +1,313 @@
+import time
+import numpy as np
+from stim import (
+    Circuit,
+    CircuitInstruction,
+    CircuitRepeatBlock,
+    GateTarget,
+    target_combiner,
+    target_inv,
+    target_rec,
+    target_x,
+    target_y,
+    target_z,
+)
+
+__all__ = [
+    "TiledCircuit",
+    "benchmark_tiling",
+    "choose_copies",
+]
+
+
+class TiledCircuit:
+
+    def __init__(self, circuit: Circuit, copies: int) -> None:
+        r"""
+        Independent copies of a stim Circuit on disjoint ranges of qubits,
+        sampled together as one circuit. Small circuits leave most of the
+        work of stim to its per-shot and per-instruction overheads, and each
+        instruction of the tiled circuit acts on every copy at once, so that
+        one shot of the tiled circuit costs little more than one shot of the
+        circuit but gives copies shots.
+
+        The copy k acts on the qubits of the circuit shifted by k times its
+        number of qubits. REPEAT blocks are kept with their bodies tiled, the
+        first iterations being unrolled while the tiled body differs from that
+        of the next iteration, as when its measurement records reach back
+        before the block. The detector d and the
+        observable o of copy k are the detector d * copies + k and the
+        observable o * copies + k of the tiled circuit, and the detile methods
+        map samples of the tiled circuit back to copies times as many samples
+        of the circuit.
+
+        Properties of a TiledCircuit object:
+
+        :property circuit: The stim Circuit that is tiled.
+
+        :property copies: The number of copies.
+
+        :property tiled: The tiled stim Circuit.
+
+        :property measurement_index: An array with the index in the tiled circuit of
+            each measurement of each copy, of shape (copies, number of measurements).
+        """
+
+        self.circuit = circuit
+        self.copies = copies
+
+        self.tiled = Circuit()
+        self.measurement_index = np.zeros(
+            (copies, circuit.num_measurements), dtype=np.int64
+        )
+        self._tile(self.circuit, self.tiled, 0)
+
+    def sample(self, shots: int, seed: int = None) -> np.ndarray:
+        r"""
+        Samples the measurements of the tiled circuit.
+
+        :param shots: the number of shots of the tiled circuit
+        :param seed: an optional seed
+
+        :return: a boolean array of shape (copies * shots, number of measurements)
+        """
+
+        samples = self.tiled.compile_sampler(seed=seed).sample(shots)
+
+        return self.detile_measurements(samples)
+
+    def sample_detectors(self, shots: int, seed: int = None) -> tuple[np.ndarray]:
+        r"""
+        Samples the detectors and observables of the tiled circuit.
+
+        :param shots: the number of shots of the tiled circuit
+        :param seed: an optional seed
+
+        :return: a tuple (dets, obs) of boolean arrays with copies * shots rows
+        """
+
+        sampler = self.tiled.compile_detector_sampler(seed=seed)
+        dets, obs = sampler.sample(shots=shots, separate_observables=True)
+
+        return self.detile_detectors(dets), self.detile_detectors(obs)
+
+    def detile_measurements(self, samples: np.ndarray) -> np.ndarray:
+        r"""
+        Maps measurement samples of the tiled circuit to samples of the circuit,
+        the shots of copy k following those of copy k - 1.
+
+        :param samples: an array of shape (shots, number of tiled measurements)
+
+        :return: an array of shape (copies * shots, number of measurements)
+        """
+
+        return (
+            samples[:, self.measurement_index]
+            .transpose(1, 0, 2)
+            .reshape(-1, self.circuit.num_measurements)
+        )
+
+    def detile_detectors(self, samples: np.ndarray) -> np.ndarray:
+        r"""
+        Maps detector or observable samples of the tiled circuit to samples of
+        the circuit, the shots of copy k following those of copy k - 1.
+
+        :param samples: an array of shape (shots, number of tiled detectors)
+
+        :return: an array of shape (copies * shots, number of detectors)
+        """
+
+        shots = samples.shape[0]
+
+        return (
+            samples.reshape(shots, -1, self.copies)
+            .transpose(2, 0, 1)
+            .reshape(self.copies * shots, -1)
+        )
+
+    def _tile(self, circuit: Circuit, tiled: Circuit, measured: int) -> int:
+        # Appends each instruction of the circuit to tiled once for all the
+        # copies, mapping measurement records through their absolute indices,
+        # and returns the number of measurements of the circuit so far
+
+        stride = self.circuit.num_qubits
+
+        for op in circuit:
+            if isinstance(op, CircuitRepeatBlock):
+                measured = self._tile_repeat(op, tiled, measured)
+                continue
+
+            if op.name in ["DETECTOR", "OBSERVABLE_INCLUDE"]:
+                for kk in range(self.copies):
+                    targets = [
+                        self._target(t, kk, stride, measured) for t in op.targets_copy()
+                    ]
+                    args = op.gate_args_copy()
+                    if op.name == "OBSERVABLE_INCLUDE":
+                        args = [args[0] * self.copies + kk]
+                    tiled.append(CircuitInstruction(op.name, targets, args))
+                continue
+
+            if op.name == "SHIFT_COORDS":
+                tiled.append(op)
+                continue
+
+            count = _measurement_count(op)
+
+            targets = []
+            for kk in range(self.copies):
+                targets += [
+                    self._target(t, kk, stride, measured) for t in op.targets_copy()
+                ]
+
+                self.measurement_index[kk, measured : measured + count] = np.arange(
+                    self.copies * measured + kk * count,
+                    self.copies * measured + (kk + 1) * count,
+                )
+
+            tiled.append(
+                CircuitInstruction(op.name, targets, op.gate_args_copy(), tag=op.tag)
+            )
+
+            measured += count
+
+        return measured
+
+    def _tile_repeat(
+        self, block: CircuitRepeatBlock, tiled: Circuit, measured: int
+    ) -> int:
+        # Tiles the iterations of the block one at a time until the tiled body
+        # is the same as that of the previous iteration, which is then repeated
+        # for the remaining iterations
+
+        body = block.body_copy()
+        per = body.num_measurements
+        count = block.repeat_count
+
+        previous = None
+        for done in range(count):
+            current = Circuit()
+            end = self._tile(body, current, measured)
+            if current == previous:
+                break
+
+            if previous is not None:
+                tiled += previous
+            previous = current
+            measured = end
+        else:
+            tiled += previous
+            return measured
+
+        # The iterations from done - 1 on are the same
+        tiled.append(CircuitRepeatBlock(count - done + 1, previous))
+
+        index = self.measurement_index[:, measured : measured + per]
+        for jj in range(1, count - done):
+            start = measured + jj * per
+            self.measurement_index[:, start : start + per] = (
+                index + jj * self.copies * per
+            )
+
+        return measured + (count - done) * per
+
+    def _target(
+        self, target: GateTarget, copy: int, stride: int, measured: int
+    ) -> GateTarget:
+        # The target of the copy, for an instruction after measured measurements
+
+        if target.is_measurement_record_target:
+            index = self.measurement_index[copy, measured + target.value]
+            return target_rec(int(index) - self.copies * measured)
+
+        if target.is_combiner:
+            return target_combiner()
+
+        if target.is_sweep_bit_target:
+            return target
+
+        qubit = target.value + copy * stride
+        if target.is_x_target:
+            return target_x(qubit, target.is_inverted_result_target)
+        if target.is_y_target:
+            return target_y(qubit, target.is_inverted_result_target)
+        if target.is_z_target:
+            return target_z(qubit, target.is_inverted_result_target)
+        if target.is_inverted_result_target:
+            return target_inv(qubit)
+
+        return GateTarget(qubit)
+
+
+def benchmark_tiling(
+    circuit: Circuit,
+    copies: list[int] = None,
+    shots: int = 100000,
+    repeats: int = 3,
+    detectors=True,
+) -> dict:
+    r"""
+    Measures the sampling throughput of the circuit tiled with each number of
+    copies, the single copy being the untiled circuit. Each throughput is the
+    best of repeats timings of sampling shots shots of the circuit, including
+    the compilation of the sampler and the de-tiling of the samples.
+
+    :param circuit: a stim Circuit
+    :param copies: a list of numbers of copies, by default powers of two up to 64
+    :param shots: the number of shots of the circuit to sample
+    :param repeats: the number of timings of each number of copies
+    :param detectors: A boolean indicating if detectors and observables are
+        sampled, rather than measurements
+
+    :return: a dictionary mapping numbers of copies to shots per second
+    """
+
+    copies = [2**kk for kk in range(7)] if copies is None else copies
+
+    rates = dict()
+    for kk in copies:
+        tiled = TiledCircuit(circuit, kk)
+        tiled_shots = -(-shots // kk)
+
+        best = np.inf
+        for _ in range(repeats):
+            start = time.perf_counter()
+            if detectors:
+                tiled.sample_detectors(tiled_shots)
+            else:
+                tiled.sample(tiled_shots)
+            best = min(best, time.perf_counter() - start)
+
+        rates[kk] = kk * tiled_shots / best
+
+    return rates
+
+
+def choose_copies(
+    circuit: Circuit, max_copies: int = 64, shots: int = 100000, detectors=True
+) -> int:
+    r"""
+    The number of copies, a power of two up to max_copies, for which sampling
+    the tiled circuit has the highest throughput, see benchmark_tiling.
+
+    :param circuit: a stim Circuit
+    :param max_copies: the largest number of copies
+    :param shots: the number of shots of the circuit sampled for each timing
+    :param detectors: A boolean indicating if detectors and observables are sampled
+
+    :return: the number of copies
+    """
+
+    copies = [2**kk for kk in range(int(np.log2(max_copies)) + 1)]
+    rates = benchmark_tiling(circuit, copies, shots, detectors=detectors)
+
+    return max(rates, key=rates.get)
+
+
+def _measurement_count(op: CircuitInstruction) -> int:
+    # The number of measurements of a single instruction
+
+    circuit = Circuit()
+    circuit.append(op)
+
+    return circuit.num_measurements
@@ -5,3 +5,4 @@ from .bivariate_bicycle_checks import pcm
 from .example_codes import *
 from .code_tools import *
 from .decoders import *
+from .patch_layouts import *
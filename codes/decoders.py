@@ -1,5 +1,10 @@
+import numpy as np
+from itertools import product
+
 __all__ = [
     "bit_strings",
+    "bit_string_array",
+    "iter_bit_strings",
     "steane_transversal_syndrome",
     "steane_transversal_decoder",
     "repetition_transversal_xdecoder",
@@ -7,7 +12,7 @@ __all__ = [
 ]
 
 
-def bit_strings(n: int) -> list[tuple[int]]:
+def bit_strings(n: int) -> list[list[int]]:
     r"""
     Function for generating a list of all bit strings of length n
 
@@ -18,15 +23,42 @@ def bit_strings(n: int) -> list[tuple[int]]:
     """
     if n == 0:
         return []
-    elif n == 1:
-        return [[0], [1]]
-    else:
-        nstrings = []
-        nm1strings = bit_strings(n - 1)
-        for bs in nm1strings:
-            nstrings.append(bs + [0])
-            nstrings.append(bs + [1])
-        return nstrings
+
+    return list(iter_bit_strings(n))
+
+
+def iter_bit_strings(n: int):
+    r"""
+    Generator of all bit strings of length n, as lists, in the order of
+    bit_strings, with the first bit the most significant. Unlike bit_strings
+    the strings are built one at a time, so iterating over them does not hold
+    all 2**n lists in memory.
+
+    :param n: the length of the bit strings
+
+    :return: a generator of lists of 0/1 values
+    """
+
+    if n == 0:
+        return
+
+    for bs in product([0, 1], repeat=n):
+        yield list(bs)
+
+
+def bit_string_array(n: int) -> np.ndarray:
+    r"""
+    Array of all bit strings of length n, in the order of bit_strings, with
+    row i the binary representation of i, first bit the most significant.
+
+    :param n: the length of the bit strings
+
+    :return: a uint8 array of shape (2**n, n)
+    """
+
+    shifts = np.arange(n - 1, -1, -1, dtype=np.int64)
+
+    return ((np.arange(2**n, dtype=np.int64)[:, None] >> shifts) & 1).astype(np.uint8)
 
 
 def steane_transversal_syndrome(rec: list[bool]) -> tuple[bool]:
@@ -0,0 +1,310 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+__all__ = [
+    "rsurf_patch_checks",
+    "PatchLayout",
+]
+
+# Offset of the coordinates in the keys identifying checks
+_KEY_OFFSET = 1 << 24
+
+
+def rsurf_patch_checks(L1: int, L2: int) -> dict:
+    r"""
+    The checks of a rotated surface code patch, computed with arrays, in the
+    order and labeling of rsurf_stabilizer_generators: the data qubit at
+    coordinates (2 * ii, 2 * jj) is labeled ii * L2 + jj and the checks are
+    ordered by the coordinates of their centres.
+
+    :param L1: The horizontal dimension of the patch.
+    :param L2: The vertical dimension of the patch.
+
+    :return: A dictionary mapping the boolean False (True) to a tuple
+        (centres, rows, cols, valid) for the X (Z) checks. centres is an
+        array of shape (number of checks, 2) of the coordinates of the checks,
+        and the data qubit (rows[c, k], cols[c, k]) is in the check c where
+        valid[c, k], these three arrays having shape (number of checks, 4).
+    """
+
+    ii, jj = np.meshgrid(np.arange(-1, L1), np.arange(-1, L2), indexing="ij")
+    ii, jj = ii.ravel(), jj.ravel()
+
+    odd = (ii + jj) % 2 == 1
+    masks = {
+        False: odd & (jj >= 0) & (jj <= L2 - 2),
+        True: ~odd & (ii >= 0) & (ii <= L1 - 2),
+    }
+
+    checks = dict()
+    for sector, mask in masks.items():
+        ci, cj = ii[mask], jj[mask]
+        rows = ci[:, None] + np.array([0, 0, 1, 1])
+        cols = cj[:, None] + np.array([0, 1, 0, 1])
+        valid = (rows >= 0) & (rows < L1) & (cols >= 0) & (cols < L2)
+        centres = np.stack([2 * ci + 1, 2 * cj + 1], axis=1)
+        checks[sector] = (centres, rows, cols, valid)
+
+    return checks
+
+
+class PatchLayout:
+
+    def __init__(self, sizes: list[tuple[int]], positions: list[tuple[int]]) -> None:
+        r"""
+        Rotated surface code patches placed on a common lattice, with global
+        labels and coordinates computed with arrays, patch by patch size, so
+        that layouts of the order of 10^5 qubits are built without loops over
+        qubits or checks.
+
+        The patch k of size (L1, L2) at position (r, c) has its data qubit
+        (ii, jj) at the global coordinates (2 * (r + ii), 2 * (c + jj)), and
+        is labeled data_offsets[k] + ii * L2 + jj, so each patch is labeled
+        as rsurf_stabilizer_generators labels a single patch, shifted. The
+        checks of each sector are ordered by patch and then as in a single
+        patch. The lattice sites between the patches, whose data qubits are
+        used by lattice surgery, are labeled after all the patch qubits in
+        lexicographic order of their coordinates, so their labels do not
+        depend on the merges that are made.
+
+        Properties of a PatchLayout object:
+
+        :property sizes: An array of shape (patches, 2) of the sizes (L1, L2).
+
+        :property positions: An array of shape (patches, 2) of the positions.
+
+        :property data_offsets: An array with the first label of each patch,
+            and the number of patch qubits last.
+
+        :property coords: An array of shape (qubits, 2) with the coordinates of
+            each data qubit, including those between the patches.
+
+        :property check_coords: A dictionary mapping the boolean False (True) to
+            the coordinates of the centres of the X (Z) checks.
+
+        :property check_patch: A dictionary mapping the boolean False (True) to
+            the patch of each X (Z) check.
+
+        :property check_matrices: A dictionary mapping the boolean False (True)
+            to the X (Z) parity check matrix, a scipy sparse matrix with a
+            column for each patch qubit.
+        """
+
+        self.sizes = np.array(sizes, dtype=np.int64).reshape(-1, 2)
+        self.positions = np.array(positions, dtype=np.int64).reshape(-1, 2)
+
+        if len(self.sizes) != len(self.positions):
+            raise ValueError("each patch needs a size and a position")
+
+        counts = self.sizes.prod(axis=1)
+        self.data_offsets = np.concatenate([[0], np.cumsum(counts)])
+        ndata = int(self.data_offsets[-1])
+
+        patch = np.repeat(np.arange(len(self.sizes)), counts)
+        local = np.arange(ndata) - self.data_offsets[patch]
+        width = self.sizes[patch, 1]
+        cells = self.positions[patch] + np.stack(
+            [local // width, local % width], axis=1
+        )
+        self.coords = 2 * cells
+
+        # Labels of the data qubits on the lattice of their positions, with
+        # room for the qubits between the patches
+        self._origin = cells.min(axis=0) if ndata else np.zeros(2, dtype=np.int64)
+        shape = cells.max(axis=0) - self._origin + 1 if ndata else (0, 0)
+        self._grid = -np.ones(tuple(shape), dtype=np.int64)
+
+        cells = cells - self._origin
+        occupied = np.zeros(tuple(shape), dtype=np.int64)
+        np.add.at(occupied, (cells[:, 0], cells[:, 1]), 1)
+        if (occupied > 1).any():
+            raise ValueError("the patches overlap")
+        self._grid[cells[:, 0], cells[:, 1]] = np.arange(ndata)
+
+        gaps = np.argwhere(self._grid < 0)
+        self._grid[gaps[:, 0], gaps[:, 1]] = ndata + np.arange(len(gaps))
+        self.coords = np.concatenate([self.coords, 2 * (gaps + self._origin)])
+
+        self.check_coords = dict()
+        self.check_patch = dict()
+        self.check_matrices = dict()
+
+        for sector in [False, True]:
+            centres, patches, supports, valid = [], [], [], []
+
+            for size in np.unique(self.sizes, axis=0):
+                group = np.flatnonzero((self.sizes == size).all(axis=1))
+                cen, rows, cols, val = rsurf_patch_checks(*size)[sector]
+
+                labels = self.data_offsets[group][:, None, None] + rows * size[1] + cols
+                centres.append(
+                    (cen[None, :, :] + 2 * self.positions[group][:, None, :]).reshape(
+                        -1, 2
+                    )
+                )
+                patches.append(np.repeat(group, len(cen)))
+                supports.append(labels.reshape(-1, 4))
+                valid.append(np.broadcast_to(val, labels.shape).reshape(-1, 4))
+
+            patches = np.concatenate(patches)
+            order = np.argsort(patches, kind="stable")
+
+            self.check_patch[sector] = patches[order]
+            self.check_coords[sector] = np.concatenate(centres)[order]
+            self.check_matrices[sector] = _support_matrix(
+                np.concatenate(supports)[order], np.concatenate(valid)[order], ndata
+            )
+
+    @classmethod
+    def grid(cls, rows: int, cols: int, L: int, spacing: int = 1) -> "PatchLayout":
+        r"""
+        A rows x cols array of L x L patches, with spacing columns (rows) of
+        data qubits between neighbouring patches for lattice surgery.
+
+        :param rows: the number of rows of patches
+        :param cols: the number of columns of patches
+        :param L: the size of the patches
+        :param spacing: the number of data qubits between neighbouring patches
+
+        :return: a PatchLayout
+        """
+
+        rr, cc = np.meshgrid(np.arange(rows), np.arange(cols), indexing="ij")
+        positions = (L + spacing) * np.stack([rr.ravel(), cc.ravel()], axis=1)
+
+        return cls([(L, L)] * (rows * cols), positions)
+
+    @property
+    def num_qubits(self) -> int:
+        return len(self.coords)
+
+    def logicals(self) -> tuple[list[set[int]]]:
+        r"""
+        The logical operators of the patches, one X and one Z logical each, on
+        the data qubits of the first column and of the first row of the patch
+        respectively.
+
+        :return: a tuple (xlogicals, zlogicals) of lists of sets of labels
+        """
+
+        xlogicals, zlogicals = [], []
+        for (L1, L2), offset in zip(self.sizes, self.data_offsets):
+            xlogicals.append(set((offset + L2 * np.arange(L1)).tolist()))
+            zlogicals.append(set((offset + np.arange(L2)).tolist()))
+
+        return xlogicals, zlogicals
+
+    def code(self):
+        r"""
+        The cssCode of all the patches, built from the sparse check matrices.
+
+        :return: a cssCode
+        """
+
+        # csscode imports the code tools of this package
+        from csscode.cssCode import cssCode
+
+        return cssCode.from_check_matrices(
+            self.check_matrices[False], self.check_matrices[True], *self.logicals()
+        )
+
+    def surgery_stabilizers(self, a: int, b: int) -> dict:
+        r"""
+        The changes of stabilizers of a lattice surgery merge of the patches a
+        and b, which must be side by side with the same extent along their
+        common side, possibly with data qubits in between. The merged patch is
+        the rotated surface code patch covering both of them and the qubits in
+        between. The layout is not changed. Merging the patches
+        side by side (one above the other) measures the product of their X (Z)
+        logicals, and splitting them back measures the qubits in between in
+        the Z (X) basis.
+
+        :param a: the index of a patch
+        :param b: the index of a patch
+
+        :return: A dictionary with the keys "qubits", the array of labels of the
+            qubits in between, "merged", mapping the boolean False (True) to
+            the list of the X (Z) checks measured in the merged patch and not
+            in the patches, and "split", mapping False (True) to the X (Z)
+            checks of the patches that are not measured in the merged patch
+            and are measured again after the split. Checks are sets of labels.
+        """
+
+        if self.positions[a].tolist() > self.positions[b].tolist():
+            a, b = b, a
+
+        (ra, ca), (rb, cb) = self.positions[a], self.positions[b]
+        (La1, La2), (Lb1, Lb2) = self.sizes[a], self.sizes[b]
+
+        if ra == rb and La1 == Lb1 and cb >= ca + La2:
+            box = (La1, cb + Lb2 - ca)
+        elif ca == cb and La2 == Lb2 and rb >= ra + La1:
+            box = (rb + Lb1 - ra, La2)
+        else:
+            raise ValueError("the patches are not side by side with a common extent")
+
+        if (rb - ra + cb - ca) % 2:
+            raise ValueError("the checks of the patches do not line up")
+
+        checks = rsurf_patch_checks(*box)
+
+        cells = np.argwhere(np.ones(box, dtype=bool)) + self.positions[a] - self._origin
+        labels = self._grid[cells[:, 0], cells[:, 1]]
+
+        patch = self._patch_of(labels)
+        if not np.isin(patch, [-1, a, b]).all():
+            raise ValueError("another patch lies between the patches")
+
+        changes = {"qubits": labels[patch < 0], "merged": dict(), "split": dict()}
+
+        for sector in [False, True]:
+            centres, rows, cols, valid = checks[sector]
+            centres = centres + 2 * self.positions[a]
+            support = labels.reshape(box)[
+                np.clip(rows, 0, box[0] - 1), np.clip(cols, 0, box[1] - 1)
+            ]
+
+            in_patches = np.isin(self.check_patch[sector], [a, b])
+            H = self.check_matrices[sector][in_patches]
+            old_keys = _check_keys(
+                self.check_coords[sector][in_patches], np.diff(H.indptr)
+            )
+            new_keys = _check_keys(centres, valid.sum(axis=1))
+
+            merged = ~np.isin(new_keys, old_keys)
+            split = ~np.isin(old_keys, new_keys)
+
+            changes["merged"][sector] = [
+                set(row[mask].tolist())
+                for row, mask in zip(support[merged], valid[merged])
+            ]
+            changes["split"][sector] = [
+                set(H.indices[H.indptr[ii] : H.indptr[ii + 1]].tolist())
+                for ii in np.flatnonzero(split)
+            ]
+
+        return changes
+
+    def _patch_of(self, labels: np.ndarray) -> np.ndarray:
+        # The patch of each label, -1 for the qubits between the patches
+        patch = np.searchsorted(self.data_offsets, labels, side="right") - 1
+        return np.where(labels < self.data_offsets[-1], patch, -1)
+
+
+def _support_matrix(supports: np.ndarray, valid: np.ndarray, ncols: int) -> csr_matrix:
+    # The sparse matrix with the valid entries of each row of supports
+
+    indptr = np.concatenate([[0], np.cumsum(valid.sum(axis=1))])
+    indices = supports[valid]
+
+    return csr_matrix(
+        (np.ones(len(indices), dtype=np.int8), indices, indptr),
+        shape=(len(supports), ncols),
+    )
+
+
+def _check_keys(centres: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # A check of a rotated patch is determined by its centre and weight, as
+    # its support is the neighbours of its centre within the patch
+    x, y = (centres.astype(np.int64) + _KEY_OFFSET).T
+    return (x * 2 * _KEY_OFFSET + y) * 8 + weights
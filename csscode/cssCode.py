@@ -2,7 +2,9 @@
 # The code itself is specified by subsets of the set of qubits subject to certain consistency constraints
 # We will initialize based on parity check matrices
 
+import numpy as np
 from networkx import Graph
+from scipy.sparse import csr_matrix, vstack
 from typing import Dict, Set, List, Tuple
 from codes.code_tools import (
     commutation_test,
@@ -56,6 +58,72 @@ class cssCode:
         self.xlogicals = compute_logicals(Sz, Sx)
         self.zlogicals = compute_logicals(Sx, Sz)
 
+    @classmethod
+    def from_check_matrices(
+        cls,
+        Hx: csr_matrix,
+        Hz: csr_matrix,
+        xlogicals: List[Set[int]],
+        zlogicals: List[Set[int]],
+    ) -> "cssCode":
+        r"""
+        Initialize a CSS code instance from sparse parity check matrices, with
+        columns labeled by qubits, and known logical operators, for codes too
+        large for the pairwise commutation test and the elimination computing
+        the logicals of the constructor. The commutation of the checks with
+        each other and with the logicals is checked with a single sparse
+        product, and the properties are those of the constructor.
+
+        :param Hx: the X parity check matrix, a scipy sparse matrix
+        :param Hz: the Z parity check matrix, a scipy sparse matrix
+        :param xlogicals: the supports of the X logical operators
+        :param zlogicals: the supports of the Z logical operators
+
+        :return: a cssCode
+        """
+
+        Hx = csr_matrix(Hx, dtype=np.int64, copy=True)
+        Hz = csr_matrix(Hz, dtype=np.int64, copy=True)
+
+        ncols = max(
+            [Hx.shape[1], Hz.shape[1]]
+            + [max(logical) + 1 for logical in xlogicals + zlogicals if logical]
+        )
+        Hx.resize(Hx.shape[0], ncols)
+        Hz.resize(Hz.shape[0], ncols)
+
+        # Overlaps of the checks and logicals of each type, where only those
+        # of two logicals may be odd
+        overlaps = (
+            vstack([Hx, _logical_matrix(xlogicals, ncols)])
+            @ vstack([Hz, _logical_matrix(zlogicals, ncols)]).T
+        ).tocoo()
+        checks = (overlaps.row < Hx.shape[0]) | (overlaps.col < Hz.shape[0])
+        assert not np.any(overlaps.data[checks] % 2)
+
+        code = cls.__new__(cls)
+
+        supports = {False: _row_sets(Hx), True: _row_sets(Hz)}
+        code.code = supports
+        code.check_dict = {
+            sector: dict(enumerate(supports[sector])) for sector in [False, True]
+        }
+
+        incidence = {False: _row_sets(Hx.T.tocsr()), True: _row_sets(Hz.T.tocsr())}
+        qubits = np.flatnonzero(np.diff(Hx.tocsc().indptr) + np.diff(Hz.tocsc().indptr))
+
+        code.qubits = set(qubits.tolist())
+        code.Nqubits = len(code.qubits)
+        code.qubit_dict = {
+            q: {False: incidence[False][q], True: incidence[True][q]}
+            for q in qubits.tolist()
+        }
+
+        code.xlogicals = [set(logical) for logical in xlogicals]
+        code.zlogicals = [set(logical) for logical in zlogicals]
+
+        return code
+
     # Include methods for producing Tanner graphs
     # Also methods for changing the presentation of a given linear code, i.e., updating the code properties
 
@@ -205,3 +273,22 @@ class cssCode:
             class_bits[not sector] = sector_bits
 
         return class_bits
+
+
+def _row_sets(H: csr_matrix) -> List[Set[int]]:
+    # The supports of the rows of a sparse matrix
+    indices = H.indices.tolist()
+    indptr = H.indptr.tolist()
+    return [set(indices[a:b]) for a, b in zip(indptr[:-1], indptr[1:])]
+
+
+def _logical_matrix(logicals: List[Set[int]], ncols: int) -> csr_matrix:
+    # The sparse matrix with a row for the support of each logical
+    indptr = np.cumsum([0] + [len(logical) for logical in logicals])
+    indices = np.array(
+        [q for logical in logicals for q in sorted(logical)], dtype=np.int64
+    )
+    return csr_matrix(
+        (np.ones(len(indices), dtype=np.int64), indices, indptr),
+        shape=(len(logicals), ncols),
+    )
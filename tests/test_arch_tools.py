@@ -0,0 +1,76 @@
+import numpy as np
+import stim
+
+from archs import ArchitectureGraph, compile_to_architecture, route_circuit
+from circuits import NoiseModel, memory_experiment
+from codes import rsurf_code
+from codes.rotated_surface_code_coordinates import rsurf_c2i, rsurf_q2i
+from csscode.cssCode import cssCode
+
+
+def _native_surface_code(d):
+    # A memory experiment of the rotated surface code with the coordinates of
+    # its data qubits and ancillas, which lie on the rotated grid
+    code = cssCode(*rsurf_code(d, d))
+    circuit = memory_experiment(code, 2, "Z")
+
+    offset = max(code.qubits) + 1
+    nz = len(code.check_dict[True])
+    coords = {q: xy for xy, q in rsurf_q2i(d, d).items()}
+    c2i = rsurf_c2i(d, d)
+    coords.update({offset + label: xy for xy, label in c2i[True].items()})
+    coords.update({offset + nz + label: xy for xy, label in c2i[False].items()})
+
+    annotated = stim.Circuit()
+    for q, (x, y) in sorted(coords.items()):
+        annotated.append("QUBIT_COORDS", [q], [x, y])
+
+    return annotated + circuit
+
+
+def test_native_layout_routes_without_swaps():
+    circuit = _native_surface_code(9)
+    graph = ArchitectureGraph.rotated(11, 11)
+
+    routed, placement, report = compile_to_architecture(
+        circuit, graph, restarts=2, steps=1000, workers=1, seed=0
+    )
+
+    assert report["placement_cost"] == 0
+    assert report["swaps"] == 0 and report["bridges"] == 0
+    assert report["routed_two_qubit_gates"] == report["two_qubit_gates"]
+
+
+def test_routed_coordinates_are_physical():
+    circuit = _native_surface_code(3)
+    graph = ArchitectureGraph.rotated(5, 5)
+
+    routed, placement, _ = compile_to_architecture(
+        circuit, graph, restarts=1, steps=100, workers=1, seed=0
+    )
+
+    coords = routed.get_final_qubit_coordinates()
+    for q in np.flatnonzero(placement >= 0):
+        assert coords[int(placement[q])] == list(graph.coords[placement[q]])
+
+
+def test_non_native_placement_routes_locally():
+    circuit = _native_surface_code(3)
+    graph = ArchitectureGraph.rotated(5, 5)
+
+    rng = np.random.default_rng(0)
+    placement = rng.permutation(graph.num_qubits)[: circuit.num_qubits]
+    routed, report = route_circuit(circuit, graph, placement)
+
+    assert report["swaps"] + report["bridges"] > 0
+    for op in routed.flattened():
+        if stim.gate_data(op.name).is_two_qubit_gate:
+            targets = [t.value for t in op.targets_copy()]
+            for a, b in zip(targets[::2], targets[1::2]):
+                assert graph.distances[a, b] == 1
+
+    dets = routed.compile_detector_sampler(seed=0).sample(16)
+    assert not dets.any()
+
+    noisy = NoiseModel.uniform(0.001).noisy_circuit(routed)
+    assert noisy.detector_error_model(decompose_errors=True).num_detectors
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from circuits import CodeCapacitySampler, SamplingTask, run_tasks
+from circuits.code_capacity import _parity, _sample_positions, _set_bits, _unpack_bits
+from csscode.cssCode import cssCode
+from codes import rsurf_code
+
+
+def _pack(dense):
+    # The bit-packed rows of a boolean array of shape (rows, shots), one bit
+    # at a time
+    packed = np.zeros((dense.shape[0], -(-dense.shape[1] // 64)), dtype=np.uint64)
+    for row, shot in zip(*np.nonzero(dense)):
+        packed[row, shot // 64] |= np.uint64(1) << np.uint64(shot % 64)
+    return packed
+
+
+@pytest.mark.parametrize("p_data, p_meas, rounds", [(0.05, 0.0, 1), (0.03, 0.03, 5)])
+def test_sampler_agrees_with_memory_experiment(p_data, p_meas, rounds):
+    code = cssCode(*rsurf_code(3, 3))
+    shots = 50000
+
+    stats = CodeCapacitySampler(code, p_data, p_meas=p_meas, rounds=rounds).run(
+        shots, seed=0
+    )
+    (reference,) = run_tasks(
+        [
+            SamplingTask(
+                code=code, rounds=rounds, p_data=p_data, p_meas=p_meas, max_shots=shots
+            )
+        ],
+        workers=1,
+        seed=0,
+    )
+
+    assert stats.shots == reference.shots == shots
+    low, high = stats.interval(3.0)
+    ref_low, ref_high = reference.interval(3.0)
+    assert low <= ref_high and ref_low <= high
+
+
+def test_sample_positions():
+    rows, shots, p = 7, 1000, 0.02
+    sampled_rows, sampled_shots = _sample_positions(
+        np.random.default_rng(0), rows, shots, p
+    )
+    positions = sampled_rows * shots + sampled_shots
+
+    assert np.all(np.diff(positions) > 0)
+    assert np.all((0 <= sampled_shots) & (sampled_shots < shots))
+    assert np.all((0 <= sampled_rows) & (sampled_rows < rows))
+    assert abs(len(positions) - p * rows * shots) < 5 * np.sqrt(p * rows * shots)
+
+    empty = _sample_positions(np.random.default_rng(0), rows, shots, 0.0)
+    assert [len(a) for a in empty] == [0, 0]
+
+
+def test_set_bits_and_unpack_bits():
+    rng = np.random.default_rng(1)
+    dense = rng.random((5, 150)) < 0.3
+
+    bits = np.zeros((5, 3), dtype=np.uint64)
+    _set_bits(bits, *np.nonzero(dense))
+
+    assert np.array_equal(bits, _pack(dense))
+    assert np.array_equal(_unpack_bits(bits, 150), dense.T)
+
+
+def test_parity():
+    rng = np.random.default_rng(2)
+    H = rng.random((6, 9)) < 0.4
+    H[3] = False
+    dense = rng.random((9, 130)) < 0.5
+
+    parity = _parity(csr_matrix(H.astype(np.uint8)), _pack(dense))
+
+    assert np.array_equal(parity, _pack((H.astype(int) @ dense.astype(int)) % 2 == 1))
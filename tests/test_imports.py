@@ -0,0 +1,37 @@
+import subprocess
+import sys
+
+import pytest
+
+# Each package imported first in a fresh interpreter, as import cycles only
+# show up for some import orders
+MODULES = [
+    "csscode",
+    "csscode.cssCode",
+    "codes",
+    "circuits",
+    "archs",
+]
+
+
+@pytest.mark.parametrize("module", MODULES)
+def test_import_first(module):
+    result = subprocess.run(
+        [sys.executable, "-c", "import " + module],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+
+
+def test_import_names():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from circuits import NoiseModel\nfrom csscode.cssCode import cssCode",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
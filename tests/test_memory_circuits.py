@@ -0,0 +1,32 @@
+import pytest
+
+from circuits import NoiseModel, memory_experiment
+from csscode.cssCode import cssCode
+from codes import rsurf_code
+
+
+@pytest.mark.parametrize("d", [3, 5])
+@pytest.mark.parametrize("basis", ["Z", "X"])
+def test_default_schedule_keeps_distance(d, basis):
+    code = cssCode(*rsurf_code(d, d))
+    circuit = NoiseModel.uniform(0.001).noisy_circuit(memory_experiment(code, d, basis))
+
+    assert len(circuit.shortest_graphlike_error()) == d
+
+
+def test_detectors_are_deterministic():
+    code = cssCode(*rsurf_code(3, 3))
+    for basis in ["Z", "X"]:
+        circuit = memory_experiment(code, 3, basis)
+        dets = circuit.compile_detector_sampler().sample(16)
+        assert not dets.any()
+
+
+@pytest.mark.parametrize("d", [3, 5])
+@pytest.mark.parametrize("basis", ["Z", "X"])
+def test_flags_restore_distance_of_greedy_schedule(d, basis):
+    code = cssCode(*rsurf_code(d, d))
+    circuit = memory_experiment(code, d, basis, schedule="greedy", flags=True)
+    circuit = NoiseModel.uniform(0.001).noisy_circuit(circuit)
+
+    assert len(circuit.shortest_graphlike_error()) == d
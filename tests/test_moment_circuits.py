@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import stim
+from qulacs import QuantumState
+
+from circuits import NoiseModel, sample_measurements, scheduled_steane_plus, to_qulacs
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "H 0\nM(0.2) 0\nM 0",
+        "H 0\nM(0.2) 0\nH 0\nM 0",
+        "RX 0\nMX(0.3) 0\nMX 0",
+        "H 0\nMR(0.25) 0\nM 0",
+        "X 0\nMRX(0.1) 0\nMX 0",
+    ],
+)
+def test_measurement_flips_match_stim(text):
+    circuit = stim.Circuit(text)
+    shots = 4000
+
+    samples = sample_measurements(circuit, shots, backend="qulacs")
+    reference = sample_measurements(circuit, 10 * shots, backend="stim", seed=0)
+
+    # The rate of each outcome and the rate at which the two outcomes differ
+    rates = np.append(samples.mean(0), np.mean(samples[:, 0] != samples[:, 1]))
+    expected = np.append(reference.mean(0), np.mean(reference[:, 0] != reference[:, 1]))
+
+    assert np.allclose(rates, expected, atol=5 * 0.5 / np.sqrt(shots))
+
+
+def test_postselected_measurement_flip():
+    state = QuantumState(1)
+    state.set_zero_state()
+    to_qulacs(stim.Circuit("M(0.2) 0"), state, postselect=True)
+
+    assert np.isclose(state.get_squared_norm(), 0.8)
+
+
+def test_scheduled_steane_plus_matches_across_backends():
+    block = list(range(7))
+    circuit = scheduled_steane_plus(stim.Circuit(), block, verify=True)
+    circuit.append("MX", block)
+    noisy = NoiseModel.uniform(0.02).noisy_circuit(circuit)
+    shots = 2000
+
+    samples = sample_measurements(noisy, shots, backend="qulacs")
+    reference = sample_measurements(noisy, 10 * shots, backend="stim", seed=0)
+
+    # The rate of the flag, of each data outcome and of the flips of the three
+    # X checks X0 X1 X4 X5, X0 X2 X4 X6 and X3 X4 X5 X6
+    def rates(outcomes):
+        checks = [[1, 2, 5, 6], [1, 3, 5, 7], [4, 5, 6, 7]]
+        parities = [np.logical_xor.reduce(outcomes[:, c], axis=1) for c in checks]
+        return np.append(outcomes.mean(0), np.mean(parities, axis=1))
+
+    assert np.allclose(rates(samples), rates(reference), atol=5 * 0.5 / np.sqrt(shots))
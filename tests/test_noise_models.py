@@ -0,0 +1,54 @@
+import stim
+
+from archs import ArchitectureGraph
+from circuits import NoiseModel
+
+
+def test_annotations_are_not_noisy():
+    circuit = stim.Circuit(
+        "QUBIT_COORDS(0, 0) 0\nQUBIT_COORDS(1, 0) 1\nR 0 1\nTICK\nH 0\nTICK\nM 0 1"
+    )
+    noisy = NoiseModel(p1=0.1).noisy_circuit(circuit)
+
+    assert noisy == stim.Circuit(
+        "QUBIT_COORDS(0, 0) 0\nQUBIT_COORDS(1, 0) 1\nR 0 1\nTICK\nH 0\n"
+        "DEPOLARIZE1(0.1) 0\nTICK\nM 0 1"
+    )
+
+
+def test_qubit_rates_by_location():
+    circuit = stim.Circuit("R 0 1\nTICK\nH 0\nTICK\nM 0 1")
+    model = NoiseModel(
+        p1=0.01,
+        p_idle=0.02,
+        p_reset=0.03,
+        p_meas=0.04,
+        qubit_rates={0: {"gate": 0.1}, 1: {"idle": 0.2, "measurement": 0.0}},
+    )
+
+    assert model.noisy_circuit(circuit) == stim.Circuit(
+        "R 0 1\nDEPOLARIZE1(0.03) 0 1\nTICK\nH 0\nDEPOLARIZE1(0.1) 0\n"
+        "DEPOLARIZE1(0.2) 1\nTICK\nDEPOLARIZE1(0.04) 0\nM 0 1"
+    )
+
+    # A single strength overrides every location on the qubit
+    uniform = NoiseModel(p1=0.01, p_reset=0.03, qubit_rates={0: 0.5})
+    assert uniform.noisy_circuit(stim.Circuit("R 0\nH 0")) == stim.Circuit(
+        "R 0\nDEPOLARIZE1(0.5) 0\nH 0\nDEPOLARIZE1(0.5) 0"
+    )
+
+
+def test_from_architecture_groups_couplers_by_rate():
+    architecture = ArchitectureGraph.planar(2, 2)
+    architecture.set_rates({0: 0.3}, [(0, 1, 0.01), (2, 3, 0.01), (0, 2, 0.02)])
+    circuit = stim.Circuit("R 0 1 2 3\nTICK\nCX 0 1 2 3 1 3\nTICK\nCX 0 2\nTICK\nM 0 1")
+
+    model = NoiseModel.from_architecture(architecture, p2=0.05, p_meas=0.001)
+
+    # The pairs of one instruction share a DEPOLARIZE2 for each coupler rate,
+    # and the qubit rate of 0 replaces p_meas on its measurement
+    assert model.noisy_circuit(circuit) == stim.Circuit(
+        "R 0 1 2 3\nTICK\nCX 0 1 2 3 1 3\nDEPOLARIZE2(0.01) 0 1 2 3\n"
+        "DEPOLARIZE2(0.05) 1 3\nTICK\nCX 0 2\nDEPOLARIZE2(0.02) 0 2\nTICK\n"
+        "DEPOLARIZE1(0.3) 0\nDEPOLARIZE1(0.001) 1\nM 0 1"
+    )
@@ -0,0 +1,14 @@
+import numpy as np
+import stim
+
+from circuits import NoiseModel, NoiseSweep
+
+
+def test_numpy_integer_shots():
+    circuit = stim.Circuit("R 0 1\nTICK\nCX 0 1\nTICK\nM 0 1")
+    sweep = NoiseSweep(circuit, NoiseModel.uniform(1.0))
+
+    samples = sweep.sample([0.01, 0.02], np.int64(10), seed=0)
+
+    assert [s.shape for s in samples] == [(10, 2), (10, 2)]
+    assert [s.shape[0] for s in sweep.sample([0.01], np.array([7]), seed=0)] == [7]
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from csscode.cssCode import cssCode
+from codes import PatchLayout, rsurf_code
+
+
+def test_single_patch_matches_rsurf_code():
+    layout = PatchLayout.grid(1, 1, 5)
+    code = layout.code()
+    reference = cssCode(*rsurf_code(5, 5))
+
+    for sector in [False, True]:
+        assert code.code[sector] == reference.code[sector]
+
+
+def test_from_check_matrices_rejects_anticommuting_logicals():
+    layout = PatchLayout.grid(1, 1, 3)
+    xlogicals, zlogicals = layout.logicals()
+
+    # A single X on a corner qubit anticommutes with a Z-check
+    with pytest.raises(AssertionError):
+        cssCode.from_check_matrices(
+            layout.check_matrices[False],
+            layout.check_matrices[True],
+            [{0}],
+            zlogicals,
+        )
+
+
+def _matrix(checks, n):
+    matrix = np.zeros((len(checks), n), dtype=np.uint8)
+    for row, check in enumerate(checks):
+        matrix[row, list(check)] = 1
+    return matrix
+
+
+def _rank(matrix):
+    # The rank over GF(2), by Gaussian elimination
+    matrix = matrix.copy() % 2
+    rank = 0
+    for col in range(matrix.shape[1]):
+        pivots = rank + np.flatnonzero(matrix[rank:, col])
+        if not len(pivots):
+            continue
+        matrix[[rank, pivots[0]]] = matrix[[pivots[0], rank]]
+        rows = np.flatnonzero(matrix[:, col])
+        matrix[rows[rows != rank]] ^= matrix[rank]
+        rank += 1
+        if rank == len(matrix):
+            break
+    return rank
+
+
+def _in_span(vector, matrix):
+    return _rank(np.vstack([matrix, vector])) == _rank(matrix)
+
+
+@pytest.mark.parametrize("rows, cols, sector", [(1, 2, False), (2, 1, True)])
+def test_surgery_stabilizers(rows, cols, sector):
+    layout = PatchLayout.grid(rows, cols, 3)
+    coords = layout.coords.copy()
+    n = layout.num_qubits
+
+    changes = layout.surgery_stabilizers(0, 1)
+
+    # The layout is unchanged and the qubits in between were labeled already
+    assert np.array_equal(layout.coords, coords)
+    assert np.all(changes["qubits"] >= layout.data_offsets[-1])
+    assert np.all(changes["qubits"] < n)
+
+    # The checks of the merged patch commute
+    checks = dict()
+    for s in [False, True]:
+        kept = [
+            set(np.flatnonzero(row).tolist())
+            for row in layout.check_matrices[s].toarray()
+        ]
+        kept = [check for check in kept if check not in changes["split"][s]]
+        checks[s] = _matrix(kept + changes["merged"][s], n)
+    assert not np.any((checks[False].astype(int) @ checks[True].T.astype(int)) % 2)
+
+    # The merged checks, with the checks of the patches, measure the product of
+    # the logicals of the patches, which the checks of the patches do not
+    logicals = layout.logicals()[1 if sector else 0]
+    product = _matrix([logicals[0] ^ logicals[1]], n)
+    patch_checks = _matrix(
+        [
+            set(np.flatnonzero(row).tolist())
+            for row in layout.check_matrices[sector].toarray()
+        ],
+        n,
+    )
+
+    assert _in_span(
+        product, np.vstack([patch_checks, _matrix(changes["merged"][sector], n)])
+    )
+    assert not _in_span(product, patch_checks)
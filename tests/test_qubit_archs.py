@@ -0,0 +1,72 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from archs import ArchitectureGraph
+
+
+def _calibrated():
+    architecture = ArchitectureGraph.planar(3, 3)
+    architecture.set_rates({0: 0.001, 4: 0.0025}, [(0, 1, 0.01), (4, 5, 0.02)])
+    return architecture
+
+
+@pytest.mark.parametrize("extension", ["csv", "json"])
+def test_rates_round_trip(tmp_path, extension):
+    filename = str(tmp_path / ("snapshot." + extension))
+    architecture = _calibrated()
+    architecture.save_rates(filename)
+
+    loaded = ArchitectureGraph.planar(3, 3).load_rates(filename)
+
+    np.testing.assert_array_equal(loaded.qubit_rates, architecture.qubit_rates)
+    np.testing.assert_array_equal(loaded.coupler_rates, architecture.coupler_rates)
+
+
+def test_csv_without_required_columns(tmp_path):
+    filename = tmp_path / "snapshot.csv"
+    filename.write_text("qubit_a,rate\n0,0.001\n")
+
+    with pytest.raises(ValueError, match="qubit_a, qubit_b, rate"):
+        ArchitectureGraph.planar(3, 3).load_rates(str(filename))
+
+
+def _networkx_distances(graph):
+    n = graph.number_of_nodes()
+    distances = np.full((n, n), -1)
+    for a, lengths in nx.all_pairs_shortest_path_length(graph):
+        for b, length in lengths.items():
+            distances[a, b] = length
+    return distances
+
+
+@pytest.mark.parametrize(
+    "architecture",
+    [
+        ArchitectureGraph.planar(4, 5),
+        ArchitectureGraph.rotated(3, 4),
+        ArchitectureGraph.from_networkx(
+            nx.connected_watts_strogatz_graph(30, 4, 0.3, seed=0)
+        ),
+    ],
+)
+def test_distances_match_networkx(architecture):
+    graph = architecture.to_networkx()
+    expected = _networkx_distances(graph)
+
+    # The closed form on the lattices and breadth-first search on the same
+    # graph without its lattice
+    np.testing.assert_array_equal(architecture.distances, expected)
+    np.testing.assert_array_equal(
+        ArchitectureGraph.from_networkx(graph).distances, expected
+    )
+
+    a, b = np.triu_indices(architecture.num_qubits, 1)
+    np.testing.assert_array_equal(architecture.distance(a, b), expected[a, b])
+
+
+def test_disconnected_rotated_row():
+    architecture = ArchitectureGraph.rotated(1, 4)
+
+    with pytest.raises(ValueError, match="not connected"):
+        architecture.distances
@@ -0,0 +1,55 @@
+from circuits import ResultsStore, SamplingTask, run_tasks
+from csscode.cssCode import cssCode
+from codes import rsurf_code
+
+
+def _task(max_shots=400):
+    return SamplingTask(
+        code=cssCode(*rsurf_code(3, 3)),
+        rounds=1,
+        p_data=0.05,
+        max_shots=max_shots,
+    )
+
+
+def test_resume_skips_stored_chunks(tmp_path):
+    store = ResultsStore(str(tmp_path / "a"))
+    task = _task()
+    run_tasks([task], chunk_shots=100, workers=1, seed=7, store=store)
+
+    # An interrupted run that finished the chunks 0 and 2 but not 1 and 3
+    records = store.records()
+    gappy = ResultsStore(str(tmp_path / "b"))
+    for rec in records:
+        if rec["chunk"] in [0, 2]:
+            gappy.append(
+                rec["key"],
+                rec["shots"],
+                rec["errors"],
+                chunk=rec["chunk"],
+                entropy=rec["entropy"],
+            )
+
+    stats = run_tasks([task], chunk_shots=100, workers=1, seed=7, store=gappy)[0]
+
+    chunks = [rec["chunk"] for rec in gappy.records()]
+    assert sorted(chunks) == [0, 1, 2, 3]
+    assert stats.shots == 400
+    assert stats.errors == sum(rec["errors"] for rec in records)
+
+
+def test_merge_skips_chunks_with_the_same_seed(tmp_path):
+    stores = [ResultsStore(str(tmp_path / name)) for name in ["a", "b"]]
+    for store in stores:
+        run_tasks([_task()], chunk_shots=100, workers=1, seed=7, store=store)
+
+    assert stores[0].merge(stores[1]) == 0
+    assert list(stores[0].totals().values())[0][0] == 400
+
+
+def test_identical_tasks_draw_distinct_chunks():
+    # Two copies of a task share the chunks of one task with twice the shots
+    pair = run_tasks([_task(2000), _task(2000)], chunk_shots=100, workers=1, seed=3)
+    single = run_tasks([_task(4000)], chunk_shots=100, workers=1, seed=3)[0]
+
+    assert pair[0].errors + pair[1].errors == single.errors
@@ -0,0 +1,61 @@
+import numpy as np
+import stim
+from qulacs.gate import CNOT, RY, DepolarizingNoise, H
+
+from circuits import exact_expectation
+from circuits.gate_sequences import GateSequence
+from circuits.qulacs_circuits import update_state
+from circuits.stabilizer_sequences import NearCliffordSampler
+
+PERR = 0.05
+
+
+def _sequence(perr):
+    # Two magic rotations around a CNOT, with noise on both qubits
+    seq = GateSequence(2)
+    update_state(seq, RY(0, np.pi / 4))
+    update_state(seq, H(1))
+    update_state(seq, CNOT(0, 1))
+    if perr:
+        update_state(seq, DepolarizingNoise(0, perr))
+        update_state(seq, DepolarizingNoise(1, perr))
+    update_state(seq, RY(1, -np.pi / 3))
+    return seq
+
+
+def _qulacs_terminal(state):
+    return np.array([state.get_zero_probability(0), state.get_zero_probability(1)])
+
+
+def _stim_terminal(sim, qubits):
+    return np.array(
+        [
+            (1 + sim.peek_observable_expectation(stim.PauliString(f"Z{qubits[q]}"))) / 2
+            for q in range(2)
+        ]
+    )
+
+
+def test_term_sum_matches_exact_expectation():
+    seq = _sequence(0.0)
+    exact, pruned = exact_expectation(seq, _qulacs_terminal, prune=0.0)
+
+    sampler = NearCliffordSampler(seq, _stim_terminal)
+
+    assert pruned == 0.0
+    assert len(sampler.rotations) == 2
+    assert sampler.negativity > 1.0
+    np.testing.assert_allclose(sampler.term_sum(), exact, atol=1e-12)
+
+
+def test_sampled_mean_matches_exact_expectation():
+    seq = _sequence(PERR)
+    exact, pruned = exact_expectation(seq, _qulacs_terminal, prune=0.0)
+    assert pruned == 0.0
+
+    values = NearCliffordSampler(seq, _stim_terminal).run(
+        4000, np.random.default_rng(0)
+    )
+    stderr = values.std(axis=0) / np.sqrt(len(values))
+
+    assert np.all(np.abs(values.mean(axis=0) - exact) < 5 * stderr)
@@ -0,0 +1,45 @@
+import pytest
+import stim
+
+from circuits import (
+    noisy_repetition_encoder,
+    noisy_steane_encoder,
+    noisy_steane_plus,
+    noisy_steane_zero,
+    scheduled_repetition_encoder,
+    scheduled_steane_encoder,
+    scheduled_steane_plus,
+    scheduled_steane_zero,
+)
+
+BLOCK = [3, 4, 5, 6, 7, 8, 9]
+
+
+def _gates(circuit):
+    # The gates of the circuit without its noise and TICKs, merged so that the
+    # layout of the instructions does not matter
+    gates = stim.Circuit()
+    for inst in circuit.without_noise():
+        if inst.name != "TICK":
+            gates.append(inst)
+    return gates
+
+
+@pytest.mark.parametrize(
+    "noisy, scheduled, kwargs",
+    [
+        (noisy_steane_encoder, scheduled_steane_encoder, {}),
+        (noisy_steane_plus, scheduled_steane_plus, {}),
+        (noisy_steane_plus, scheduled_steane_plus, {"verify": True}),
+        (noisy_steane_zero, scheduled_steane_zero, {}),
+        (noisy_steane_zero, scheduled_steane_zero, {"verify": True}),
+        (noisy_repetition_encoder, scheduled_repetition_encoder, {"flag": True}),
+    ],
+)
+def test_noisy_builders_follow_scheduled_builders(noisy, scheduled, kwargs):
+    block = list(BLOCK)
+    noisy_circuit = noisy(stim.Circuit(), block, 0.01, **kwargs)
+    scheduled_circuit = scheduled(stim.Circuit(), block, **kwargs)
+
+    assert block == BLOCK
+    assert _gates(noisy_circuit) == _gates(scheduled_circuit)
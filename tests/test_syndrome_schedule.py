@@ -0,0 +1,53 @@
+import warnings
+
+import pytest
+
+from circuits import FlagSchedule, syndrome_schedule, validate_syndrome_schedule
+from csscode.cssCode import cssCode
+from codes import rsurf_code, toric_code
+
+
+def _ancillas(code):
+    offset = max(code.qubits) + 1
+    nz = len(code.check_dict[True])
+    return {
+        True: [offset + ii for ii in range(nz)],
+        False: [offset + nz + ii for ii in range(len(code.check_dict[False]))],
+    }
+
+
+@pytest.mark.parametrize("d", [3, 5, 7])
+def test_surface_code_schedule_has_max_degree_depth(d):
+    code = cssCode(*rsurf_code(d, d))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        schedule = syndrome_schedule(code)
+
+    assert len(schedule) == 4
+    validate_syndrome_schedule(code, schedule, _ancillas(code))
+
+
+@pytest.mark.parametrize("L", [3, 4, 5, 6])
+def test_toric_code_schedule_has_max_degree_depth(L):
+    code = cssCode(*toric_code(L, L))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        schedule = syndrome_schedule(code)
+
+    assert len(schedule) == 4
+    validate_syndrome_schedule(code, schedule, _ancillas(code))
+
+
+@pytest.mark.parametrize("hook_weight", [1, 2])
+def test_flag_schedule_windows(hook_weight):
+    code = cssCode(*rsurf_code(3, 3))
+    ancillas = _ancillas(code)
+    schedule = syndrome_schedule(code)
+    flags = FlagSchedule(code, schedule, ancillas, 100, hook_weight=hook_weight)
+
+    assert len(flags.windows)
+    for start, stop in flags.windows.values():
+        assert 0 <= start < stop < len(flags.rounds)
+    for round in flags.rounds:
+        qubits = [q for pair in round for q in pair]
+        assert len(qubits) == len(set(qubits))
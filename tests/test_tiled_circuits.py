@@ -0,0 +1,40 @@
+import pytest
+import stim
+
+from circuits import NoiseModel, TiledCircuit, memory_experiment
+from codes import rsurf_code
+from csscode.cssCode import cssCode
+
+_LOOKBACK = stim.Circuit("""
+    R 0 1
+    M 0
+    MR 1
+    REPEAT 5 {
+        X_ERROR(0.1) 0
+        M 0
+        DETECTOR rec[-1] rec[-3]
+        REPEAT 2 {
+            MR 1
+            DETECTOR rec[-1] rec[-2]
+        }
+    }
+    OBSERVABLE_INCLUDE(0) rec[-3]
+    """)
+
+
+@pytest.mark.parametrize("copies", [1, 3])
+@pytest.mark.parametrize("name", ["memory", "lookback"])
+def test_repeat_blocks_match_flattened_tiling(copies, name):
+    if name == "memory":
+        code = cssCode(*rsurf_code(3, 3))
+        circuit = memory_experiment(code, 6, "Z")
+        circuit = NoiseModel.uniform(0.001).noisy_circuit(circuit)
+    else:
+        circuit = _LOOKBACK
+
+    tiled = TiledCircuit(circuit, copies)
+    flat = TiledCircuit(circuit.flattened(), copies)
+
+    assert "REPEAT" in str(tiled.tiled)
+    assert tiled.tiled.flattened() == flat.tiled
+    assert (tiled.measurement_index == flat.measurement_index).all()